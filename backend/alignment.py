@@ -0,0 +1,99 @@
+import numpy as np
+
+# Order-aware alignment of two protocols over their step similarity matrix.
+# Needleman-Wunsch (global) or Smith-Waterman (local) with a linear gap
+# penalty. Cell (i, j) only depends on cells of the two previous
+# anti-diagonals, so each anti-diagonal is updated with one set of vectorized
+# NumPy ops. With a band only cells close to the diagonal are computed and
+# stored, so cost and memory grow with (n_a + n_b) * band instead of n_a * n_b.
+
+STOP, MATCH, SKIP_A, SKIP_B = 0, 1, 2, 3
+
+
+def _diagonal_bounds(n_a, n_b, band):
+    """First and last row index i of each anti-diagonal d = i + j inside the band."""
+    d = np.arange(n_a + n_b + 1)
+    lo = np.maximum(0, d - n_b)
+    hi = np.minimum(n_a, d)
+    if band is not None:
+        # Keep cells within `band` steps (measured along the longer protocol) of
+        # the line from (0, 0) to (n_a, n_b): |i * n_b - j * n_a| <= band * max(n_a, n_b)
+        width = int(band) * max(n_a, n_b)
+        total = n_a + n_b
+        lo = np.maximum(lo, -((width - d * n_a) // total))
+        hi = np.minimum(hi, (d * n_a + width) // total)
+    return lo, hi
+
+
+def align(sim_matrix, gap=0.0, band=None, local=False):
+    """
+    Aligns the steps of protocol a (rows) with those of protocol b (columns).
+
+    sim_matrix: (n_a, n_b) step similarities.
+    gap: penalty for each step left unmatched (insertion or deletion).
+    band: if given, only matches within this many steps of the diagonal are
+        considered (must be >= 1); None computes the full matrix.
+    local: Smith-Waterman instead of Needleman-Wunsch; only the best scoring
+        stretch of the two protocols is aligned.
+
+    Returns (score, pairs). pairs lists the alignment in step order as
+    (i, j) for matched steps, (i, None) for a step only in a and (None, j) for
+    a step only in b.
+    """
+    sim_matrix = np.asarray(sim_matrix, dtype=np.float64)
+    n_a, n_b = sim_matrix.shape
+    if band is not None and band < 1:
+        raise ValueError("band must be at least 1")
+    if n_a == 0 or n_b == 0:
+        if local:
+            return 0.0, []
+        return -gap * (n_a + n_b), [(i, None) for i in range(n_a)] + [(None, j) for j in range(n_b)]
+
+    lo, hi = _diagonal_bounds(n_a, n_b, band)
+    pointers = [np.zeros(1, dtype=np.int8)]
+    previous, current = None, np.zeros(1)  # scores on anti-diagonals d - 2 and d - 1
+    best_score, best_cell = 0.0, (0, 0)
+    for d in range(1, n_a + n_b + 1):
+        i = np.arange(lo[d], hi[d] + 1)
+        j = d - i
+        candidates = np.full((3, len(i)), -np.inf)
+        if d >= 2:
+            ok = (i >= 1) & (j >= 1) & (i - 1 >= lo[d - 2]) & (i - 1 <= hi[d - 2])
+            candidates[0, ok] = previous[i[ok] - 1 - lo[d - 2]] + sim_matrix[i[ok] - 1, j[ok] - 1]
+        ok = (i - 1 >= lo[d - 1]) & (i - 1 <= hi[d - 1])
+        candidates[1, ok] = current[i[ok] - 1 - lo[d - 1]] - gap
+        ok = (j >= 1) & (i >= lo[d - 1]) & (i <= hi[d - 1])
+        candidates[2, ok] = current[i[ok] - lo[d - 1]] - gap
+
+        choice = np.argmax(candidates, axis=0)
+        scores = candidates[choice, np.arange(len(i))]
+        moves = (choice + MATCH).astype(np.int8)
+        if local:
+            restart = scores <= 0
+            scores[restart] = 0.0
+            moves[restart] = STOP
+            top = int(np.argmax(scores))
+            if scores[top] > best_score:
+                best_score, best_cell = float(scores[top]), (int(i[top]), int(j[top]))
+        pointers.append(moves)
+        previous, current = current, scores
+
+    if local:
+        score, (i, j) = best_score, best_cell
+    else:
+        score, (i, j) = float(current[n_a - lo[-1]]), (n_a, n_b)
+    pairs = []
+    while i > 0 or j > 0:
+        move = pointers[i + j][i - lo[i + j]]
+        if move == STOP:
+            break
+        if move == MATCH:
+            i, j = i - 1, j - 1
+            pairs.append((i, j))
+        elif move == SKIP_A:
+            i -= 1
+            pairs.append((i, None))
+        else:
+            j -= 1
+            pairs.append((None, j))
+    return score, pairs[::-1]
@@ -0,0 +1,379 @@
+import argparse
+import json
+import os
+import shutil
+import time
+import numpy as np
+from backend import tracing
+from backend.compare import normalize_rows, rerank, search
+
+# Approximate nearest-neighbour search over step embeddings.
+# Stage 1: every query step probes an inverted-file (IVF) index of all corpus
+# steps and the hits are grouped by the protocol they belong to.
+# Stage 2: only those candidate protocols are re-scored exactly with compare().
+
+# Default location of a store's index, kept up to date by backend.ingest
+ANN_DIR = "ann"
+META_FILE = "ann.json"
+CENTROIDS_FILE = "centroids.npy"
+VECTORS_FILE = "vectors.npy"
+LIST_OFFSETS_FILE = "list_offsets.npy"
+PROTOCOL_IDS_FILE = "protocol_ids.npy"
+FAISS_FILE = "faiss.index"
+FORMAT_VERSION = 2
+
+
+def train_centroids(vectors, n_lists, n_iter=20, sample_size=None, seed=0):
+    """Spherical k-means on (a sample of) the normalized step vectors."""
+    rng = np.random.default_rng(seed)
+    vectors = normalize_rows(vectors)
+    sample_size = sample_size or 256 * n_lists
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    n_lists = min(n_lists, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_lists)
+        empty = counts == 0
+        # Re-seed empty lists with random points so every list stays useful
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def default_n_lists(n_rows):
+    return int(max(1, min(4096, 4 * np.sqrt(n_rows))))
+
+
+def _covered(current, protocol_ids, n_protocols):
+    """Number of store protocols an index covers after inserting rows of protocol_ids."""
+    if n_protocols is not None:
+        return int(n_protocols)
+    highest = int(protocol_ids.max()) + 1 if len(protocol_ids) else 0
+    return max(current or 0, highest)
+
+
+def _write_meta(path, index):
+    meta = {"version": FORMAT_VERSION, "backend": index.backend, "nprobe": index.nprobe, "size": len(index),
+            "n_protocols": index.n_protocols}
+    with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def _read_meta(path):
+    with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported ANN index version at {path}: {meta.get('version')} (rebuild it)")
+    return meta
+
+
+class StepIndex:
+    """
+    NumPy inverted-file index. Each step vector is assigned to its nearest
+    centroid; a query only scans the vectors of its nprobe nearest lists.
+    Vectors are appended incrementally and the list layout is rebuilt lazily.
+    n_protocols is the length of the store the index was built over.
+    """
+
+    backend = "numpy"
+
+    def __init__(self, centroids, vectors=None, lists=None, protocol_ids=None, nprobe=8, n_protocols=None):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.dim = self.centroids.shape[1]
+        self.nprobe = nprobe
+        self.n_protocols = n_protocols
+        self._vectors = [np.asarray(vectors, dtype=np.float32)] if vectors is not None else []
+        self._lists = [np.asarray(lists, dtype=np.int32)] if lists is not None else []
+        self._protocol_ids = [np.asarray(protocol_ids, dtype=np.int64)] if protocol_ids is not None else []
+        self._layout = None
+
+    @classmethod
+    def build(cls, vectors, protocol_ids, n_lists=None, nprobe=8, seed=0):
+        n_lists = n_lists or default_n_lists(len(vectors))
+        index = cls(train_centroids(vectors, n_lists, seed=seed), nprobe=nprobe)
+        index.add(vectors, protocol_ids)
+        return index
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._protocol_ids)
+
+    def add(self, vectors, protocol_ids, n_protocols=None):
+        """
+        Inserts step vectors; protocol_ids gives the owning protocol of each
+        row. n_protocols is the store's length after the insert (default: the
+        highest protocol id + 1).
+        """
+        vectors = normalize_rows(vectors)
+        protocol_ids = np.broadcast_to(np.asarray(protocol_ids, dtype=np.int64), (len(vectors),))
+        self.n_protocols = _covered(self.n_protocols, protocol_ids, n_protocols)
+        self._vectors.append(vectors)
+        self._lists.append(np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32))
+        self._protocol_ids.append(protocol_ids.copy())
+        self._layout = None
+
+    def _consolidate(self):
+        if self._layout is None:
+            vectors = np.concatenate(self._vectors) if self._vectors else np.empty((0, self.dim), np.float32)
+            lists = np.concatenate(self._lists) if self._lists else np.empty(0, np.int32)
+            protocol_ids = np.concatenate(self._protocol_ids) if self._protocol_ids else np.empty(0, np.int64)
+            # Sort rows by list so each inverted list is one contiguous slice; only the sorted copy is kept
+            order = np.argsort(lists, kind="stable")
+            vectors, lists, protocol_ids = vectors[order], lists[order], protocol_ids[order]
+            self._vectors, self._lists, self._protocol_ids = [vectors], [lists], [protocol_ids]
+            list_offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(lists, minlength=len(self.centroids)), out=list_offsets[1:])
+            self._layout = (vectors, protocol_ids, list_offsets)
+        return self._layout
+
+    def search_steps(self, queries, k=32, nprobe=None):
+        """Returns (similarities, protocol ids) of the k best corpus steps per query step."""
+        queries = normalize_rows(queries)
+        vectors, protocol_ids, list_offsets = self._consolidate()
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for q, lists in enumerate(probes):
+            rows = np.concatenate([np.arange(list_offsets[l], list_offsets[l + 1]) for l in lists])
+            if len(rows) == 0:
+                continue
+            row_sims = vectors[rows] @ queries[q]
+            best = np.argsort(-row_sims)[:k]
+            sims[q, :len(best)] = row_sims[best]
+            ids[q, :len(best)] = protocol_ids[rows[best]]
+        return sims, ids
+
+    def save(self, path):
+        """Writes the list-sorted layout, so load() can memory-map it as is."""
+        vectors, protocol_ids, list_offsets = self._consolidate()
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, CENTROIDS_FILE), self.centroids)
+        np.save(os.path.join(path, VECTORS_FILE), vectors)
+        np.save(os.path.join(path, PROTOCOL_IDS_FILE), protocol_ids)
+        np.save(os.path.join(path, LIST_OFFSETS_FILE), list_offsets)
+        _write_meta(path, self)
+
+    @classmethod
+    def load(cls, path, nprobe=None):
+        meta = _read_meta(path)
+        list_offsets = np.load(os.path.join(path, LIST_OFFSETS_FILE))
+        lists = np.repeat(np.arange(len(list_offsets) - 1, dtype=np.int32), np.diff(list_offsets))
+        index = cls(np.load(os.path.join(path, CENTROIDS_FILE)), None, lists,
+                    np.load(os.path.join(path, PROTOCOL_IDS_FILE)), nprobe or meta["nprobe"], meta["n_protocols"])
+        # The rows are already sorted by list: search straight from the memory map, no copy in RAM
+        vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        index._vectors = [vectors]
+        index._layout = (vectors, index._protocol_ids[0], list_offsets)
+        return index
+
+
+class FaissStepIndex:
+    """Same interface as StepIndex, backed by faiss-cpu's IndexIVFFlat (optional dependency)."""
+
+    backend = "faiss"
+
+    def __init__(self, index, protocol_ids, nprobe=8, n_protocols=None):
+        self.index = index
+        self.index.nprobe = nprobe
+        self.nprobe = nprobe
+        self.n_protocols = n_protocols
+        self.protocol_ids = np.asarray(protocol_ids, dtype=np.int64)
+
+    @classmethod
+    def build(cls, vectors, protocol_ids, n_lists=None, nprobe=8, seed=0):
+        import faiss
+        vectors = normalize_rows(vectors)
+        n_lists = min(n_lists or default_n_lists(len(vectors)), len(vectors))
+        quantizer = faiss.IndexFlatIP(vectors.shape[1])
+        index = faiss.IndexIVFFlat(quantizer, vectors.shape[1], n_lists, faiss.METRIC_INNER_PRODUCT)
+        index.cp.seed = seed
+        index.train(vectors)
+        faiss_index = cls(index, np.empty(0, np.int64), nprobe)
+        faiss_index.add(vectors, protocol_ids)
+        return faiss_index
+
+    def __len__(self):
+        return len(self.protocol_ids)
+
+    def add(self, vectors, protocol_ids, n_protocols=None):
+        vectors = normalize_rows(vectors)
+        protocol_ids = np.broadcast_to(np.asarray(protocol_ids, dtype=np.int64), (len(vectors),))
+        self.n_protocols = _covered(self.n_protocols, protocol_ids, n_protocols)
+        self.index.add(vectors)
+        self.protocol_ids = np.concatenate([self.protocol_ids, protocol_ids])
+
+    def search_steps(self, queries, k=32, nprobe=None):
+        self.index.nprobe = nprobe or self.nprobe
+        sims, rows = self.index.search(normalize_rows(queries), k)
+        ids = np.where(rows >= 0, self.protocol_ids[np.maximum(rows, 0)], -1)
+        return sims, ids
+
+    def save(self, path):
+        import faiss
+        os.makedirs(path, exist_ok=True)
+        faiss.write_index(self.index, os.path.join(path, FAISS_FILE))
+        np.save(os.path.join(path, PROTOCOL_IDS_FILE), self.protocol_ids)
+        _write_meta(path, self)
+
+    @classmethod
+    def load(cls, path, nprobe=None):
+        import faiss
+        meta = _read_meta(path)
+        return cls(faiss.read_index(os.path.join(path, FAISS_FILE)),
+                   np.load(os.path.join(path, PROTOCOL_IDS_FILE)), nprobe or meta["nprobe"], meta["n_protocols"])
+
+
+BACKENDS = {"numpy": StepIndex, "faiss": FaissStepIndex}
+
+
+def build_index(store, backend="numpy", n_lists=None, nprobe=8):
+    """Builds a step index over every vector of an EmbeddingStore."""
+    protocol_ids = np.repeat(np.arange(len(store)), np.diff(store.offsets))
+    index = BACKENDS[backend].build(np.asarray(store.matrix, dtype=np.float32), protocol_ids, n_lists, nprobe)
+    index.n_protocols = len(store)
+    return index
+
+
+def update_index(index, store):
+    """
+    Inserts the protocols appended to the store since the index was built
+    (or last updated); the centroids are not retrained. Returns their number.
+    """
+    start = index.n_protocols
+    if start is None or start > len(store):
+        raise ValueError(f"The ANN index covers {start} protocols, the store at {store.path} has {len(store)} "
+                         f"(rebuild it with python -m backend.ann build)")
+    if start == len(store):
+        return 0
+    offsets = store.offsets
+    protocol_ids = np.repeat(np.arange(start, len(store)), np.diff(offsets[start:]))
+    index.add(np.asarray(store.matrix[offsets[start]:], dtype=np.float32), protocol_ids, len(store))
+    return len(store) - start
+
+
+def load_index(path, nprobe=None):
+    return BACKENDS[_read_meta(path)["backend"]].load(path, nprobe)
+
+
+def save_index(index, path):
+    """
+    Saves an index next to path and then swaps it in, so a process that has
+    the old index memory-mapped keeps reading intact files.
+    """
+    path = path.rstrip(os.sep)
+    shutil.rmtree(path + ".tmp", ignore_errors=True)
+    index.save(path + ".tmp")
+    if os.path.exists(path):
+        shutil.rmtree(path + ".old", ignore_errors=True)
+        os.rename(path, path + ".old")
+        os.rename(path + ".tmp", path)
+        shutil.rmtree(path + ".old")
+    else:
+        os.rename(path + ".tmp", path)
+
+
+def check_index(index, n_protocols):
+    """Raises ValueError if the index was not built over a store of n_protocols entries (e.g. ingest ran since)."""
+    if index.n_protocols != n_protocols:
+        raise ValueError(f"Stale ANN index: built over {index.n_protocols} protocols, the store has {n_protocols} "
+                         f"(rebuild it with python -m backend.ann build)")
+
+
+def candidate_protocols(index, query, steps_per_query=32, nprobe=None):
+    """Stage 1: protocol ids hit by any query step, most hits first."""
+    _, ids = index.search_steps(query, steps_per_query, nprobe)
+    ids = ids[ids >= 0]
+    protocols, hits = np.unique(ids, return_counts=True)
+    return protocols[np.argsort(-hits, kind="stable")]
+
+
+@tracing.traced("ann_search", attributes=("mode",))
+def ann_search(index, query, get_vectors, top_k=10, steps_per_query=32, nprobe=None, max_candidates=None,
+               mode="greedy", gap=0.0, band=None, n_protocols=None):
+    """
+    Two-stage search: gathers candidate protocols from the step index, then
+    re-scores them exactly with compare() in the given scoring mode (gap and
+    band apply to the "ordered"/"local" alignment modes).
+    get_vectors(i) returns the step vectors of protocol i (e.g. EmbeddingStore.vectors).
+    If n_protocols (the store's length) is given, a stale index raises ValueError.
+    Returns a list of (protocol index, score) pairs, best first.
+    """
+    if n_protocols is not None:
+        check_index(index, n_protocols)
+    candidates = candidate_protocols(index, query, steps_per_query, nprobe)
+    if max_candidates is not None:
+        candidates = candidates[:max_candidates]
+    return rerank(query, candidates, get_vectors, top_k, mode, gap, band)
+
+
+def recall_report(index, store, k=10, n_queries=100, nprobes=(1, 4, 16), steps_per_query=32, seed=0):
+    """
+    Recall@k of ann_search against the brute-force scorer, using protocols
+    sampled from the store as queries. Returns one row per nprobe setting.
+    """
+    check_index(index, len(store))
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(len(store), min(n_queries, len(store)), replace=False)
+
+    exact, exact_time = [], 0.0
+    for i in query_ids:
+        start = time.perf_counter()
+        exact.append({j for j, _ in search(store.vectors(i), store.matrix, store.offsets, top_k=k)})
+        exact_time += time.perf_counter() - start
+
+    report = []
+    for nprobe in nprobes:
+        recalls, elapsed = [], 0.0
+        for i, truth in zip(query_ids, exact):
+            start = time.perf_counter()
+            found = ann_search(index, store.vectors(i), store.vectors, k, steps_per_query, nprobe)
+            elapsed += time.perf_counter() - start
+            recalls.append(len(truth & {j for j, _ in found}) / len(truth))
+        report.append({
+            "nprobe": nprobe,
+            "recall_at_k": float(np.mean(recalls)),
+            "ann_ms": 1000 * elapsed / len(query_ids),
+            "exact_ms": 1000 * exact_time / len(query_ids),
+        })
+    return report
+
+
+def main(argv=None):
+    from backend.store import EmbeddingStore
+
+    parser = argparse.ArgumentParser(description="Build or evaluate an approximate step index for an embedding store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build an index over a store")
+    build_parser.add_argument("store")
+    build_parser.add_argument("-o", "--output", required=True)
+    build_parser.add_argument("--backend", default="numpy", choices=sorted(BACKENDS))
+    build_parser.add_argument("--lists", type=int, default=None, help="Number of inverted lists")
+    build_parser.add_argument("--nprobe", type=int, default=8)
+    recall_parser = subparsers.add_parser("recall", help="Report recall@k against brute-force search")
+    recall_parser.add_argument("store")
+    recall_parser.add_argument("index")
+    recall_parser.add_argument("-k", type=int, default=10)
+    recall_parser.add_argument("--queries", type=int, default=100)
+    recall_parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16])
+    recall_parser.add_argument("--steps-per-query", type=int, default=32)
+    args = parser.parse_args(argv)
+
+    store = EmbeddingStore.open(args.store)
+    if args.command == "build":
+        start = time.perf_counter()
+        index = build_index(store, args.backend, args.lists, args.nprobe)
+        save_index(index, args.output)
+        print(f"Indexed {len(index)} steps of {len(store)} protocols in {time.perf_counter() - start:.1f}s")
+    else:
+        index = load_index(args.index)
+        print(f"{'nprobe':>8} {'recall@' + str(args.k):>10} {'ann ms':>10} {'exact ms':>10}")
+        for row in recall_report(index, store, args.k, args.queries, args.nprobe, args.steps_per_query):
+            print(f"{row['nprobe']:>8} {row['recall_at_k']:>10.3f} {row['ann_ms']:>10.2f} {row['exact_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+def cache_dir():
+    """Directory for persistent caches (override with PROTOCOMPARE_CACHE_DIR)."""
+    path = os.environ.get("PROTOCOMPARE_CACHE_DIR",
+                          os.path.join(os.path.expanduser("~"), ".cache", "protocompare"))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def content_hash(obj) -> str:
+    """Stable sha256 of a JSON-serialisable object (or raw bytes/str)."""
+    if isinstance(obj, bytes):
+        data = obj
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8")
+    else:
+        data = json.dumps(obj, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class DiskCache:
+    """
+    Content-addressed key/value cache stored in a single SQLite file.
+
+    Entries written under a different version stamp (e.g. a hash of the
+    prompt that produced them) are dropped when the cache is opened, and the
+    least recently used entries are evicted once max_entries or max_bytes is
+    exceeded. Safe to share between threads and processes; the limits apply
+    to the whole file, however many DiskCache objects write to it.
+    """
+
+    def __init__(self, path, version="", max_entries=10000, max_bytes=None):
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, version TEXT, value BLOB, size INTEGER, accessed REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn.execute("DELETE FROM entries WHERE version != ?", (version,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def set(self, key, value: bytes):
+        self.set_many([(key, value)])
+
+    def get_many(self, keys):
+        """Looks up many keys in few queries; returns a dict of the keys that were found."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = list(keys[start:start + 500])
+                placeholders = ",".join("?" * len(chunk))
+                found.update(self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})", chunk).fetchall())
+                if found:
+                    now = time.time()
+                    self._conn.executemany("UPDATE entries SET accessed = ? WHERE key = ?",
+                                           [(now, key) for key in chunk if key in found])
+        return found
+
+    def set_many(self, items):
+        """Stores many (key, bytes) pairs in one transaction."""
+        with self._lock:
+            now = time.time()
+            # IMMEDIATE takes the write lock up front, so no other writer changes the table before _evict
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, version, value, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                    [(key, self.version, sqlite3.Binary(value), len(value), now) for key, value in items])
+                self._evict()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_json(self, key):
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def set_json(self, key, obj):
+        self.set(key, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+    def _evict(self):
+        # Counted inside the write transaction: other processes (and other
+        # DiskCache objects on the same file) may have written since
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        while (self.max_entries and count > self.max_entries) or \
+                (self.max_bytes and total > self.max_bytes and count > 1):
+            if self.max_entries and count > self.max_entries:
+                n_drop = count - self.max_entries
+            else:
+                # Over the byte budget: drop the least recently used 10% and re-check
+                n_drop = max(1, count // 10)
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed ASC LIMIT ?", (n_drop,)).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in rows])
+            count -= len(rows)
+            total -= sum(size for _, size in rows)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def close(self):
+        self._conn.close()
+
+
+class LRUCache:
+    """Thread-safe in-memory dict of at most max_entries items; the least recently used go first."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+def normalize_step_text(text) -> str:
+    """Collapses whitespace and case so trivially different step strings share one entry."""
+    return " ".join(text.split()).lower()
+
+
+class EmbeddingCache:
+    """
+    Step-vector cache keyed by a hash of (model name, normalized step text).
+    A small in-process LRU dict sits in front of a bounded DiskCache, and
+    hit/miss counters show how often the encoder was skipped.
+    """
+
+    def __init__(self, path, model_name, max_entries=500000, hot_entries=20000):
+        self.model_name = model_name
+        self.disk = DiskCache(path, version="float32-v1", max_entries=max_entries)
+        self.hot_entries = hot_entries
+        self._hot = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hot_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def key(self, text) -> str:
+        return content_hash(self.model_name + "\x00" + normalize_step_text(text))
+
+    def _remember(self, key, vector):
+        self._hot[key] = vector
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_entries:
+            self._hot.popitem(last=False)
+
+    def get_many(self, texts):
+        """Returns a list with a float32 vector for every cached text and None for the rest."""
+        keys = [self.key(text) for text in texts]
+        results = [None] * len(texts)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._hot.get(key)
+                if vector is not None:
+                    self._hot.move_to_end(key)
+                    results[i] = vector
+                    self.stats["hot_hits"] += 1
+                else:
+                    missing.append(i)
+        if missing:
+            found = self.disk.get_many([keys[i] for i in missing])
+            with self._lock:
+                for i in missing:
+                    value = found.get(keys[i])
+                    if value is None:
+                        self.stats["misses"] += 1
+                        continue
+                    results[i] = np.frombuffer(value, dtype=np.float32)
+                    self._remember(keys[i], results[i])
+                    self.stats["disk_hits"] += 1
+        return results
+
+    def put_many(self, texts, vectors):
+        items = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                vector = np.array(vector, dtype=np.float32)
+                self._remember(key, vector)
+                items.append((key, vector.tobytes()))
+        self.disk.set_many(items)
+
+    def hit_rate(self) -> float:
+        total = sum(self.stats.values())
+        return (self.stats["hot_hits"] + self.stats["disk_hits"]) / total if total else 0.0
@@ -0,0 +1,58 @@
+import numpy as np
+import requests
+
+# Thin client for the HTTP API in backend.service. One Session keeps
+# connections to the service alive across calls.
+
+DEFAULT_TIMEOUT = 60.0
+
+
+class ProtocompareClient:
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def _get(self, path):
+        response = self.session.get(self.base_url + path, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _post(self, path, body):
+        response = self.session.post(self.base_url + path, json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def health(self):
+        return self._get("/health")
+
+    def metrics(self):
+        return self._get("/metrics")
+
+    def extract(self, text):
+        """Protocol (list of step dicts) extracted from a document's text."""
+        return self._post("/extract", {"text": text})["protocol"]
+
+    def embed(self, protocols):
+        """One float32 (n_steps, dim) array per protocol."""
+        embeddings = self._post("/embed", {"protocols": list(protocols)})["embeddings"]
+        return [np.asarray(vectors, dtype=np.float32) for vectors in embeddings]
+
+    def compare(self, protocol_a, protocol_b, mode="greedy", gap=0.0, band=None, return_alignment=False):
+        """Returns (score, alignment) as compare() does for the two protocols' embeddings."""
+        result = self._post("/compare", {"protocol_a": protocol_a, "protocol_b": protocol_b, "mode": mode,
+                                         "gap": gap, "band": band, "return_alignment": return_alignment})
+        return result["score"], result["alignment"]
+
+    def search(self, protocol, top_k=10, mode="greedy", gap=0.0, band=None, use_index=True,
+               include_protocols=False, where=None, hybrid=False, fusion="rrf"):
+        """
+        List of {"index", "doi", "score"} dicts (plus "protocol" if requested),
+        best first. where restricts the search to protocols with a step meeting
+        every condition, e.g. {"step_type": "heating", "temperature": ">=150 °C"}.
+        hybrid=True takes candidates from the store's BM25 index and fuses
+        them with dense scores ("rrf" or "weighted" fusion) before re-scoring.
+        """
+        return self._post("/search", {"protocol": protocol, "top_k": top_k, "mode": mode, "gap": gap, "band": band,
+                                      "use_index": use_index, "include_protocols": include_protocols,
+                                      "where": where, "hybrid": hybrid, "fusion": fusion})["results"]
@@ -1,22 +1,130 @@
-import json
 import numpy as np
-from scipy.spatial.distance import cdist
-from scipy.optimize import linear_sum_assignment
+from backend import tracing
+from backend.alignment import align
 
-def compare(emb_a, emb_b):
+SCORING_MODES = ("greedy", "assignment", "ordered", "local")
 
+@tracing.traced("compare", attributes=("mode",))
+def compare(emb_a, emb_b, mode="greedy", return_alignment=False, return_matrix=False, gap=0.0, band=None):
+    """
+    Similarity of protocol a to protocol b from their step embeddings.
+
+    mode="greedy": every step of b keeps its best match among the steps of a;
+        the maxima are summed and divided by the number of steps of a. No
+        assignment is solved for the score.
+    mode="assignment": one-to-one Hungarian matching; matched similarities are
+        summed and divided by the longer protocol, so unmatched steps count as 0.
+    mode="ordered": global sequence alignment (Needleman-Wunsch, see
+        backend.alignment) where matches keep the step order and every
+        unmatched step costs `gap`; divided by the longer protocol.
+    mode="local": Smith-Waterman, scores the best matching stretch of steps;
+        divided by the shorter protocol.
+    gap and band (max distance from the diagonal, None for no band) only
+    apply to "ordered" and "local".
+
+    Returns (score, alignment, sim_matrix). The alignment (list of
+    (step of a, step of b) pairs; Hungarian for "greedy"/"assignment", and
+    including (i, None)/(None, j) gaps for "ordered"/"local") and the
+    (n_a, n_b) cosine similarity matrix are only computed when requested and
+    are None otherwise.
+    """
+    if mode not in SCORING_MODES:
+        raise ValueError(f"Unknown scoring mode {mode!r}; choose one of {', '.join(SCORING_MODES)}")
+    emb_a = np.asarray(emb_a, dtype=np.float64)
+    emb_b = np.asarray(emb_b, dtype=np.float64)
     emb_a = emb_a / np.linalg.norm(emb_a, axis=1, keepdims=True)
     emb_b = emb_b / np.linalg.norm(emb_b, axis=1, keepdims=True)
     # Compute similarity matrix (cosine -> similarity)
-    sim_matrix = 1 - cdist(emb_a, emb_b, metric="cosine")  # shape (n_a, n_b)
-
-    # Hungarian algorithm to find maximal alignment
-    cost_matrix = -sim_matrix  # maximize similarity -> minimize negative similarity
-    row_ind, col_ind = linear_sum_assignment(cost_matrix)
-
-    # Aggregate score: mean similarity of assigned pairs, penalize unmatched steps
-    matched_sims = sim_matrix[row_ind, col_ind]
-    # Simple penalty: unmatched steps count as similarity 0
-    unmatched = abs(emb_a.shape[0] - emb_b.shape[0])
-    overall = sum(np.max(sim_matrix, axis=0)/emb_a.shape[0])
-    return float(overall), list(zip(row_ind.tolist(), col_ind.tolist())), sim_matrix
+    sim_matrix = emb_a @ emb_b.T  # shape (n_a, n_b)
+
+    alignment = None
+    if mode in ("ordered", "local"):
+        total, pairs = align(sim_matrix, gap, band, local=mode == "local")
+        length = min if mode == "local" else max
+        overall = total / length(emb_a.shape[0], emb_b.shape[0])
+        if return_alignment:
+            alignment = pairs
+    else:
+        if mode == "assignment" or return_alignment:
+            # scipy is only needed here; importing it lazily keeps search-only imports light
+            from scipy.optimize import linear_sum_assignment
+            # Hungarian algorithm to find maximal alignment
+            row_ind, col_ind = linear_sum_assignment(-sim_matrix)
+            if return_alignment:
+                alignment = list(zip(row_ind.tolist(), col_ind.tolist()))
+        if mode == "assignment":
+            # Unmatched steps count as similarity 0
+            overall = sim_matrix[row_ind, col_ind].sum() / max(emb_a.shape[0], emb_b.shape[0])
+        else:
+            overall = np.sum(np.max(sim_matrix, axis=0)) / emb_a.shape[0]
+    return float(overall), alignment, (sim_matrix if return_matrix else None)
+
+
+def normalize_rows(matrix):
+    """L2-normalizes every row, leaving all-zero rows untouched."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def segment_sums(values, offsets):
+    """Sums values[offsets[i]:offsets[i+1]] for every segment i (empty segments give 0)."""
+    cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    offsets = np.asarray(offsets)
+    return cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+
+def top_k_indices(scores, top_k=None):
+    """Indices of the top_k highest scores, best first."""
+    if top_k is None or top_k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+@tracing.traced("search")
+def search(query, matrix, offsets, top_k=10, chunk_rows=65536, candidates=None):
+    """
+    Scores one query protocol against a whole corpus in one pass.
+
+    matrix stacks the L2-normalized step vectors of every corpus protocol
+    (e.g. EmbeddingStore.matrix) and protocol i owns rows offsets[i]:offsets[i+1].
+    The score of each protocol equals compare(query, protocol)[0]: every corpus
+    step keeps its best match among the query steps, and those maxima are
+    summed per protocol and divided by the number of query steps.
+    candidates (protocol indices, e.g. from ParameterIndex.protocols) limits
+    the scoring to those protocols; only their rows are read.
+
+    Returns a list of (protocol index, score) pairs, best first.
+    """
+    query = normalize_rows(query)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    rows = None
+    if candidates is not None:
+        candidates = np.unique(np.asarray(candidates, dtype=np.int64))
+        starts = offsets[candidates]
+        lengths = offsets[candidates + 1] - starts
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        # Corpus row of every candidate step, in candidate order
+        rows = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+    n_rows = int(offsets[-1])
+    row_best = np.empty(n_rows, dtype=np.float32)
+    # Work in chunks so float16 stores and very large corpora never need a full float32 copy
+    for start in range(0, n_rows, chunk_rows):
+        block = matrix[start:start + chunk_rows] if rows is None else matrix[rows[start:start + chunk_rows]]
+        block = np.asarray(block, dtype=np.float32)
+        np.max(block @ query.T, axis=1, out=row_best[start:start + len(block)])
+    scores = segment_sums(row_best, offsets) / query.shape[0]
+    ids = candidates if candidates is not None else np.arange(len(scores))
+    return [(int(ids[i]), float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+@tracing.traced("rerank", attributes=("mode",))
+def rerank(query, candidates, get_vectors, top_k=None, mode="ordered", gap=0.0, band=None):
+    """
+    Re-scores candidate protocols (e.g. the indices returned by search) with
+    compare() in the given mode. get_vectors(i) returns the step vectors of
+    protocol i (e.g. EmbeddingStore.vectors).
+
+    Returns a list of (protocol index, score) pairs, best first.
+    """
+    scored = [(int(i), compare(query, get_vectors(i), mode, gap=gap, band=band)[0]) for i in candidates]
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return scored[:top_k]
@@ -1,9 +1,30 @@
+import asyncio
 import json
-import openai
-from openai import OpenAI
+import os
+import queue
+import random
+import threading
+import time
+import weakref
 import re
+from backend import tracing
+from backend.cache import DiskCache, cache_dir, content_hash
+from backend.prefilter import CHUNK_CHARS, chunk_text, select_procedural_text
+from backend.step_stream import StepStreamParser, get_step_validator, parse_steps, repair_step, steps_from_raw
 
 API_KEY = ""
+MODEL = "gpt-4o"
+TEMPERATURE = 0
+CACHE_MAX_ENTRIES = 20000
+# Async pipeline settings
+MAX_CONCURRENCY = 4
+REQUEST_TIMEOUT = 120
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+# HTTP connection pool shared by all requests of a client
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
 # Static system prompt for consistent instructions
 SYSTEM_PROMPT = """
 You are a helpful scientific protocol information extractor. 
@@ -94,7 +115,12 @@ Here is the schema that is used for the provided steps:
 Format the procdure into a human-readable format, taking care to maintain the order of the steps. Use clear and concise language, and ensure that each step is easy to understand. Only return the formatted procedure text, without any additional explanations or comments.
 """
 
-openai.api_key = API_KEY
+
+REPAIR_PROMPT = """The following step of an extracted protocol is not valid JSON or does not match the schema ({errors}).
+Return only the corrected JSON object for this single step.
+
+{step}
+"""
 
 # user_prompt =  "CQDs were synthesized by the usage of O. basilicum L. extract via a simple hydrothermal method (Fig. 1). In a typical one-step synthesizing procedure, 2.0 g of O. basilicum L. seed was added to 100 mL of distilled water and stirred at 50 °C for 2 h. Then, the obtained extract was filtered and transferred into a 100 mL Teflon-lined stainless-steel autoclave to be heated at 180 °C for 4 h. Once the autoclave was cooled naturally at room temperature and the solution was centrifuged (12,000 rpm) for 15 min, the prepared brown solution was filtered through a fine-grained 0.45 μm membrane to remove larger particles. Finally, the solution was freeze-dried to attain the dark brown powder of CQDs." 
 
@@ -109,55 +135,472 @@ def extract_json_from_response(response_text):
         # If no code block found, try parsing whole text directly
         return json.loads(response_text)
     
-def extract_protocol(user_prompt):
-    # Load OpenAI API key
-    
-    client = OpenAI(api_key=API_KEY)
+_caches = {}
+_caches_lock = threading.Lock()
 
-    # Load protocol steps from the input JSON
-    
+def _get_cache(name, system_prompt):
+    # One cache file per prompt; entries made with an older prompt are dropped on open
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = DiskCache(os.path.join(cache_dir(), f"{name}.sqlite"),
+                                      version=content_hash(system_prompt), max_entries=CACHE_MAX_ENTRIES)
+        return _caches[name]
 
-    # output = []
+# --- Shared clients ---
+# Every request goes through one pooled client per event loop (plus one for
+# synchronous calls), so connections are kept alive and reused. Point the
+# pipeline at another endpoint, e.g. the local stand-in in backend.mock_llm,
+# with configure_client() or the PROTOCOMPARE_LLM_BASE_URL environment variable.
+_client_settings = {
+    "base_url": os.environ.get("PROTOCOMPARE_LLM_BASE_URL") or None,
+    "api_key": None,
+    "timeout": REQUEST_TIMEOUT,
+    "max_connections": MAX_CONNECTIONS,
+    "max_keepalive_connections": MAX_KEEPALIVE_CONNECTIONS,
+}
+_client = None
+_client_lock = threading.Lock()
+# One AsyncOpenAI client per event loop
+_async_clients = weakref.WeakKeyDictionary()
 
-    try:
-        res = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0
-        )
-        response_content = res.choices[0].message.content
-        # print("Response from OpenAI:", response_content)
-        parsed_json = extract_json_from_response(response_content)
-        # output.append(parsed_json)
+def configure_client(base_url=None, api_key=None, timeout=REQUEST_TIMEOUT, max_connections=MAX_CONNECTIONS,
+                     max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS):
+    """
+    Sets the endpoint, timeout and connection pool size used by all later
+    requests. base_url=None uses the OpenAI API; api_key=None falls back to
+    API_KEY (or OPENAI_API_KEY). Clients created before are discarded.
+    """
+    global _client
+    with _client_lock:
+        _client_settings.update(base_url=base_url, api_key=api_key, timeout=timeout, max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive_connections)
+        if _client is not None:
+            _client.close()
+        _client = None
+        _async_clients.clear()
 
-    except Exception as e:
-        print(f"Error processing step: {e}")
+def _client_options(async_client):
+    import openai
+    # DEFAULT_CONNECTION_LIMITS is an instance of the Limits class of the httpx build openai uses
+    limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=_client_settings["max_connections"],
+        max_keepalive_connections=_client_settings["max_keepalive_connections"])
+    http_client = openai.DefaultAsyncHttpxClient if async_client else openai.DefaultHttpxClient
+    return {
+        "api_key": _client_settings["api_key"] or API_KEY or None,
+        "base_url": _client_settings["base_url"],
+        "timeout": _client_settings["timeout"],
+        "http_client": http_client(limits=limits, timeout=_client_settings["timeout"]),
+    }
+
+def get_client():
+    """The shared synchronous client (thread-safe)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import openai
+            _client = openai.OpenAI(**_client_options(async_client=False))
+        return _client
 
-    return parsed_json
-    # Save the result
-    # with open("output_extracted.json", "w") as out_file:
-    #     json.dump(output, out_file, indent=2)
+def extraction_cache_key(user_prompt, model=MODEL, temperature=TEMPERATURE):
+    return content_hash({"text": user_prompt, "model": model,
+                         "system_prompt": SYSTEM_PROMPT, "temperature": temperature})
 
-    # print("Extraction complete. Output saved to output_extracted.json")
+def procedure_cache_key(input_json_protocol, model=MODEL, temperature=TEMPERATURE):
+    # Canonical JSON, so key order in the protocol does not matter
+    return content_hash({"protocol": input_json_protocol, "model": model,
+                         "system_prompt": SYSTEM_PROMPT_2, "temperature": temperature})
 
-# extract_protocol(user_prompt)
+def extract_protocol(user_prompt, use_cache=True):
+    """
+    Extracts the protocol steps of one text (streamed, see stream_protocol_steps).
+    Raises if the model's answer contains no usable JSON.
+    """
+    return list(_iterate_in_background(stream_protocol_steps(user_prompt, use_cache=use_cache)))
 
-def make_pretty_procedure(input_json_protocol):
-    client = OpenAI(api_key=API_KEY)
+@tracing.traced("llm.pretty_procedure")
+def make_pretty_procedure(input_json_protocol, use_cache=True):
+    cache = _get_cache("procedures", SYSTEM_PROMPT_2) if use_cache else None
+    cache_key = procedure_cache_key(input_json_protocol)
+    if cache is not None:
+        cached = cache.get_json(cache_key)
+        if cached is not None:
+            tracing.current_span().set(cached=True)
+            return cached
+
+    client = get_client()
     try:
         res = client.chat.completions.create(
-            model="gpt-4o",
+            model=MODEL,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT_2},
                 {"role": "user", "content": json.dumps(input_json_protocol, indent=2)}
             ],
-            temperature=0
+            temperature=TEMPERATURE
         )
-        response_content = res.choices[0].message.content
-        return response_content.strip()
+        tracing.current_span().set(**_token_counts(res.usage))
+        response_content = res.choices[0].message.content.strip()
+        if cache is not None:
+            cache.set_json(cache_key, response_content)
+        return response_content
     except Exception as e:
         print(f"Error formatting procedure: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+# --- Async pipeline ---
+def get_async_client():
+    """The shared AsyncOpenAI client of the running event loop (its connection pool is bound to the loop)."""
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        if loop not in _async_clients:
+            import openai
+            # Retries are handled below so that backoff and jitter are under our control
+            _async_clients[loop] = openai.AsyncOpenAI(max_retries=0, **_client_options(async_client=True))
+        return _async_clients[loop]
+
+def _is_retryable(error):
+    import openai
+    if isinstance(error, (asyncio.TimeoutError, openai.RateLimitError,
+                          openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def _token_counts(usage):
+    """Token counts of a response's usage block, as span attributes."""
+    if usage is None:
+        return {}
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+
+def _backoff_delay(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+@tracing.traced("llm.chat")
+async def _chat_completion_async(system_prompt, user_content, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES):
+    """One chat completion with per-request timeout and exponential backoff with full jitter."""
+    client = get_async_client()
+    for attempt in range(max_retries + 1):
+        try:
+            res = await asyncio.wait_for(client.chat.completions.create(
+                model=MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_content}
+                ],
+                temperature=TEMPERATURE
+            ), timeout)
+            tracing.current_span().set(attempts=attempt + 1, **_token_counts(res.usage))
+            return res.choices[0].message.content
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            await asyncio.sleep(_backoff_delay(attempt))
+
+@tracing.traced("llm.stream")
+async def _stream_completion_async(system_prompt, user_content, timeout=REQUEST_TIMEOUT):
+    """Yields the text deltas of a streamed chat completion; timeout applies to the wait for each delta."""
+    client = get_async_client()
+    trace = tracing.current_span()
+    stream = await asyncio.wait_for(client.chat.completions.create(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ],
+        temperature=TEMPERATURE,
+        stream=True,
+        # The last chunk then carries the token counts
+        stream_options={"include_usage": True}
+    ), timeout)
+    chunks = stream.__aiter__()
+    first_token = True
+    while True:
+        try:
+            chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+        except StopAsyncIteration:
+            return
+        if getattr(chunk, "usage", None) is not None:
+            trace.set(**_token_counts(chunk.usage))
+        if chunk.choices and chunk.choices[0].delta.content:
+            if first_token and trace is not tracing.NOOP_SPAN:
+                trace.set(first_token_ms=(time.time_ns() - trace.start_ns) / 1e6)
+                first_token = False
+            yield chunk.choices[0].delta.content
+
+async def _checked_steps(raw, step_number, **request_options):
+    """
+    Parses and validates one raw step object, numbering it step_number.
+    Invalid steps are first coerced locally (repair_step); if that is not
+    enough, only this step is sent back to the model to be fixed. Returns the
+    valid steps (usually one) and the number of steps that could not be
+    repaired and were dropped.
+    """
+    validate = get_step_validator()
+    try:
+        parsed = steps_from_raw(raw)
+    except ValueError as e:
+        parsed, errors = [None], [f"invalid JSON: {e}"]
+    steps, dropped = [], 0
+    for step in parsed:
+        if step is not None:
+            step = dict(step, step_number=step_number + len(steps))
+            errors = validate(step)
+            if errors:
+                step = repair_step(step, step_number + len(steps))
+                errors = validate(step)
+        if step is None or errors:
+            try:
+                response_content = await _chat_completion_async(
+                    SYSTEM_PROMPT, REPAIR_PROMPT.format(errors="; ".join(errors), step=raw), **request_options)
+                fixed, _ = parse_steps(response_content)
+                step = repair_step(steps_from_raw(fixed[0])[0], step_number + len(steps))
+                errors = validate(step)
+            except Exception as e:
+                errors = [str(e)]
+            if errors:
+                print(f"Error processing step: dropping unrepairable step ({'; '.join(errors)}): {raw[:200]}")
+                dropped += 1
+                continue
+        steps.append(step)
+    return steps, dropped
+
+@tracing.traced("extract.protocol")
+async def stream_protocol_steps(user_prompt, semaphore=None, use_cache=True, timeout=REQUEST_TIMEOUT,
+                                max_retries=MAX_RETRIES):
+    """
+    Async generator over the steps extracted from one text. The completion is
+    streamed and every step is yielded (validated against
+    papers/protocol_schema.json and numbered from 1) as soon as its JSON
+    object is complete. Failed requests are retried with backoff; steps that
+    were already yielded are not repeated. The finished list is only cached
+    if it is complete: not empty, not cut off and without dropped steps, so
+    a degraded answer is asked for again next time.
+    """
+    cache = _get_cache("extractions", SYSTEM_PROMPT) if use_cache else None
+    cache_key = extraction_cache_key(user_prompt)
+    if cache is not None:
+        cached = cache.get_json(cache_key)
+        if cached is not None:
+            tracing.current_span().set(cached=True)
+            for step in cached:
+                yield step
+            return
+    steps = []
+    complete = True
+    raw_done = 0  # raw step objects already handled, skipped when a retry streams them again
+    for attempt in range(max_retries + 1):
+        parser = StepStreamParser()
+        raw_seen = 0
+        try:
+            async with semaphore or asyncio.Semaphore(1):
+                async for text in _stream_completion_async(SYSTEM_PROMPT, user_prompt, timeout):
+                    for raw in parser.feed(text):
+                        raw_seen += 1
+                        if raw_seen <= raw_done:
+                            continue
+                        # Repairs reuse the slot this request already holds
+                        new_steps, dropped = await _checked_steps(raw, len(steps) + 1, timeout=timeout,
+                                                                  max_retries=max_retries)
+                        raw_done += 1
+                        complete = complete and not dropped
+                        steps.extend(new_steps)
+                        for step in new_steps:
+                            yield step
+                if not parser.started:
+                    raise ValueError("The model's answer contains no JSON")
+                tail = parser.close()
+                if tail is not None:
+                    # Answer cut off inside a step: repair just that step
+                    complete = False
+                    new_steps, _ = await _checked_steps(tail, len(steps) + 1, timeout=timeout, max_retries=max_retries)
+                    for step in new_steps:
+                        steps.append(step)
+                        yield step
+            break
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            await asyncio.sleep(_backoff_delay(attempt))
+    if cache is not None and complete and steps:
+        cache.set_json(cache_key, steps)
+
+async def extract_protocol_async(user_prompt, semaphore=None, use_cache=True, **request_options):
+    """All steps of stream_protocol_steps as a list."""
+    return [step async for step in stream_protocol_steps(user_prompt, semaphore, use_cache, **request_options)]
+
+@tracing.traced("extract.document")
+async def stream_document_steps(text, semaphore=None, use_cache=True, prefilter=True, max_chunk_chars=CHUNK_CHARS,
+                                **request_options):
+    """
+    Async generator over the steps of a whole document. Long documents are
+    first cut down to their procedural paragraphs (backend.prefilter), and
+    what is left is split into chunks that are streamed concurrently. Steps
+    are yielded in document order and renumbered across chunks. Short texts
+    make a single call, exactly like stream_protocol_steps.
+    """
+    if prefilter:
+        with tracing.span("prefilter", chars=len(text)) as trace:
+            text = select_procedural_text(text)
+            trace.set(kept_chars=len(text))
+    chunks = chunk_text(text, max_chunk_chars)
+    tracing.current_span().set(chunks=len(chunks))
+    if len(chunks) == 1:
+        async for step in stream_protocol_steps(chunks[0], semaphore, use_cache, **request_options):
+            yield step
+        return
+    semaphore = semaphore or asyncio.Semaphore(MAX_CONCURRENCY)
+    queues = [asyncio.Queue() for _ in chunks]
+    done = object()
+
+    async def run(chunk, steps):
+        try:
+            async for step in stream_protocol_steps(chunk, semaphore, use_cache, **request_options):
+                await steps.put(step)
+            await steps.put(done)
+        except Exception as e:
+            await steps.put(e)
+
+    tasks = [asyncio.create_task(run(chunk, steps)) for chunk, steps in zip(chunks, queues)]
+    try:
+        step_number = 0
+        # Later chunks keep streaming in the background while earlier ones are read
+        for steps in queues:
+            while (step := await steps.get()) is not done:
+                if isinstance(step, Exception):
+                    raise step
+                step_number += 1
+                yield dict(step, step_number=step_number)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def extract_document_async(text, semaphore=None, use_cache=True, **options):
+    """All steps of stream_document_steps as a list."""
+    return [step async for step in stream_document_steps(text, semaphore, use_cache, **options)]
+
+@tracing.traced("pretty_procedure")
+async def make_pretty_procedure_async(input_json_protocol, semaphore=None, use_cache=True, **request_options):
+    cache = _get_cache("procedures", SYSTEM_PROMPT_2) if use_cache else None
+    cache_key = procedure_cache_key(input_json_protocol)
+    if cache is not None:
+        cached = cache.get_json(cache_key)
+        if cached is not None:
+            tracing.current_span().set(cached=True)
+            return cached
+    async with semaphore or asyncio.Semaphore(1):
+        response_content = await _chat_completion_async(
+            SYSTEM_PROMPT_2, json.dumps(input_json_protocol, indent=2), **request_options)
+    response_content = response_content.strip()
+    if cache is not None:
+        cache.set_json(cache_key, response_content)
+    return response_content
+
+async def _as_completed(worker, items, concurrency, **options):
+    """Runs worker over (key, value) items with bounded concurrency, yielding (key, result, error) as they finish."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(key, value):
+        try:
+            return key, await worker(value, semaphore=semaphore, **options), None
+        except Exception as e:
+            return key, None, e
+
+    tasks = [asyncio.create_task(run(key, value)) for key, value in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def extract_protocols_async(texts, concurrency=MAX_CONCURRENCY, **options):
+    """
+    Async generator extracting many documents concurrently (see
+    extract_document_async). texts is a dict (or iterable of pairs) of
+    key -> document text; yields (key, protocol, error) in completion order.
+    """
+    items = texts.items() if isinstance(texts, dict) else texts
+    return _as_completed(extract_document_async, items, concurrency, **options)
+
+async def stream_protocols_async(texts, concurrency=MAX_CONCURRENCY, **options):
+    """
+    Async generator extracting many documents concurrently and reporting
+    every step as it arrives: yields (key, step, None) for each step,
+    (key, None, None) when a document is finished and (key, None, error) when
+    it failed.
+    """
+    items = texts.items() if isinstance(texts, dict) else texts
+    semaphore = asyncio.Semaphore(concurrency)
+    events = asyncio.Queue()
+
+    async def run(key, text):
+        try:
+            async for step in stream_document_steps(text, semaphore, **options):
+                await events.put((key, step, None))
+            await events.put((key, None, None))
+        except Exception as e:
+            await events.put((key, None, e))
+
+    tasks = [asyncio.create_task(run(key, text)) for key, text in items]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await events.get()
+            remaining -= event[1] is None
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def make_pretty_procedures_async(protocols, concurrency=MAX_CONCURRENCY, **options):
+    """Async generator formatting many protocols concurrently; yields (key, text, error)."""
+    items = protocols.items() if isinstance(protocols, dict) else protocols
+    return _as_completed(make_pretty_procedure_async, items, concurrency, **options)
+
+# Synchronous callers (Streamlit, CLI) drive the async pipeline on one
+# long-lived background event loop so the client's connection pool is reused.
+_loop = None
+_loop_lock = threading.Lock()
+
+def _background_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="protocompare-llm", daemon=True).start()
+        return _loop
+
+def _iterate_in_background(async_iterable):
+    results = queue.Queue()
+    done = object()
+    # Spans on the loop thread belong to the caller's current span
+    parent = tracing.current_span()
+
+    async def drain():
+        try:
+            with tracing.use_span(parent):
+                async for item in async_iterable:
+                    results.put(item)
+        finally:
+            results.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(drain(), _background_loop())
+    try:
+        while (item := results.get()) is not done:
+            yield item
+        future.result()
+    finally:
+        future.cancel()
+
+def iter_extract_protocols(texts, concurrency=MAX_CONCURRENCY, **options):
+    """Blocking generator over extract_protocols_async: yields (key, protocol, error) as each call completes."""
+    return _iterate_in_background(extract_protocols_async(texts, concurrency, **options))
+
+def iter_stream_protocols(texts, concurrency=MAX_CONCURRENCY, **options):
+    """Blocking generator over stream_protocols_async: yields (key, step, error) events as steps arrive."""
+    return _iterate_in_background(stream_protocols_async(texts, concurrency, **options))
+
+def iter_make_pretty_procedures(protocols, concurrency=MAX_CONCURRENCY, **options):
+    """Blocking generator over make_pretty_procedures_async: yields (key, text, error) as each call completes."""
+    return _iterate_in_background(make_pretty_procedures_async(protocols, concurrency, **options))
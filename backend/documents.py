@@ -0,0 +1,195 @@
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from backend import tracing
+
+# Supported document types; the readers take a binary file-like object
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+# PDFs with at least this many uncached pages are split across worker processes
+PARALLEL_MIN_PAGES = 16
+PAGES_PER_TASK = 8
+PAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Headings used to stop reading once the experimental/methods section is over
+METHODS_HEADING = re.compile(
+    r"^\s*(?:\d+(?:\.\d+)*\.?\s*)?(?:experimental(?: section| procedures?| details)?|materials and methods"
+    r"|methods|general procedures?|synthetic procedures?)\s*:?\s*$", re.IGNORECASE | re.MULTILINE)
+SECTION_AFTER_METHODS = re.compile(
+    r"^\s*(?:\d+(?:\.\d+)*\.?\s*)?(?:references|notes and references|bibliography|acknowledge?ments?"
+    r"|author contributions|conflicts? of interest|conclusions?|nmr spectra|copies of .*spectra)\s*:?\s*$",
+    re.IGNORECASE | re.MULTILINE)
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+# Set in each worker process by _open_pdf_in_worker
+_worker_reader = None
+
+
+def _get_page_cache():
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            import pypdf
+            from backend.cache import DiskCache, cache_dir
+            # Text layout can change between pypdf releases, so the version stamp includes it
+            _page_cache = DiskCache(os.path.join(cache_dir(), "pdf_pages.sqlite"), version=f"pypdf-{pypdf.__version__}",
+                                    max_entries=None, max_bytes=PAGE_CACHE_MAX_BYTES)
+        return _page_cache
+
+
+def _extract_pages(reader, page_numbers):
+    return [reader.pages[i].extract_text() or "" for i in page_numbers]
+
+
+def _open_pdf_in_worker(data):
+    global _worker_reader
+    from pypdf import PdfReader
+    _worker_reader = PdfReader(BytesIO(data))
+
+
+def _extract_pages_in_worker(page_numbers):
+    return _extract_pages(_worker_reader, page_numbers)
+
+
+def methods_section_end(text):
+    """
+    Position in text where the experimental/methods section ends (the start
+    of the next section heading), or None if no complete methods section is found.
+    """
+    start = METHODS_HEADING.search(text)
+    if start is None:
+        return None
+    end = SECTION_AFTER_METHODS.search(text, start.end())
+    return None if end is None else end.start()
+
+
+def iter_pdf_pages(file_bytes: BytesIO, workers=None, use_cache=True, stop_after_methods=False):
+    """
+    Yields the text of each page of a PDF in order, as soon as it is available.
+
+    Pages are cached on disk by file hash, so re-reading a file skips parsing.
+    Uncached pages of large files are extracted in chunks across worker
+    processes (workers=None uses all CPUs, 1 stays in-process).
+    stop_after_methods: stop after the page where the experimental/methods
+    section ends (the remaining pages, e.g. spectra in SI files, are not parsed).
+    """
+    from pypdf import PdfReader
+    from backend.cache import content_hash
+
+    data = file_bytes.read()
+    reader = PdfReader(BytesIO(data))
+    n_pages = len(reader.pages)
+    keys = []
+    cached = {}
+    if use_cache:
+        file_hash = content_hash(data)
+        keys = [f"{file_hash}:{i}" for i in range(n_pages)]
+        cached = _get_page_cache().get_many(keys)
+    missing = [i for i in range(n_pages) if not use_cache or keys[i] not in cached]
+    workers = workers or os.cpu_count() or 1
+
+    def extracted_pages():
+        """Yields (page number, text) for the missing pages, in order."""
+        if workers == 1 or len(missing) < PARALLEL_MIN_PAGES:
+            for i in missing:
+                yield i, _extract_pages(reader, [i])[0]
+            return
+        chunks = [missing[start:start + PAGES_PER_TASK] for start in range(0, len(missing), PAGES_PER_TASK)]
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_open_pdf_in_worker,
+                                   initargs=(data,))
+        try:
+            # map() submits every chunk up front but hands results back in order
+            for chunk, texts in zip(chunks, pool.map(_extract_pages_in_worker, chunks)):
+                yield from zip(chunk, texts)
+        finally:
+            # Closing early (stop_after_methods) drops the chunks nobody will read
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    fresh = extracted_pages()
+    methods_text = None  # text from the methods heading on, once it was seen
+    try:
+        for i in range(n_pages):
+            if use_cache and keys[i] in cached:
+                text = cached[keys[i]].decode("utf-8")
+            else:
+                _, text = next(fresh)
+                if use_cache:
+                    _get_page_cache().set(keys[i], text.encode("utf-8"))
+            yield text
+            if stop_after_methods:
+                if methods_text is None:
+                    heading = METHODS_HEADING.search(text)
+                    methods_text = text[heading.start():] if heading else None
+                else:
+                    methods_text += "\n" + text
+                if methods_text is not None and methods_section_end(methods_text) is not None:
+                    return
+    finally:
+        fresh.close()
+
+
+def extract_text_from_pdf(file_bytes: BytesIO, workers=None, use_cache=True, stop_after_methods=False) -> str:
+    """Extracts text from a PDF file (see iter_pdf_pages)."""
+    return "".join(iter_pdf_pages(file_bytes, workers, use_cache, stop_after_methods))
+
+
+def iter_docx_paragraphs(file_bytes: BytesIO):
+    """Yields the text of each paragraph of a DOCX file."""
+    from docx import Document
+    document = Document(file_bytes)
+    for paragraph in document.paragraphs:
+        yield paragraph.text
+
+
+def extract_text_from_docx(file_bytes: BytesIO) -> str:
+    """Extracts text from a DOCX file."""
+    return '\n'.join(iter_docx_paragraphs(file_bytes))
+
+
+def extract_text_from_txt(file_bytes: BytesIO) -> str:
+    """Extracts text from a TXT file."""
+    return file_bytes.read().decode("utf-8")
+
+
+READERS = {
+    ".pdf": extract_text_from_pdf,
+    ".docx": extract_text_from_docx,
+    ".txt": extract_text_from_txt,
+}
+
+
+def _file_extension(file_name):
+    file_extension = os.path.splitext(file_name)[1].lower()
+    if file_extension not in READERS:
+        raise ValueError(f"Unsupported file type for {file_name}: {file_extension}")
+    return file_extension
+
+
+def iter_text(file_bytes: BytesIO, file_name: str, stop_after_methods=False):
+    """
+    Yields the text of a document incrementally: PDF pages, DOCX paragraphs
+    (newline-separated) or a whole TXT file. Joined with "" the chunks equal
+    extract_text(); stop_after_methods only applies to PDFs.
+    """
+    file_extension = _file_extension(file_name)
+    if file_extension == ".pdf":
+        yield from iter_pdf_pages(file_bytes, stop_after_methods=stop_after_methods)
+    elif file_extension == ".docx":
+        paragraphs = iter_docx_paragraphs(file_bytes)
+        first = next(paragraphs, None)
+        if first is not None:
+            yield first
+            for paragraph in paragraphs:
+                yield "\n" + paragraph
+    else:
+        yield extract_text_from_txt(file_bytes)
+
+
+@tracing.traced("parse.document", attributes=("file_name",))
+def extract_text(file_bytes: BytesIO, file_name: str, stop_after_methods=False) -> str:
+    """Extracts text from a document, picking the reader from the file extension."""
+    return "".join(iter_text(file_bytes, file_name, stop_after_methods))
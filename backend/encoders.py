@@ -0,0 +1,104 @@
+import os
+import platform
+import numpy as np
+
+# Step-embedding backends, selected with PROTOCOMPARE_ENCODER:
+#   mpnet             - all-mpnet-base-v2 on PyTorch (the baseline)
+#   mpnet-onnx-int8   - the same model exported to ONNX Runtime with dynamic int8 quantization
+#   minilm            - the smaller distilled all-MiniLM-L6-v2 (384-d, not interchangeable with mpnet stores)
+#   minilm-onnx-int8  - MiniLM on ONNX Runtime, int8
+# Run benchmarks/encoder_drift.py to measure how far scores and rankings move
+# from the baseline before switching a deployment over.
+ENCODERS = {
+    "mpnet": {"backend": "sentence-transformers", "model": "all-mpnet-base-v2"},
+    "mpnet-onnx-int8": {"backend": "onnx-int8", "model": "all-mpnet-base-v2"},
+    "minilm": {"backend": "sentence-transformers", "model": "all-MiniLM-L6-v2"},
+    "minilm-onnx-int8": {"backend": "onnx-int8", "model": "all-MiniLM-L6-v2"},
+}
+DEFAULT_ENCODER = "mpnet"
+
+
+def configured_encoder() -> str:
+    name = os.environ.get("PROTOCOMPARE_ENCODER", DEFAULT_ENCODER)
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown encoder {name!r}; choose one of {', '.join(ENCODERS)}")
+    return name
+
+
+def encoder_id(name) -> str:
+    """
+    Identity of the vectors an encoder produces, used for cache keys and the
+    store's model field. The PyTorch baseline keeps the plain model name;
+    int8 models also name their quantization config, whose kernels give
+    slightly different vectors.
+    """
+    config = ENCODERS[name]
+    if config["backend"] == "sentence-transformers":
+        return config["model"]
+    if config["backend"] == "onnx-int8":
+        return f"{config['model']}:{config['backend']}-{_quantization_config()}"
+    return f"{config['model']}:{config['backend']}"
+
+
+class SentenceTransformerEncoder:
+    """The sentence-transformers PyTorch path (previously the only one)."""
+
+    def __init__(self, model_name, **kwargs):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu', **kwargs)
+        self.model_name = model_name
+        self.id = model_name
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    def encode(self, texts, batch_size=128):
+        vectors = self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dimension)
+
+
+def _quantization_config():
+    # Pick the int8 kernel set for this CPU; override with PROTOCOMPARE_ONNX_QUANTIZATION
+    override = os.environ.get("PROTOCOMPARE_ONNX_QUANTIZATION")
+    if override:
+        return override
+    return "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "avx2"
+
+
+class OnnxInt8Encoder(SentenceTransformerEncoder):
+    """
+    ONNX Runtime export of a sentence-transformers model with dynamic int8
+    quantization. The quantized model is exported once into the cache
+    directory and reused afterwards. Needs `pip install sentence-transformers[onnx]`.
+    """
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+        from backend.cache import cache_dir
+
+        config = _quantization_config()
+        file_name = f"model_qint8_{config}.onnx"
+        export_dir = os.path.join(cache_dir(), "onnx", model_name.replace("/", "__"))
+        if not os.path.exists(os.path.join(export_dir, "onnx", file_name)):
+            exported = SentenceTransformer(model_name, device='cpu', backend="onnx")
+            exported.save_pretrained(export_dir)
+            export_dynamic_quantized_onnx_model(exported, config, export_dir, file_suffix=f"qint8_{config}")
+        super().__init__(export_dir, backend="onnx", model_kwargs={"file_name": f"onnx/{file_name}"})
+        self.model_name = model_name
+        self.id = f"{model_name}:onnx-int8-{config}"
+
+
+BACKENDS = {
+    "sentence-transformers": SentenceTransformerEncoder,
+    "onnx-int8": OnnxInt8Encoder,
+}
+
+
+def load_encoder(name):
+    config = ENCODERS[name]
+    return BACKENDS[config["backend"]](config["model"])
@@ -0,0 +1,204 @@
+import argparse
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+from backend.ann import ANN_DIR, load_index, save_index, update_index
+from backend.cache import content_hash
+from backend.data_extraction import MAX_CONCURRENCY, iter_extract_protocols
+from backend.documents import SUPPORTED_EXTENSIONS, extract_text
+from backend.lexical import update_lexical_index
+from backend.store import EmbeddingStore
+from backend.table import update_step_table
+from backend.vectorized import embed_protocols, encoder_name
+
+# Bulk, resumable ingestion of papers into the embedding store:
+#   python -m backend.ingest papers/ "pdfs/**/*.pdf" --store frontend/store
+# Documents are processed in batches; every finished batch is flushed to the
+# store, so a crash loses at most one batch and a re-run skips every document
+# whose content hash is already stored. An ANN index built at <store>/ann
+# (python -m backend.ann build) gets the new protocols at the end of the run.
+
+INPUT_EXTENSIONS = SUPPORTED_EXTENSIONS + (".json",)
+_step_table_warned = False
+
+
+def iter_input_paths(inputs):
+    """Expands directories (recursively) and glob patterns into input file paths."""
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                for file_name in sorted(files):
+                    if os.path.splitext(file_name)[1].lower() in INPUT_EXTENSIONS:
+                        yield os.path.join(root, file_name)
+        elif glob.has_magic(pattern):
+            yield from sorted(glob.glob(pattern, recursive=True))
+        else:
+            yield pattern
+
+
+def _read_documents(path, methods_only=False):
+    stem, extension = os.path.splitext(os.path.basename(path))
+    if extension.lower() == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        if isinstance(records, dict):
+            records = [records]
+        return [{
+            "doi": record.get("doi") or f"{stem}#{i}",
+            "text": record.get("text"),
+            "protocol": record.get("protocol"),
+            "source": path,
+        } for i, record in enumerate(records)
+            # Skip records with nothing to ingest (e.g. bare embeddings or schemas)
+            if isinstance(record, dict) and (record.get("text") or record.get("protocol"))]
+    with open(path, "rb") as f:
+        return [{"doi": stem, "text": extract_text(f, path, methods_only), "protocol": None, "source": path}]
+
+
+def iter_documents(paths, on_error=None, methods_only=False):
+    """
+    Yields {"doi", "text", "protocol", "source"} records. JSON inputs hold a
+    list of {doi, text, protocol} records (as in papers/*_examples.json);
+    other files are read as documents and keyed by their file name.
+    Unreadable inputs are passed to on_error(path, error) and skipped.
+    methods_only: stop reading PDFs after their experimental/methods section.
+    """
+    for path in paths:
+        try:
+            documents = _read_documents(path, methods_only)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(path, e)
+            continue
+        yield from documents
+
+
+def document_hash(document):
+    """Content hash used to skip already-ingested documents."""
+    if document.get("text"):
+        return content_hash({"text": document["text"]})
+    return content_hash({"protocol": document["protocol"]})
+
+
+def _ingest_batch(batch, store, store_path, concurrency, dtype, embed_batch_size, stats, log):
+    to_extract = {i: document["text"] for i, document in enumerate(batch) if not document.get("protocol")}
+    for i, protocol, error in iter_extract_protocols(to_extract, concurrency):
+        if error is not None:
+            log(f"Error extracting protocol from {batch[i]['source']} ({batch[i]['doi']}): {error}")
+        else:
+            batch[i]["protocol"] = protocol
+
+    ready = [document for document in batch if document.get("protocol")]
+    stats["failed"] += len(batch) - len(ready)
+    # One deduplicated, length-sorted encoder pass for the whole batch
+    embedded = embed_protocols([document["protocol"] for document in ready], embed_batch_size)
+    for document, vectors in zip(ready, embedded):
+        if len(vectors) == 0:
+            stats["failed"] += 1
+            continue
+        if store is None:
+            store = EmbeddingStore.create(store_path, vectors.shape[1], encoder_name(), dtype)
+        store.append(document["doi"], vectors, document["protocol"], sha=document["sha"])
+        stats["ingested"] += 1
+        stats["steps"] += len(vectors)
+    if store is not None:
+        store.flush()
+        _update_step_table(store, log)
+        update_lexical_index(store)
+    return store
+
+
+def _update_step_table(store, log):
+    """Adds the batch to the store's Parquet step table (see backend/table.py) when pyarrow is installed."""
+    global _step_table_warned
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        if not _step_table_warned:
+            log("pyarrow is not installed; not writing the step table")
+            _step_table_warned = True
+        return
+    update_step_table(store)
+
+
+def _update_ann_index(store, log):
+    """Inserts the new protocols into the store's ANN index (see backend/ann.py), if one was built."""
+    path = os.path.join(store.path, ANN_DIR)
+    if not os.path.isdir(path):
+        return
+    try:
+        index = load_index(path)
+        if update_index(index, store):
+            save_index(index, path)
+    except (ImportError, ValueError) as e:
+        log(f"Not updating the ANN index at {path}: {e}")
+
+
+def _report(stats, elapsed, log):
+    elapsed = max(elapsed, 1e-9)
+    log(f"{stats['ingested']} docs, {stats['steps']} steps in {elapsed:.1f}s "
+        f"({stats['ingested'] / elapsed:.2f} docs/s, {stats['steps'] / elapsed:.1f} steps/s); "
+        f"skipped {stats['skipped']}, failed {stats['failed']}")
+
+
+def ingest(inputs, store_path, batch_size=64, concurrency=MAX_CONCURRENCY, dtype="float32",
+           embed_batch_size=128, methods_only=False, log=print):
+    """Ingests documents into the store at store_path and returns throughput statistics."""
+    store = EmbeddingStore.open(store_path, writable=True) if EmbeddingStore.exists(store_path) else None
+    if store is not None and store.model_name != encoder_name():
+        raise ValueError(f"Store at {store_path} was built with {store.model_name}, not {encoder_name()}")
+
+    stats = {"ingested": 0, "steps": 0, "skipped": 0, "failed": 0}
+
+    def on_error(path, error):
+        log(f"Error reading {path}: {error}")
+        stats["failed"] += 1
+
+    start = time.perf_counter()
+    batch, batch_hashes = [], set()
+    # A trailing None flushes the last partial batch
+    for document in itertools.chain(iter_documents(iter_input_paths(inputs), on_error, methods_only), [None]):
+        if document is not None:
+            document["sha"] = document_hash(document)
+            if (store is not None and store.has_hash(document["sha"])) or document["sha"] in batch_hashes:
+                stats["skipped"] += 1
+                continue
+            batch.append(document)
+            batch_hashes.add(document["sha"])
+        if batch and (document is None or len(batch) >= batch_size):
+            store = _ingest_batch(batch, store, store_path, concurrency, dtype, embed_batch_size, stats, log)
+            batch, batch_hashes = [], set()
+            _report(stats, time.perf_counter() - start, log)
+
+    if store is not None:
+        _update_ann_index(store, log)
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or extend the protocol search store from a set of papers.")
+    parser.add_argument("inputs", nargs="+",
+                        help="Directories, files or glob patterns (PDF, DOCX, TXT or {doi, text, protocol} JSON)")
+    parser.add_argument("--store", required=True, help="Embedding store directory (created if missing)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Documents per flushed batch")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY, help="Concurrent extraction requests")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--embed-batch-size", type=int, default=128, help="Step strings per encoder batch")
+    parser.add_argument("--methods-only", action="store_true",
+                        help="Stop reading PDFs once their experimental/methods section ends")
+    args = parser.parse_args(argv)
+
+    log = lambda message: print(message, file=sys.stderr, flush=True)
+    stats = ingest(args.inputs, args.store, args.batch_size, args.concurrency, args.dtype,
+                   args.embed_batch_size, args.methods_only, log)
+    _report(stats, stats["elapsed"], print)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import argparse
+import glob
+import os
+import re
+import shutil
+from collections import Counter
+import numpy as np
+from backend import tracing
+from backend.compare import rerank, search
+from backend.vectorized import extract_and_format_steps
+
+# BM25 inverted index over the step strings that are embedded
+# (backend.vectorized.format_step), one document per protocol, kept next to
+# the embedding store:
+#   <store>/lexical/seg-<first protocol>-<end protocol>/{terms,offsets,docs,tf,lengths}.npy
+# Every ingest batch adds a segment; segments are merged past MAX_SEGMENTS.
+# Exact terms (reagent names, abbreviations such as "cqds") are cheap to
+# look up and are what dense similarity tends to blur, so hybrid_search uses
+# the index to pick candidates, fuses lexical and dense ranks, and re-scores
+# the short list with compare().
+#   python -m backend.lexical build frontend/store
+#   python -m backend.lexical query frontend/store "teflon-lined autoclave cqds"
+
+LEXICAL_DIR = "lexical"
+SEGMENT_NAME = re.compile(r"seg-(\d+)-(\d+)$")
+MAX_SEGMENTS = 32
+SEGMENT_FILES = ("terms", "offsets", "docs", "tf", "lengths")
+TOKEN = re.compile(r"[^\W_]+(?:[-.'/][^\W_]+)*")
+MAX_TOKEN_LENGTH = 32
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+FUSIONS = ("rrf", "weighted")
+
+
+def tokenize(text):
+    """
+    Lower-cased word tokens; a hyphenated or dotted compound ("teflon-lined",
+    "o.basilicum") is kept whole and also split into its parts.
+    """
+    tokens = []
+    for match in TOKEN.finditer(text.lower()):
+        token = match.group()[:MAX_TOKEN_LENGTH]
+        tokens.append(token)
+        parts = re.split(r"[-.'/]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def protocol_tokens(protocol):
+    """Tokens of a protocol's formatted steps (the text that is embedded)."""
+    return [token for text in extract_and_format_steps(protocol or []) for token in tokenize(text)]
+
+
+class Segment:
+    """
+    Postings of the protocols start..end-1: terms sorted, and for term i the
+    protocol ids docs[offsets[i]:offsets[i + 1]] with their term counts tf.
+    lengths holds the token count of every protocol in the segment.
+    """
+
+    def __init__(self, start, terms, offsets, docs, tf, lengths):
+        self.start = start
+        self.terms = terms
+        self.offsets = offsets
+        self.docs = docs
+        self.tf = tf
+        self.lengths = lengths
+
+    @property
+    def end(self):
+        return self.start + len(self.lengths)
+
+    @classmethod
+    def from_postings(cls, start, terms, docs, tf, lengths):
+        """Groups parallel (term, protocol, count) arrays by term."""
+        vocabulary, codes = np.unique(np.asarray(terms, dtype=str), return_inverse=True)
+        docs = np.asarray(docs, dtype=np.int64)
+        order = np.lexsort((docs, codes))
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(vocabulary)), out=offsets[1:])
+        return cls(start, vocabulary, offsets, docs[order], np.asarray(tf, dtype=np.int32)[order],
+                   np.asarray(lengths, dtype=np.int32))
+
+    @classmethod
+    def build(cls, token_lists, start=0):
+        """Segment of the protocols numbered from start, given each one's tokens."""
+        terms, docs, tf, lengths = [], [], [], []
+        for i, tokens in enumerate(token_lists):
+            lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                terms.append(term)
+                docs.append(start + i)
+                tf.append(count)
+        return cls.from_postings(start, terms, docs, tf, lengths)
+
+    @classmethod
+    def merge(cls, segments):
+        terms = np.concatenate([np.repeat(s.terms, np.diff(s.offsets)) for s in segments])
+        return cls.from_postings(segments[0].start, terms, np.concatenate([s.docs for s in segments]),
+                                 np.concatenate([s.tf for s in segments]),
+                                 np.concatenate([s.lengths for s in segments]))
+
+    def postings(self, term):
+        """(protocol ids, term counts) of one term; empty when it does not occur."""
+        i = np.searchsorted(self.terms, term)
+        if i < len(self.terms) and self.terms[i] == term:
+            return self.docs[self.offsets[i]:self.offsets[i + 1]], self.tf[self.offsets[i]:self.offsets[i + 1]]
+        return self.docs[:0], self.tf[:0]
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        for stale in (tmp_path, path):
+            if os.path.exists(stale):
+                shutil.rmtree(stale)
+        os.makedirs(tmp_path)
+        for name in SEGMENT_FILES:
+            np.save(os.path.join(tmp_path, name + ".npy"), getattr(self, name))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, start):
+        return cls(start, *(np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in SEGMENT_FILES))
+
+
+class LexicalIndex:
+    """BM25 over the protocols of a list of consecutive segments."""
+
+    def __init__(self, segments, k1=BM25_K1, b=BM25_B):
+        self.segments = segments
+        self.k1 = k1
+        self.b = b
+        lengths = np.concatenate([s.lengths for s in segments]) if segments else np.empty(0, np.int32)
+        self.n_docs = len(lengths)
+        self.lengths = lengths.astype(np.float32)
+        self.avg_length = float(lengths.mean()) if len(lengths) and lengths.any() else 1.0
+
+    @classmethod
+    def build(cls, protocols):
+        return cls([Segment.build([protocol_tokens(protocol) for protocol in protocols])])
+
+    @classmethod
+    def load(cls, path):
+        return cls([Segment.load(segment_path, start) for start, _, segment_path in _segments(path)])
+
+    def __len__(self):
+        return self.n_docs
+
+    def scores(self, tokens, candidates=None):
+        """BM25 score of every protocol (n_docs,) for a bag of query tokens; candidates limits it to those ids."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        if not self.n_docs:
+            return scores
+        allowed = None
+        if candidates is not None:
+            candidates = np.asarray(candidates, dtype=np.int64)
+            allowed = np.zeros(self.n_docs, dtype=bool)
+            # Ids past the indexed protocols (e.g. ingested since) have no postings here
+            allowed[candidates[(candidates >= 0) & (candidates < self.n_docs)]] = True
+        for term in set(tokens):
+            postings = [segment.postings(term) for segment in self.segments]
+            docs = np.concatenate([d for d, _ in postings])
+            if len(docs) == 0:
+                continue
+            tf = np.concatenate([t for _, t in postings]).astype(np.float32)
+            idf = np.log1p((self.n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            if allowed is not None:
+                keep = allowed[docs]
+                docs, tf = docs[keep], tf[keep]
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[docs] / self.avg_length)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    @tracing.traced("lexical_search")
+    def search(self, tokens, top_k=100, candidates=None):
+        """(protocol id, BM25 score) pairs with a non-zero score, best first."""
+        scores = self.scores(tokens, candidates)
+        hits = np.flatnonzero(scores)
+        best = hits[np.argsort(-scores[hits], kind="stable")][:top_k]
+        return [(int(i), float(scores[i])) for i in best]
+
+
+def fuse(lexical, dense, fusion="rrf", alpha=0.5, rrf_k=RRF_K):
+    """
+    Combines two ranked (protocol id, score) lists into one, best first.
+    "rrf": reciprocal-rank fusion, sum of 1 / (rrf_k + rank) over the lists.
+    "weighted": alpha * dense + (1 - alpha) * BM25, each score divided by the
+    best one of its list so both rankings peak at 1 (dense greedy scores are
+    not bounded by 1: they grow with the length of the protocol).
+    """
+    if fusion not in FUSIONS:
+        raise ValueError(f"Unknown fusion {fusion!r}; choose one of {', '.join(FUSIONS)}")
+    fused = {}
+    if fusion == "rrf":
+        for ranked in (lexical, dense):
+            for rank, (i, _) in enumerate(ranked, 1):
+                fused[i] = fused.get(i, 0.0) + 1.0 / (rrf_k + rank)
+    else:
+        for ranked, weight in ((lexical, 1 - alpha), (dense, alpha)):
+            top = max((score for _, score in ranked), default=0.0)
+            top = top if top > 0 else 1.0
+            for i, score in ranked:
+                fused[i] = fused.get(i, 0.0) + weight * score / top
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+@tracing.traced("hybrid_search", attributes=("mode", "fusion"))
+def hybrid_search(query, query_texts, index, matrix, offsets, get_vectors, top_k=10, n_candidates=200,
+                  rerank_k=50, fusion="rrf", alpha=0.5, mode="greedy", gap=0.0, band=None, candidates=None):
+    """
+    Three-stage search. The BM25 index picks the n_candidates protocols
+    sharing the most distinctive terms with query_texts (the query's
+    formatted steps); those alone are scored densely with search(); the two
+    rankings are fused (see fuse) and the best rerank_k are re-scored with
+    compare() in the given mode. Without any BM25 hit the dense ranking of
+    all protocols is used. candidates (e.g. from ParameterIndex) restricts
+    every stage to those protocols.
+    Returns a list of (protocol index, score) pairs, best first.
+    """
+    tokens = [token for text in query_texts for token in tokenize(text)]
+    lexical = index.search(tokens, n_candidates, candidates)
+    if lexical:
+        dense = search(query, matrix, offsets, top_k=None, candidates=[i for i, _ in lexical])
+    else:
+        dense = search(query, matrix, offsets, top_k=n_candidates, candidates=candidates)
+    shortlist = [i for i, _ in fuse(lexical, dense, fusion, alpha)[:max(rerank_k, top_k)]]
+    return rerank(query, shortlist, get_vectors, top_k, mode, gap, band)
+
+
+# --- Index of an embedding store ---
+def _segments(directory):
+    segments = []
+    for path in glob.glob(os.path.join(directory, "seg-*")):
+        match = SEGMENT_NAME.search(os.path.basename(path))
+        if match and os.path.isdir(path):
+            segments.append((int(match.group(1)), int(match.group(2)), path))
+    return sorted(segments)
+
+
+def _segment_path(directory, start, end):
+    return os.path.join(directory, f"seg-{start:09d}-{end:09d}")
+
+
+@tracing.traced("lexical.update")
+def update_lexical_index(store, max_segments=MAX_SEGMENTS):
+    """
+    Brings <store>/lexical up to date with the store: drops segments past
+    the store's end and indexes the entries added since as a new segment.
+    Returns the number of protocols indexed.
+    """
+    directory = os.path.join(store.path, LEXICAL_DIR)
+    os.makedirs(directory, exist_ok=True)
+    covered = 0
+    for start, end, path in _segments(directory):
+        if end > len(store) or start != covered:
+            shutil.rmtree(path)
+        else:
+            covered = end
+    if covered >= len(store):
+        return 0
+    segment = Segment.build([protocol_tokens(protocol) for protocol in store.iter_protocols(covered)], covered)
+    segment.save(_segment_path(directory, covered, len(store)))
+    if len(_segments(directory)) > max_segments:
+        compact_lexical_index(store)
+    return len(store) - covered
+
+
+def compact_lexical_index(store):
+    """Merges the segments of <store>/lexical into one."""
+    directory = os.path.join(store.path, LEXICAL_DIR)
+    segments = _segments(directory)
+    if len(segments) <= 1:
+        return
+    merged = Segment.merge([Segment.load(path, start) for start, _, path in segments])
+    # Written under a name no segment has, then swapped in
+    merged.save(os.path.join(directory, "merged"))
+    for _, _, path in segments:
+        shutil.rmtree(path)
+    os.replace(os.path.join(directory, "merged"), _segment_path(directory, segments[0][0], segments[-1][1]))
+
+
+def load_lexical_index(store_path):
+    return LexicalIndex.load(os.path.join(store_path, LEXICAL_DIR))
+
+
+def main(argv=None):
+    from backend.store import EmbeddingStore
+
+    parser = argparse.ArgumentParser(description="Build or query the BM25 index of an embedding store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Index the store's protocols not indexed yet")
+    build_parser.add_argument("store")
+    build_parser.add_argument("--compact", action="store_true", help="Merge all segments into one")
+    query_parser = subparsers.add_parser("query", help="Lexical search for a text")
+    query_parser.add_argument("store")
+    query_parser.add_argument("text")
+    query_parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    store = EmbeddingStore.open(args.store)
+    if args.command == "build":
+        added = update_lexical_index(store)
+        if args.compact:
+            compact_lexical_index(store)
+        index = load_lexical_index(args.store)
+        print(f"Indexed {added} protocols; {len(index)} protocols in {len(index.segments)} segment(s)")
+    else:
+        index = load_lexical_index(args.store)
+        for i, score in index.search(tokenize(args.text), args.k):
+            print(f"{score:8.3f}  {i:>7}  {store.doi(i)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import argparse
+import glob
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from backend.cache import content_hash
+
+# Local stand-in for the OpenAI chat completions endpoint, for load tests and
+# offline runs of the extraction pipeline:
+#   python -m backend.mock_llm --replay "papers/*_examples.json" --latency 0.5 --error-rate 0.05
+#   PROTOCOMPARE_LLM_BASE_URL=http://127.0.0.1:8765/v1 streamlit run frontend/protocompare_MS.py
+# Responses are replayed from recordings keyed by the user message; requests
+# can be delayed and failed with 500/429 errors at configurable rates.
+# Requests with "stream": true get server-sent events, one chunk of
+# chunk_chars characters every chunk_delay seconds.
+
+DEFAULT_PORT = 8765
+# Returned for prompts without a recording
+FALLBACK_RESPONSE = json.dumps([{
+    "step_number": 1, "step_type": "mixing", "input": "sample", "output": "mixture",
+    "action": "mix", "parameter": {"time": "10 min"},
+}])
+
+
+def load_recordings(patterns):
+    """
+    Reads recordings from JSON/JSONL files: either {"prompt", "response"}
+    records or {text, protocol} records as in papers/*_examples.json (the
+    protocol becomes the response to its text). Returns {prompt hash: response}.
+    """
+    recordings = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "r", encoding="utf-8") as f:
+                if path.endswith(".jsonl"):
+                    records = [json.loads(line) for line in f if line.strip()]
+                else:
+                    records = json.load(f)
+            for record in records if isinstance(records, list) else [records]:
+                if not isinstance(record, dict):
+                    continue
+                if "prompt" in record and "response" in record:
+                    recordings[content_hash(record["prompt"])] = record["response"]
+                elif record.get("text") and record.get("protocol"):
+                    recordings[content_hash(record["text"])] = json.dumps(record["protocol"], ensure_ascii=False)
+    return recordings
+
+
+class MockLLMServer:
+    """
+    Threaded HTTP server answering POST .../chat/completions.
+
+    latency: base delay per request (time to first token when streaming) in
+        seconds, plus uniform(0, jitter).
+    chunk_chars, chunk_delay: size of and delay between streamed chunks.
+    error_rate: fraction of requests answered with HTTP 500.
+    rate_limit_rate: fraction of requests answered with HTTP 429.
+    Counters are available from stats() and GET /stats.
+    """
+
+    def __init__(self, recordings=None, host="127.0.0.1", port=DEFAULT_PORT, latency=0.0, jitter=0.0,
+                 error_rate=0.0, rate_limit_rate=0.0, chunk_chars=16, chunk_delay=0.0, seed=None):
+        self.recordings = recordings or {}
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "replayed": 0, "fallback": 0, "errors": 0, "rate_limited": 0}
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _outcome(self):
+        """Returns (delay, status) for the next request."""
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            roll = self._random.random()
+        if roll < self.error_rate:
+            return delay, 500
+        if roll < self.error_rate + self.rate_limit_rate:
+            return delay, 429
+        return delay, 200
+
+    def response_text(self, request):
+        """The recorded answer to a request's last user message (or the fallback)."""
+        messages = request.get("messages") or []
+        prompt = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        content = self.recordings.get(content_hash(prompt))
+        self._count("replayed" if content is not None else "fallback")
+        return FALLBACK_RESPONSE if content is None else content
+
+    def completion(self, request):
+        """Builds the chat.completion body for a request."""
+        content = self.response_text(request)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": self.usage(request, content),
+        }
+
+    @staticmethod
+    def usage(request, content):
+        """Rough token counts (4 characters per token)."""
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages") or []) // 4
+        completion_tokens = len(content) // 4
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 so clients can keep connections alive
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, request):
+                # Server-sent events over chunked transfer encoding, so the connection stays reusable
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                content = server.response_text(request)
+                base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion.chunk",
+                        "created": int(time.time()), "model": request.get("model", "mock")}
+                pieces = [content[i:i + server.chunk_chars] for i in range(0, len(content), server.chunk_chars)]
+                events = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": piece}
+                                               if i == 0 else {"content": piece}, "finish_reason": None}])
+                          for i, piece in enumerate(pieces)]
+                events.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    events.append(dict(base, choices=[], usage=server.usage(request, content)))
+                for i, event in enumerate(events):
+                    if i and server.chunk_delay:
+                        time.sleep(server.chunk_delay)
+                    self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/stats"):
+                    self._send_json(200, server.stats())
+                else:
+                    self._send_json(404, {"error": {"message": "Not found"}})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "Not found"}})
+                    return
+                server._count("requests")
+                delay, status = server._outcome()
+                time.sleep(delay)
+                if status == 500:
+                    server._count("errors")
+                    self._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+                elif status == 429:
+                    server._count("rate_limited")
+                    self._send_json(429, {"error": {"message": "Injected rate limit", "type": "rate_limit_error"}},
+                                    {"Retry-After": "0"})
+                elif request.get("stream"):
+                    self._send_stream(request)
+                else:
+                    self._send_json(200, server.completion(request))
+
+        return Handler
+
+    def start(self):
+        """Serves in a background thread; returns self."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI chat completions API.")
+    parser.add_argument("--replay", nargs="*", default=[],
+                        help="Recording files/globs: {prompt, response} JSONL or {text, protocol} JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="Base delay per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform random delay (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests failing with 429")
+    parser.add_argument("--chunk-chars", type=int, default=16, help="Characters per streamed chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Delay between streamed chunks (s)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    server = MockLLMServer(load_recordings(args.replay), args.host, args.port, args.latency, args.jitter,
+                           args.error_rate, args.rate_limit_rate, args.chunk_chars, args.chunk_delay, args.seed)
+    print(f"Serving {len(server.recordings)} recorded responses at {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
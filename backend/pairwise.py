@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from backend.cache import content_hash
+from backend.compare import normalize_rows
+
+# All-pairs protocol similarity. The normalized step matrices of all
+# protocols are stacked into one shared-memory block that worker processes
+# attach to (nothing is pickled per pair), and the upper triangle of protocol
+# blocks is cut into tiles of roughly equal step counts. Each tile is one
+# matrix multiply plus segmented max/sum reductions, which yields
+# compare(a, b)[0] and compare(b, a)[0] for every pair in the tile at once.
+
+MANIFEST_FILE = "manifest.json"
+
+# Set in each worker by _attach_shared
+_shared = {}
+
+
+def _stack(protocols):
+    """Returns (normalized stacked float32 matrix, int64 offsets) for a list of step matrices or a store."""
+    if hasattr(protocols, "matrix") and hasattr(protocols, "offsets"):
+        return normalize_rows(protocols.matrix), np.asarray(protocols.offsets, dtype=np.int64)
+    protocols = [np.asarray(p, dtype=np.float32) for p in protocols]
+    offsets = np.zeros(len(protocols) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in protocols], out=offsets[1:])
+    dim = next((p.shape[1] for p in protocols if p.ndim == 2), 0)
+    matrix = np.concatenate([p.reshape(-1, dim) for p in protocols]) if protocols else np.empty((0, dim))
+    return normalize_rows(matrix), offsets
+
+
+def _blocks(offsets, block_rows):
+    """Splits non-empty protocols into consecutive blocks of about block_rows steps each."""
+    sizes = np.diff(offsets)
+    blocks, current, rows = [], [], 0
+    for i in np.flatnonzero(sizes):
+        current.append(int(i))
+        rows += int(sizes[i])
+        if rows >= block_rows:
+            blocks.append(current)
+            current, rows = [], 0
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def _tile_scores(matrix, offsets, block_i, block_j):
+    """
+    Scores every pair between two blocks. Returns (S_ij, S_ji) where
+    S_ij[a, b] = compare(protocol a, protocol b)[0] for a in block_i, b in block_j.
+    """
+    def rows_of(block):
+        starts = offsets[block]
+        sizes = offsets[np.asarray(block) + 1] - starts
+        rows = np.concatenate([np.arange(s, s + n) for s, n in zip(starts, sizes)])
+        return rows, np.concatenate(([0], np.cumsum(sizes)[:-1])), sizes
+
+    rows_i, starts_i, sizes_i = rows_of(block_i)
+    rows_j, starts_j, sizes_j = rows_of(block_j)
+    sims = matrix[rows_i] @ matrix[rows_j].T
+    # For each protocol a in block i and each step of b: best match among a's steps; summed per b
+    s_ij = np.add.reduceat(np.maximum.reduceat(sims, starts_i, axis=0), starts_j, axis=1) / sizes_i[:, None]
+    s_ji = np.add.reduceat(np.maximum.reduceat(sims, starts_j, axis=1), starts_i, axis=0).T / sizes_j[:, None]
+    return s_ij.astype(np.float32), s_ji.astype(np.float32)
+
+
+def _attach_shared(name, shape, offsets):
+    shm = shared_memory.SharedMemory(name=name)
+    _shared["shm"] = shm  # keep a reference so the buffer stays mapped
+    _shared["matrix"] = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    _shared["offsets"] = offsets
+
+
+def _run_tile(tile, block_i, block_j):
+    return tile, _tile_scores(_shared["matrix"], _shared["offsets"], block_i, block_j)
+
+
+def _tile_path(checkpoint_dir, tile):
+    return os.path.join(checkpoint_dir, f"tile_{tile[0]}_{tile[1]}.npz")
+
+
+def _prepare_checkpoints(checkpoint_dir, offsets, blocks):
+    """Creates the checkpoint directory, refusing to mix tiles from a different input."""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    manifest = {"offsets": content_hash(offsets.tobytes()), "blocks": blocks}
+    manifest_path = os.path.join(checkpoint_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            if json.load(f) != manifest:
+                raise ValueError(f"Checkpoints in {checkpoint_dir} were made for a different input or tiling")
+    else:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+
+def pairwise_matrix(protocols, workers=None, threshold=None, block_rows=2048, checkpoint_dir=None, progress=None):
+    """
+    Full N x N matrix with entry [a, b] = compare(protocols[a], protocols[b])[0].
+
+    protocols is a list of (n_steps, dim) arrays or an EmbeddingStore.
+    workers: number of processes (default: all CPUs; 1 runs in-process).
+    threshold: if given, returns a scipy.sparse CSR matrix holding only scores >= threshold.
+    block_rows: steps per block; a tile multiplies two blocks (block_rows^2 floats).
+    checkpoint_dir: finished tiles are saved there and skipped when re-run.
+    progress: optional callable(done_tiles, total_tiles).
+    Protocols without steps score 0 against everything.
+    """
+    matrix, offsets = _stack(protocols)
+    n = len(offsets) - 1
+    blocks = _blocks(offsets, block_rows)
+    tiles = [(i, j) for i in range(len(blocks)) for j in range(i, len(blocks))]
+    if checkpoint_dir is not None:
+        _prepare_checkpoints(checkpoint_dir, offsets, blocks)
+
+    rows, cols, values = [], [], []
+    dense = np.zeros((n, n), dtype=np.float32) if threshold is None else None
+
+    def collect(tile, scores):
+        s_ij, s_ji = scores
+        block_i, block_j = np.asarray(blocks[tile[0]]), np.asarray(blocks[tile[1]])
+        # A diagonal tile's s_ji is just s_ij transposed; using both would duplicate sparse entries
+        parts = [(block_i, block_j, s_ij)] if tile[0] == tile[1] else \
+            [(block_i, block_j, s_ij), (block_j, block_i, s_ji)]
+        for a_block, b_block, block_scores in parts:
+            if dense is not None:
+                dense[np.ix_(a_block, b_block)] = block_scores
+            else:
+                a, b = np.nonzero(block_scores >= threshold)
+                rows.append(a_block[a])
+                cols.append(b_block[b])
+                values.append(block_scores[a, b])
+
+    pending, done = [], 0
+    for tile in tiles:
+        if checkpoint_dir is not None and os.path.exists(_tile_path(checkpoint_dir, tile)):
+            with np.load(_tile_path(checkpoint_dir, tile)) as saved:
+                collect(tile, (saved["s_ij"], saved["s_ji"]))
+            done += 1
+        else:
+            pending.append(tile)
+    if progress is not None:
+        progress(done, len(tiles))
+
+    def finish(tile, scores):
+        nonlocal done
+        if checkpoint_dir is not None:
+            tmp_path = _tile_path(checkpoint_dir, tile) + ".tmp.npz"
+            np.savez(tmp_path, s_ij=scores[0], s_ji=scores[1])
+            os.replace(tmp_path, _tile_path(checkpoint_dir, tile))
+        collect(tile, scores)
+        done += 1
+        if progress is not None:
+            progress(done, len(tiles))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(pending) <= 1:
+        for tile in pending:
+            finish(tile, _tile_scores(matrix, offsets, blocks[tile[0]], blocks[tile[1]]))
+    elif pending:
+        shape = matrix.shape
+        shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        try:
+            np.ndarray(shape, dtype=np.float32, buffer=shm.buf)[:] = matrix
+            del matrix
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared,
+                                     initargs=(shm.name, shape, offsets)) as pool:
+                futures = [pool.submit(_run_tile, tile, blocks[tile[0]], blocks[tile[1]]) for tile in pending]
+                for future in as_completed(futures):
+                    finish(*future.result())
+        finally:
+            shm.close()
+            shm.unlink()
+
+    if dense is not None:
+        return dense
+    from scipy.sparse import csr_matrix
+    if not values:
+        return csr_matrix((n, n), dtype=np.float32)
+    return csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n))
+
+
+def main(argv=None):
+    from backend.store import EmbeddingStore
+
+    parser = argparse.ArgumentParser(description="All-pairs similarity matrix of the protocols in an embedding store.")
+    parser.add_argument("store")
+    parser.add_argument("-o", "--output", required=True, help=".npy for a dense matrix, .npz for a sparse one")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threshold", type=float, default=None, help="Keep only scores >= threshold (sparse output)")
+    parser.add_argument("--block-rows", type=int, default=2048)
+    parser.add_argument("--checkpoint-dir", default=None, help="Save finished tiles here to resume interrupted runs")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+
+    def progress(done, total):
+        elapsed = time.perf_counter() - start
+        print(f"\r{done}/{total} tiles, {elapsed:.0f}s elapsed", end="", file=sys.stderr, flush=True)
+
+    result = pairwise_matrix(EmbeddingStore.open(args.store), args.workers, args.threshold,
+                             args.block_rows, args.checkpoint_dir, progress)
+    print(file=sys.stderr)
+    if args.threshold is None:
+        np.save(args.output, result)
+    else:
+        from scipy.sparse import save_npz
+        save_npz(args.output, result)
+
+
+if __name__ == "__main__":
+    main()
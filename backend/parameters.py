@@ -0,0 +1,295 @@
+import argparse
+import re
+import numpy as np
+
+# Parameter normalization: the free-text values of a step's `parameter` dict
+# ("180 °C", "4 h", "12,000 rpm", "0.45 μm", "100/150/200°C", "95 °C for 5 min")
+# are parsed once, when the step table is built (backend/table.py), into one
+# number per kind of quantity in a canonical unit. ParameterIndex answers
+# faceted queries over those columns and the step_type/action/material terms,
+# e.g. the protocols with a hydrothermal step at >= 150 °C for >= 2 h:
+#   index.protocols(step_type="hydrothermal treatment", temperature=">=150 °C", duration=">=2 h")
+# which search(..., candidates=...) then scores instead of the whole corpus.
+
+# kind: (step table column, canonical unit)
+QUANTITIES = {
+    "temperature": ("temperature_c", "°C"),
+    "duration": ("duration_s", "s"),
+    "speed": ("speed_rpm", "rpm"),
+    "force": ("force_g", "× g"),
+    "length": ("length_m", "m"),
+    "mass": ("mass_g", "g"),
+    "volume": ("volume_l", "L"),
+}
+# unit pattern: (kind, canonical value of 1 unit, or a function for offset scales)
+UNITS = [
+    (r"°\s?C|º\s?C|℃|oC|deg(?:rees?)?\s?C", ("temperature", 1.0)),
+    (r"°\s?F|º\s?F", ("temperature", lambda f: (f - 32) * 5 / 9)),
+    (r"K", ("temperature", lambda k: k - 273.15)),
+    (r"rpm|r\s?/\s?min|r\s?min(?:−1|-1|⁻¹)", ("speed", 1.0)),
+    (r"[×xX]\s?g|rcf|RCF", ("force", 1.0)),
+    (r"weeks?", ("duration", 604800.0)),
+    (r"days?|d", ("duration", 86400.0)),
+    (r"hours?|hrs?|h", ("duration", 3600.0)),
+    (r"minutes?|mins?", ("duration", 60.0)),
+    (r"seconds?|secs?|s", ("duration", 1.0)),
+    (r"km", ("length", 1e3)),
+    (r"cm", ("length", 1e-2)),
+    (r"mm", ("length", 1e-3)),
+    (r"[μµu]m", ("length", 1e-6)),
+    (r"nm", ("length", 1e-9)),
+    (r"m", ("length", 1.0)),
+    (r"kg", ("mass", 1e3)),
+    (r"mg", ("mass", 1e-3)),
+    (r"[μµu]g", ("mass", 1e-6)),
+    (r"grams?|g", ("mass", 1.0)),
+    (r"m[lL]", ("volume", 1e-3)),
+    (r"[μµu][lL]", ("volume", 1e-6)),
+    (r"lit(?:er|re)s?|L|l", ("volume", 1.0)),
+]
+NUMBER = r"[-−]?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?"
+# A number, or a range/list of numbers sharing one unit ("3–7 min", "100/150/200°C", "-9 to -12ºC"),
+# an optional "± error", then the unit. A unit followed by "/" is a rate or concentration ("4 °C/min", "2.5 mg/mL").
+QUANTITY = re.compile(
+    rf"(?<![\w.,]){NUMBER}(?:\s*(?:-|–|—|~|/|to|or|and)\s*{NUMBER})*(?:\s*±\s*{NUMBER})?\s*-?\s*"
+    rf"(?P<unit>{'|'.join(f'(?:{pattern})' for pattern, _ in UNITS)})(?![\w²³/]|\s*/)"
+)
+NUMBERS = re.compile(rf"(?<![\w.,]){NUMBER}")
+UNIT_PATTERNS = [(re.compile(rf"(?:{pattern})$"), unit) for pattern, unit in UNITS]
+ROOM_TEMPERATURE = re.compile(r"\b(?:room|ambient) temperature\b", re.IGNORECASE)
+ROOM_TEMPERATURE_C = 25.0
+# Bare numbers ("13,250") count when the parameter name says what they are
+KEY_HINTS = [(re.compile(r"rcf|force", re.IGNORECASE), ("force", 1.0)),
+             (re.compile(r"rpm", re.IGNORECASE), ("speed", 1.0))]
+FORCE_KEY = re.compile(r"rcf|force|speed|centrifug", re.IGNORECASE)
+CONDITION = re.compile(r"^\s*(>=|≥|>|<=|≤|<)?\s*(.*?)\s*$")
+TERM_FIELDS = ("step_type", "action", "material")
+
+
+def _number(text):
+    return float(text.replace(",", "").replace("−", "-"))
+
+
+def _unit(unit_text, key=""):
+    for pattern, unit in UNIT_PATTERNS:
+        if pattern.match(unit_text):
+            # "10,000 g" under a speed/force parameter is a centrifugal force, not a mass
+            if unit == ("mass", 1.0) and FORCE_KEY.search(key):
+                return "force", 1.0
+            return unit
+    return None
+
+
+def parse_quantities(text, key=""):
+    """
+    (kind, value) pairs of every quantity in a parameter value, in canonical
+    units (see QUANTITIES); a range or list gives one pair per number. key is
+    the parameter name, used for unitless values ("rcf": "13,250").
+    """
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        text = str(text)
+    if not isinstance(text, str):
+        return []
+    quantities = []
+    for match in QUANTITY.finditer(text):
+        kind, scale = _unit(match.group("unit"), key)
+        numbers = NUMBERS.findall(match.group(0)[:match.start("unit") - match.start()].split("±")[0])
+        quantities.extend((kind, scale(_number(n)) if callable(scale) else _number(n) * scale) for n in numbers)
+    if ROOM_TEMPERATURE.search(text):
+        quantities.append(("temperature", ROOM_TEMPERATURE_C))
+    if not quantities:
+        for hint, (kind, scale) in KEY_HINTS:
+            if hint.search(key):
+                quantities.extend((kind, _number(n) * scale) for n in NUMBERS.findall(text))
+                break
+    return quantities
+
+
+def normalize_parameters(parameter):
+    """
+    {kind: value} of a step's parameter dict (nested dicts and lists
+    included). Where a step gives several values of one kind (a range, or
+    "temperature_1"/"temperature_2") the highest is kept.
+    """
+    values = {}
+
+    def visit(value, key):
+        if isinstance(value, dict):
+            for child_key, child in value.items():
+                visit(child, str(child_key))
+        elif isinstance(value, list):
+            for child in value:
+                visit(child, key)
+        else:
+            for kind, number in parse_quantities(value, key):
+                values[kind] = max(values.get(kind, number), number)
+
+    visit(parameter, "")
+    return values
+
+
+def parse_materials(text):
+    """
+    Material names in a step's input ("2.0 g of O. basilicum L. seed, 100 mL
+    distilled water" -> ["o. basilicum l. seed", "distilled water"]),
+    lower-cased, without amounts.
+    """
+    if isinstance(text, list):
+        text = ", ".join(map(str, text))
+    if not isinstance(text, str):
+        return []
+    text = re.sub(r"\([^)]*\)", " ", text)
+    materials = []
+    for part in re.split(r"[,;+]|\band\b", text):
+        part = QUANTITY.sub(" ", part)
+        part = re.sub(r"^\s*(?:of\b)?", "", part)
+        part = " ".join(part.lower().split())
+        if part:
+            materials.append(part)
+    return materials
+
+
+def parse_condition(kind, condition):
+    """
+    (low, high) bounds in canonical units of a condition on one kind of
+    quantity: a (low, high) tuple (None for open) or text such as
+    ">=150 °C", "< 30 min", "150-200 °C" or "180 °C" (exactly).
+    ">"/"<" are treated as ">="/"<=".
+    """
+    if kind not in QUANTITIES:
+        raise ValueError(f"Unknown quantity {kind!r}; choose one of {', '.join(QUANTITIES)}")
+    if not isinstance(condition, str):
+        low, high = condition
+        return (-np.inf if low is None else float(low)), (np.inf if high is None else float(high))
+    operator, value = CONDITION.match(condition).groups()
+    quantities = parse_quantities(value)
+    if not quantities:
+        numbers = NUMBERS.findall(value)
+        if not numbers:
+            raise ValueError(f"No quantity in condition {condition!r}")
+        quantities = [(kind, _number(n)) for n in numbers]
+    kinds = {k for k, _ in quantities}
+    if kinds != {kind}:
+        raise ValueError(f"Condition {condition!r} is not a {kind} (in {QUANTITIES[kind][1]})")
+    numbers = [number for _, number in quantities]
+    if operator in (">=", "≥", ">"):
+        return min(numbers), np.inf
+    if operator in ("<=", "≤", "<"):
+        return -np.inf, max(numbers)
+    return min(numbers), max(numbers)
+
+
+def _postings(terms, rows):
+    """{term: sorted step rows} from parallel arrays of terms and rows."""
+    terms, rows = np.asarray(terms, dtype=object), np.asarray(rows, dtype=np.int64)
+    if len(terms) == 0:
+        return {}
+    vocabulary, codes = np.unique(terms, return_inverse=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(vocabulary)))])
+    return {term: np.unique(rows[order[bounds[i]:bounds[i + 1]]]) for i, term in enumerate(vocabulary)}
+
+
+class ParameterIndex:
+    """
+    Facet index over the steps of a step table. Each numeric column keeps the
+    step rows sorted by value, so a range is two binary searches; step_type,
+    action and material terms (lower-cased) map to posting lists of step rows.
+    A query ANDs one boolean mask per condition over all steps.
+    n_protocols is the number of store entries the table covered.
+    """
+
+    def __init__(self, protocol_ids, numeric, postings, n_protocols=None):
+        self.protocol_ids = np.asarray(protocol_ids, dtype=np.int64)
+        self.numeric = numeric
+        self.postings = postings
+        self.n_protocols = n_protocols
+
+    @classmethod
+    def from_table(cls, table, n_protocols=None):
+        import pyarrow.compute as pc
+
+        numeric = {}
+        for kind, (column, _) in QUANTITIES.items():
+            values = table[column].to_numpy(zero_copy_only=False).astype(np.float64)
+            rows = np.flatnonzero(~np.isnan(values))
+            order = rows[np.argsort(values[rows], kind="stable")]
+            numeric[kind] = (values[order], order)
+        postings = {}
+        for field in ("step_type", "action"):
+            terms = pc.utf8_lower(table[field].cast("string")).to_numpy(zero_copy_only=False)
+            rows = np.flatnonzero([term is not None for term in terms])
+            postings[field] = _postings(terms[rows], rows)
+        materials = table["materials"].combine_chunks()
+        postings["material"] = _postings(pc.list_flatten(materials).to_numpy(zero_copy_only=False),
+                                         pc.list_parent_indices(materials).to_numpy())
+        return cls(table["protocol"].to_numpy(), numeric, postings, n_protocols)
+
+    @classmethod
+    def load(cls, store_path):
+        """Index of the step table of the store at store_path (see backend/table.py)."""
+        from backend.table import covered_protocols, load_step_table
+
+        columns = ["protocol", "step_type", "action", "materials"] + [column for column, _ in QUANTITIES.values()]
+        return cls.from_table(load_step_table(store_path, columns), covered_protocols(store_path))
+
+    def __len__(self):
+        return len(self.protocol_ids)
+
+    def _term_rows(self, field, value):
+        postings = self.postings[field]
+        values = [value] if isinstance(value, str) else list(value)
+        if field == "material":
+            # Materials match by substring ("water" finds "distilled water"); the vocabulary is far smaller than the steps
+            terms = [term for term in postings if any(v.lower() in term for v in values)]
+        else:
+            terms = [v.lower() for v in values]
+        rows = [postings[term] for term in terms if term in postings]
+        return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+    def steps(self, **conditions):
+        """
+        Boolean mask of the steps meeting every condition: step_type, action
+        or material (a term or list of terms, any of which matches) and
+        QUANTITIES kinds (see parse_condition).
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, condition in conditions.items():
+            if name in TERM_FIELDS:
+                rows = self._term_rows(name, condition)
+            else:
+                low, high = parse_condition(name, condition)
+                values, order = self.numeric[name]
+                rows = order[np.searchsorted(values, low, "left"):np.searchsorted(values, high, "right")]
+            condition_mask = np.zeros(len(self), dtype=bool)
+            condition_mask[rows] = True
+            mask &= condition_mask
+        return mask
+
+    def protocols(self, **conditions):
+        """Sorted ids of the protocols with at least one step meeting every condition."""
+        return np.unique(self.protocol_ids[self.steps(**conditions)])
+
+
+def parse_where(items):
+    """Conditions from "name=value" strings, e.g. ["step_type=heating", "temperature=>=150 °C"]."""
+    conditions = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        conditions[name.strip()] = value.strip()
+    return conditions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count the protocols of a store whose steps meet parameter conditions.")
+    parser.add_argument("store", help="Embedding store directory with a step table")
+    parser.add_argument("where", nargs="+", help='Conditions such as step_type=heating "temperature=>=150 °C"')
+    args = parser.parse_args(argv)
+    index = ParameterIndex.load(args.store)
+    protocols = index.protocols(**parse_where(args.where))
+    print(f"{len(protocols)} protocols match ({int(index.steps(**parse_where(args.where)).sum())} steps)")
+    print(" ".join(map(str, protocols[:50])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import re
+from backend.documents import METHODS_HEADING, SECTION_AFTER_METHODS
+
+# Local pre-filter for protocol extraction: scores paragraphs for procedural
+# content with cheap lexical cues (quantities with units, temperatures, times,
+# lab verbs) so that only the relevant span of a paper is sent to the LLM,
+# and splits what is left into chunks that can be extracted concurrently.
+
+# Documents shorter than this are sent whole
+PREFILTER_MIN_CHARS = 4000
+# Chunk size for extraction (~3k tokens)
+CHUNK_CHARS = 12000
+# Paragraphs longer than this are split at sentence boundaries before scoring
+MAX_PARAGRAPH_CHARS = 1500
+# Cues per 100 words needed to keep a paragraph
+SCORE_THRESHOLD = 4.0
+# Paragraphs inside an experimental/methods section get this many extra points
+METHODS_BONUS = 4.0
+
+QUANTITY = re.compile(
+    r"\d(?:[\d.,]*\d)?\s*(?:[µμu]?[lL]|m[lL]|[mµμun]?g|kg|[mµμun]?mol|[mµμun]?M|wt\s?%|v/v|w/v|%|"
+    r"rpm|x\s?g|[mµμun]?m|Å|h|hr|hrs|hours?|min|mins|minutes?|s|sec|seconds?|days?|overnight|bar|atm|psi|"
+    r"W|kW|V|mA|Hz|kDa|eq|equiv)(?![A-Za-z])")
+TEMPERATURE = re.compile(r"\d\s*(?:°|º|˚)\s*[CF]|\d\s*K\b|room temperature|\bice[- ]bath\b|\breflux", re.IGNORECASE)
+PROCEDURAL_VERB = re.compile(
+    r"\b(?:add|stirr?|heat|cool|centrifug|filter|filtrat|wash|rins|dr(?:y|ied)|dissolv|mix|sonicat|reflux|"
+    r"calcin|anneal|dispers|purif|evaporat|concentrat|dilut|incubat|autoclav|dialy[sz]|lyophili[sz]|"
+    r"freeze-dr|transferr?|collect|separat|extract|precipitat|quench|titrat|adjust|degass|purg|seal|"
+    r"pour|decant|grind|ground|pipett|vortex|shak|immers|soak|treat|react|prepar|synthesi[sz]|"
+    r"load|elut|spin|pellet|resuspend|aliquot)\w*", re.IGNORECASE)
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(])")
+
+
+def split_paragraphs(text, max_chars=MAX_PARAGRAPH_CHARS):
+    """Splits text at blank lines; overly long blocks (e.g. PDF pages) are cut into sentence groups."""
+    paragraphs = []
+    for block in PARAGRAPH_BREAK.split(text):
+        block = block.strip()
+        if not block:
+            continue
+        if len(block) <= max_chars:
+            paragraphs.append(block)
+            continue
+        current = ""
+        for sentence in SENTENCE_END.split(block):
+            if current and len(current) + len(sentence) + 1 > max_chars:
+                paragraphs.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            paragraphs.append(current)
+    return paragraphs
+
+
+def procedural_score(paragraph) -> float:
+    """Procedural cues (quantities, temperatures, lab verbs) per 100 words."""
+    words = len(paragraph.split())
+    if words == 0:
+        return 0.0
+    cues = (len(QUANTITY.findall(paragraph)) + len(TEMPERATURE.findall(paragraph))
+            + len(PROCEDURAL_VERB.findall(paragraph)))
+    return 100.0 * cues / words
+
+
+def score_paragraphs(paragraphs):
+    """procedural_score of every paragraph, plus METHODS_BONUS inside an experimental/methods section."""
+    scores = []
+    in_methods = False
+    for paragraph in paragraphs:
+        if METHODS_HEADING.search(paragraph):
+            in_methods = True
+        elif SECTION_AFTER_METHODS.search(paragraph):
+            in_methods = False
+        scores.append(procedural_score(paragraph) + (METHODS_BONUS if in_methods else 0.0))
+    return scores
+
+
+def select_procedural_text(text, threshold=SCORE_THRESHOLD, context=1, min_chars=PREFILTER_MIN_CHARS):
+    """
+    Keeps the paragraphs that score at least threshold, plus `context`
+    neighbouring paragraphs on each side, in document order. Short texts,
+    and texts where nothing scores high enough, are returned unchanged.
+    """
+    if len(text) < min_chars:
+        return text
+    paragraphs = split_paragraphs(text)
+    scores = score_paragraphs(paragraphs)
+    keep = [False] * len(paragraphs)
+    for i, score in enumerate(scores):
+        if score >= threshold:
+            for j in range(max(0, i - context), min(len(paragraphs), i + context + 1)):
+                keep[j] = True
+    if not any(keep):
+        return text
+    return "\n\n".join(paragraph for paragraph, kept in zip(paragraphs, keep) if kept)
+
+
+def chunk_text(text, max_chars=CHUNK_CHARS):
+    """Splits text into chunks of at most about max_chars, on paragraph boundaries."""
+    if len(text) <= max_chars:
+        return [text]
+    chunks, current = [], ""
+    for paragraph in split_paragraphs(text, max_chars):
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,150 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from backend import tracing
+from backend.encoders import configured_encoder
+
+# In-process micro-batching for embedding requests. Concurrent callers (app
+# sessions, API requests) each submit a few step strings; a single worker
+# thread gathers them into one batch and runs one encoder call for all of
+# them, instead of every caller contending for the CPU with its own small
+# model.encode call.
+
+MAX_BATCH_STEPS = 256
+MAX_BATCH_DELAY = 0.01
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+class EmbeddingScheduler:
+    """
+    Queues step strings from concurrent callers and encodes them in batches.
+
+    A batch is flushed when it holds max_steps strings or max_delay seconds
+    after its first request arrived, whichever comes first. submit() returns
+    a Future resolving to that request's float32 (n, dim) rows; embed()
+    waits for it. encoder and use_cache are passed on to encode_steps.
+    """
+
+    def __init__(self, encoder=None, max_steps=MAX_BATCH_STEPS, max_delay=MAX_BATCH_DELAY, use_cache=True):
+        self.encoder = encoder
+        self.max_steps = max_steps
+        self.max_delay = max_delay
+        self.use_cache = use_cache
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._stats = {"requests": 0, "batches": 0, "steps": 0}
+
+    def submit(self, texts):
+        future = Future()
+        texts = list(texts)
+        with self._lock:
+            # Checked and queued under the lock close() takes, so nothing is queued behind the stop sentinel
+            if self._closed:
+                raise RuntimeError("Cannot submit to a closed EmbeddingScheduler")
+            self._stats["requests"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-scheduler", daemon=True)
+                self._thread.start()
+            # The batch's encoder call is traced under the span of the request that opened it
+            self._queue.put((texts, future, tracing.current_span()))
+        return future
+
+    def embed(self, texts, timeout=None):
+        return self.submit(texts).result(timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["mean_batch_steps"] = stats["steps"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def close(self):
+        """Stops the worker once the requests already queued are done; later submits raise RuntimeError."""
+        with self._lock:
+            self._closed = True
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def _next_batch(self):
+        """Blocks for the first request, then gathers more until the batch is full or its deadline passes."""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch, n_steps = [first], len(first[0])
+        deadline = time.monotonic() + self.max_delay
+        while n_steps < self.max_steps:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(request)
+            n_steps += len(request[0])
+        return batch
+
+    def _run(self):
+        from backend.vectorized import encode_steps
+
+        batch = []
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                parent = batch[0][2]
+                batch = [(texts, future) for texts, future, _ in batch if future.set_running_or_notify_cancel()]
+                texts = [text for request_texts, _ in batch for text in request_texts]
+                try:
+                    with tracing.use_span(parent):
+                        vectors = encode_steps(texts, use_cache=self.use_cache, encoder=self.encoder)
+                except Exception as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+                with self._lock:
+                    self._stats["batches"] += 1
+                    self._stats["steps"] += len(texts)
+                start = 0
+                for request_texts, future in batch:
+                    future.set_result(vectors[start:start + len(request_texts)])
+                    start += len(request_texts)
+        finally:
+            # However the worker ends (even on a BaseException), no caller is left waiting:
+            # fail the batch in hand and everything still queued
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                pending = [request[1] for request in batch or []]
+                while True:
+                    try:
+                        request = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if request is not None:
+                        pending.append(request[1])
+            for future in pending:
+                if not future.done():
+                    future.set_exception(RuntimeError("The embedding scheduler stopped before this request ran"))
+
+
+def get_scheduler(encoder=None):
+    """Shared scheduler for an encoder (the configured one by default)."""
+    name = encoder or configured_encoder()
+    with _schedulers_lock:
+        if name not in _schedulers:
+            _schedulers[name] = EmbeddingScheduler(name)
+        return _schedulers[name]
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel
+
+from backend import tracing
+from backend.compare import SCORING_MODES, compare, rerank, search
+from backend.lexical import FUSIONS, LEXICAL_DIR, hybrid_search, load_lexical_index
+from backend.scheduler import MAX_BATCH_DELAY, MAX_BATCH_STEPS, EmbeddingScheduler
+from backend.table import STEPS_DIR
+from backend.vectorized import encoder_name, extract_and_format_steps, get_encoder
+
+# Headless HTTP API around the pipeline, holding one warm encoder, the
+# embedding store and, where built, the ANN index, the parameter index of
+# the store's step table and the BM25 index in memory:
+#   python -m backend.service --store frontend/store --port 8000
+#   uvicorn backend.service:app --workers 4
+# Concurrent /embed, /compare and /search requests share encoder calls
+# through an EmbeddingScheduler (backend.scheduler). The Streamlit app
+# becomes a thin client when PROTOCOMPARE_API_URL points at this service.
+
+DEFAULT_STORE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend", "store")
+LATENCY_WINDOW = 1000
+
+
+class Metrics:
+    """Request counts, errors and recent latencies per endpoint."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.started = time.time()
+        self.counts = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.latencies = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, path, seconds, failed):
+        self.counts[path] += 1
+        self.errors[path] += failed
+        self.latencies[path].append(seconds)
+
+    def report(self):
+        endpoints = {}
+        for path, latencies in self.latencies.items():
+            p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99]) if latencies else (0, 0, 0)
+            endpoints[path] = {"requests": self.counts[path], "errors": self.errors[path],
+                               "latency_ms": {"p50": float(p50), "p95": float(p95), "p99": float(p99)}}
+        return {"uptime_s": time.time() - self.started, "endpoints": endpoints}
+
+
+class ExtractRequest(BaseModel):
+    text: str
+
+
+class EmbedRequest(BaseModel):
+    protocols: List[Any]
+
+
+class CompareRequest(BaseModel):
+    protocol_a: Any
+    protocol_b: Any
+    mode: str = "greedy"
+    gap: float = 0.0
+    band: Optional[int] = None
+    return_alignment: bool = False
+
+
+class SearchRequest(BaseModel):
+    protocol: Any
+    top_k: int = 10
+    mode: str = "greedy"
+    gap: float = 0.0
+    band: Optional[int] = None
+    use_index: bool = True
+    include_protocols: bool = False
+    # Step conditions, e.g. {"step_type": "heating", "temperature": ">=150 °C"} (see backend.parameters)
+    where: Optional[Dict[str, Any]] = None
+    # BM25 candidates fused with dense scores, then re-scored (see backend.lexical.hybrid_search)
+    hybrid: bool = False
+    fusion: str = "rrf"
+
+
+def create_app(store_path=None, index_path=None, max_batch_steps=MAX_BATCH_STEPS, max_batch_delay=MAX_BATCH_DELAY):
+    """
+    Builds the API. store_path defaults to PROTOCOMPARE_STORE (or
+    frontend/store) and index_path to PROTOCOMPARE_ANN_INDEX (or the store's
+    "ann" directory). Without a store only /extract, /embed and /compare work.
+    """
+    from backend.store import EmbeddingStore
+
+    store_path = store_path or os.environ.get("PROTOCOMPARE_STORE", DEFAULT_STORE)
+    index_path = index_path or os.environ.get("PROTOCOMPARE_ANN_INDEX", os.path.join(store_path, "ann"))
+    state = {"store": None, "index": None, "parameters": None, "lexical": None}
+    scheduler = EmbeddingScheduler(max_steps=max_batch_steps, max_delay=max_batch_delay)
+    metrics = Metrics()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Load everything before the first request so no request pays for it
+        await asyncio.get_running_loop().run_in_executor(None, get_encoder)
+        if EmbeddingStore.exists(store_path):
+            store = EmbeddingStore.open(store_path)
+            if store.model_name != encoder_name():
+                raise ValueError(f"Store at {store_path} was built with {store.model_name}, not {encoder_name()}")
+            state["store"] = store
+            if os.path.exists(index_path):
+                from backend.ann import check_index, load_index
+                try:
+                    index = load_index(index_path)
+                    check_index(index, len(store))
+                    state["index"] = index
+                except ValueError as e:
+                    # A stale index would silently miss the protocols added since; search exactly instead
+                    print(f"Not using the ANN index at {index_path}: {e}")
+            if os.path.isdir(os.path.join(store_path, STEPS_DIR)):
+                from backend.parameters import ParameterIndex
+                parameters = ParameterIndex.load(store_path)
+                if parameters.n_protocols == len(store):
+                    state["parameters"] = parameters
+                else:
+                    # Filtering with it would silently drop every protocol added since
+                    print(f"Not using the step table at {os.path.join(store_path, STEPS_DIR)}: it covers "
+                          f"{parameters.n_protocols} of {len(store)} protocols (update it with python -m backend.table)")
+            if os.path.isdir(os.path.join(store_path, LEXICAL_DIR)):
+                lexical = load_lexical_index(store_path)
+                if len(lexical) == len(store):
+                    state["lexical"] = lexical
+                else:
+                    print(f"Not using the BM25 index at {os.path.join(store_path, LEXICAL_DIR)}: it covers "
+                          f"{len(lexical)} of {len(store)} protocols (rebuild it with python -m backend.lexical build)")
+        yield
+        await asyncio.get_running_loop().run_in_executor(None, scheduler.close)
+
+    app = FastAPI(title="Protocompare", lifespan=lifespan)
+
+    @app.middleware("http")
+    async def record_latency(request: Request, call_next):
+        start = time.perf_counter()
+        failed = True
+        try:
+            with tracing.span("http.request", method=request.method, path=request.url.path):
+                response = await call_next(request)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            metrics.record(request.url.path, time.perf_counter() - start, failed)
+
+    async def embed_protocol(protocol):
+        return await asyncio.wrap_future(scheduler.submit(extract_and_format_steps(protocol)))
+
+    def check_mode(mode):
+        if mode not in SCORING_MODES:
+            raise HTTPException(422, f"Unknown scoring mode {mode!r}; choose one of {', '.join(SCORING_MODES)}")
+
+    def require_steps(vectors, name):
+        if len(vectors) == 0:
+            raise HTTPException(422, f"{name} has no steps")
+        return vectors
+
+    @app.get("/health")
+    async def health():
+        store = state["store"]
+        return {
+            "status": "ok",
+            "encoder": encoder_name(),
+            "store_protocols": len(store) if store is not None else 0,
+            "store_steps": store.n_rows if store is not None else 0,
+            "index": state["index"] is not None,
+            "parameter_index": state["parameters"] is not None,
+            "lexical_index": state["lexical"] is not None,
+        }
+
+    @app.get("/metrics")
+    async def get_metrics():
+        report = metrics.report()
+        report["embedding_batches"] = scheduler.stats()
+        return report
+
+    @app.post("/extract")
+    async def extract(body: ExtractRequest):
+        from backend.data_extraction import extract_document_async
+        try:
+            return {"protocol": await extract_document_async(body.text)}
+        except ValueError as e:
+            raise HTTPException(422, str(e))
+
+    @app.post("/embed")
+    async def embed(body: EmbedRequest):
+        embedded = await asyncio.gather(*(embed_protocol(protocol) for protocol in body.protocols))
+        return {"encoder": encoder_name(), "embeddings": [vectors.tolist() for vectors in embedded]}
+
+    @app.post("/compare")
+    async def compare_protocols(body: CompareRequest):
+        check_mode(body.mode)
+        emb_a, emb_b = await asyncio.gather(embed_protocol(body.protocol_a), embed_protocol(body.protocol_b))
+        # Scoring is CPU-bound; running it in a worker thread keeps the event loop serving other requests
+        score, alignment, _ = await asyncio.to_thread(
+            compare, require_steps(emb_a, "protocol_a"), require_steps(emb_b, "protocol_b"), body.mode,
+            body.return_alignment, gap=body.gap, band=body.band)
+        return {"score": score, "alignment": alignment}
+
+    def filter_candidates(where):
+        if state["parameters"] is None:
+            raise HTTPException(503, f"No up-to-date step table at {os.path.join(store_path, STEPS_DIR)}")
+        try:
+            return state["parameters"].protocols(**where)
+        except (KeyError, TypeError, ValueError) as e:
+            raise HTTPException(422, f"Invalid condition: {e}")
+
+    def score_search(body, query, candidates):
+        store, index = state["store"], state["index"]
+        if body.hybrid:
+            results = hybrid_search(query, extract_and_format_steps(body.protocol), state["lexical"], store.matrix,
+                                    store.offsets, store.vectors, body.top_k, fusion=body.fusion, mode=body.mode,
+                                    gap=body.gap, band=body.band, candidates=candidates)
+        elif index is not None and body.use_index and candidates is None:
+            from backend.ann import ann_search
+            results = ann_search(index, query, store.vectors, body.top_k, mode=body.mode, gap=body.gap, band=body.band,
+                                 n_protocols=len(store))
+        else:
+            # A filtered search scores its (usually few) candidates exactly
+            results = search(query, store.matrix, store.offsets, top_k=body.top_k if body.mode == "greedy" else None,
+                             candidates=candidates)
+            if body.mode != "greedy":
+                results = rerank(query, [i for i, _ in results], store.vectors, body.top_k, body.mode,
+                                 body.gap, body.band)
+        return [dict({"index": i, "doi": store.doi(i), "score": score},
+                     **({"protocol": store.protocol(i)} if body.include_protocols else {}))
+                for i, score in results]
+
+    @app.post("/search")
+    async def search_store(body: SearchRequest):
+        check_mode(body.mode)
+        if state["store"] is None:
+            raise HTTPException(503, f"No embedding store at {store_path}")
+        if body.hybrid:
+            if state["lexical"] is None:
+                raise HTTPException(503, f"No BM25 index at {os.path.join(store_path, LEXICAL_DIR)}")
+            if body.fusion not in FUSIONS:
+                raise HTTPException(422, f"Unknown fusion {body.fusion!r}; choose one of {', '.join(FUSIONS)}")
+        candidates = await asyncio.to_thread(filter_candidates, body.where) if body.where else None
+        query = require_steps(await embed_protocol(body.protocol), "protocol")
+        return {"results": await asyncio.to_thread(score_search, body, query, candidates)}
+
+    return app
+
+
+def __getattr__(name):
+    # `uvicorn backend.service:app` builds the app from the environment on first access
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Protocompare HTTP API.")
+    parser.add_argument("--store", default=None, help="Embedding store directory (default: frontend/store)")
+    parser.add_argument("--index", default=None, help="ANN index directory (default: <store>/ann if present)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-steps", type=int, default=MAX_BATCH_STEPS)
+    parser.add_argument("--max-batch-delay", type=float, default=MAX_BATCH_DELAY, help="Seconds")
+    args = parser.parse_args(argv)
+    uvicorn.run(create_app(args.store, args.index, args.max_batch_steps, args.max_batch_delay),
+                host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import json
+import os
+import re
+import threading
+
+# Incremental parsing and validation of extracted protocol steps. The LLM
+# answers with a JSON list of step objects (possibly inside a ```json fence);
+# StepStreamParser is fed the streamed text and hands back each step object
+# as soon as its closing brace arrives, so steps can be shown and embedded
+# while the rest of the answer is still being generated.
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "papers", "protocol_schema.json")
+STRING_FIELDS = ("step_type", "input", "output", "action")
+
+# Characters that change the parser state; everything else is skipped in bulk
+_TOKENS = re.compile(r'[\\"\[\]{}]')
+_VALUE_START = re.compile(r"[\[{]")
+
+_validator = None
+_validator_lock = threading.Lock()
+
+
+class StepStreamParser:
+    """
+    Incremental scanner for a JSON list of step objects.
+
+    feed(text) returns the raw JSON text of every step object completed by
+    the new text. Anything before the first "[" or "{" (prose, code fences)
+    is ignored. If the answer is a single object rather than a list, that
+    object is returned as one step when it closes.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._offset = 0        # absolute position of _buffer[0] in the whole stream
+        self._pos = 0           # absolute position of the next character to scan
+        self._top = None        # "[" or "{" once the top-level value has started
+        self._depth = 0
+        self._in_string = False
+        self._skip = -1         # absolute position of a character escaped by a backslash
+        self._start = None      # absolute start of the step object being read
+        self.done = False
+
+    def feed(self, text):
+        steps = []
+        if self.done or not text:
+            return steps
+        self._buffer += text
+        if self._top is None:
+            match = _VALUE_START.search(self._buffer, self._pos - self._offset)
+            if match is None:
+                self._offset += len(self._buffer)
+                self._pos = self._offset
+                self._buffer = ""
+                return steps
+            self._top = match.group()
+            self._depth = 1
+            self._pos = self._offset + match.end()
+            if self._top == "{":
+                self._start = self._offset + match.start()
+
+        for match in _TOKENS.finditer(self._buffer, self._pos - self._offset):
+            position = self._offset + match.start()
+            char = match.group()
+            if position == self._skip:
+                continue
+            if self._in_string:
+                if char == "\\":
+                    self._skip = position + 1
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+                if char == "{" and self._top == "[" and self._depth == 2:
+                    self._start = position
+            else:
+                self._depth -= 1
+                if char == "}" and self._start is not None and self._depth == (1 if self._top == "[" else 0):
+                    steps.append(self._buffer[self._start - self._offset:position - self._offset + 1])
+                    self._start = None
+                if self._depth == 0:
+                    self.done = True
+                    break
+        self._pos = self._offset + len(self._buffer)
+        # Drop text that can no longer be part of a step
+        keep_from = self._start if self._start is not None else self._pos
+        self._buffer = self._buffer[keep_from - self._offset:]
+        self._offset = keep_from
+        return steps
+
+    def close(self):
+        """Raw text of a step that was still open when the stream ended (or None)."""
+        if self._start is None:
+            return None
+        return self._buffer[self._start - self._offset:]
+
+    @property
+    def started(self):
+        return self._top is not None
+
+
+def load_schema(path=SCHEMA_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _compile_schema(schema):
+    """Fallback validator for the subset of JSON schema used by protocol_schema.json."""
+    types = {"string": str, "integer": int, "number": (int, float), "boolean": bool, "object": dict, "array": list}
+
+    def type_check(spec):
+        names = spec.get("type")
+        if names is None:
+            return None
+        names = [names] if isinstance(names, str) else names
+        allowed = tuple(t for name in names for t in (types[name] if isinstance(types[name], tuple) else (types[name],)))
+        # bool is an int subclass; only accept it where boolean is allowed
+        return lambda value: isinstance(value, allowed) and (not isinstance(value, bool) or "boolean" in names)
+
+    required = schema.get("required", [])
+    properties = {name: (type_check(spec), type_check(spec.get("additionalProperties") or {}))
+                  for name, spec in schema.get("properties", {}).items()}
+
+    def validate(step):
+        if not isinstance(step, dict):
+            return ["step is not an object"]
+        errors = [f"missing {name!r}" for name in required if name not in step]
+        for name, (check, check_values) in properties.items():
+            if name not in step:
+                continue
+            if check is not None and not check(step[name]):
+                errors.append(f"{name!r} has the wrong type")
+            elif check_values is not None and isinstance(step[name], dict):
+                errors.extend(f"{name}.{key!r} has the wrong type"
+                              for key, value in step[name].items() if not check_values(value))
+        return errors
+
+    return validate
+
+
+def get_step_validator():
+    """
+    Validator compiled once from papers/protocol_schema.json: a function
+    returning the list of problems with a step (empty when valid). Uses
+    jsonschema's Draft 7 validator when it is installed.
+    """
+    global _validator
+    with _validator_lock:
+        if _validator is None:
+            schema = load_schema()
+            try:
+                from jsonschema import Draft7Validator
+            except ImportError:
+                _validator = _compile_schema(schema)
+            else:
+                Draft7Validator.check_schema(schema)
+                compiled = Draft7Validator(schema)
+                _validator = lambda step: [error.message for error in compiled.iter_errors(step)]
+        return _validator
+
+
+def repair_step(step, step_number):
+    """Coerces a parsed step towards the schema: missing strings become "", parameters a flat dict."""
+    step = dict(step)
+    step["step_number"] = step_number
+    for name in STRING_FIELDS:
+        value = step.get(name)
+        if value is None:
+            step[name] = ""
+        elif isinstance(value, list):
+            step[name] = ", ".join(str(item) for item in value)
+        elif not isinstance(value, str):
+            step[name] = str(value)
+    parameter = step.get("parameter")
+    if parameter is None:
+        parameter = {}
+    elif not isinstance(parameter, dict):
+        parameter = {"value": parameter}
+    step["parameter"] = {str(key): value if isinstance(value, (str, int, float, bool)) else json.dumps(value)
+                         for key, value in parameter.items()}
+    return step
+
+
+def steps_from_raw(raw):
+    """Parses one raw step object; a wrapper such as {"steps": [...]} gives its inner steps."""
+    value = json.loads(raw)
+    if isinstance(value, dict):
+        nested = [v for v in value.values() if isinstance(v, list) and v and all(isinstance(s, dict) for s in v)]
+        if len(nested) == 1 and "action" not in value:
+            return nested[0]
+        return [value]
+    raise ValueError("step is not a JSON object")
+
+
+def parse_steps(text):
+    """Raw step texts of a complete answer, plus the unfinished tail if the answer was cut off."""
+    parser = StepStreamParser()
+    raw_steps = parser.feed(text)
+    if not parser.started:
+        raise ValueError("No JSON found in the response")
+    return raw_steps, parser.close()
@@ -0,0 +1,278 @@
+import argparse
+import json
+import os
+import numpy as np
+from backend import tracing
+from backend.cache import content_hash
+from backend.compare import normalize_rows
+
+# On-disk layout of a store directory:
+#   index.json      - model name, dimension, dtype and one entry per protocol
+#                     (doi, content hash, byte position in protocols.jsonl)
+#   offsets.npy     - int64 row offsets, protocol i owns rows offsets[i]:offsets[i+1]
+#   vectors.bin     - all step vectors as one contiguous row-major matrix
+#   protocols.jsonl - one {"doi", "protocol"} record per line, read on demand
+INDEX_FILE = "index.json"
+OFFSETS_FILE = "offsets.npy"
+VECTORS_FILE = "vectors.bin"
+PROTOCOLS_FILE = "protocols.jsonl"
+FORMAT_VERSION = 1
+DEFAULT_MODEL = "all-mpnet-base-v2"
+
+
+def _atomic_write(path, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class EmbeddingStore:
+    """
+    Contiguous, memory-mapped matrix of L2-normalized step vectors.
+    Rows are only paged in when a query touches them, and protocol records
+    are read line by line from protocols.jsonl instead of parsing a whole
+    JSON database.
+    """
+
+    def __init__(self, path, index, offsets, writable=False):
+        self.path = path
+        self.writable = writable
+        self.model_name = index["model"]
+        self.dim = int(index["dim"])
+        self.dtype = np.dtype(index["dtype"])
+        self.entries = index["entries"]
+        self._offsets = offsets
+        self._pending_offsets = []
+        self._matrix = None
+        self._doi_lookup = None
+        self._hashes = None
+
+    # --- Opening / creating ---
+    @classmethod
+    def create(cls, path, dim, model_name=DEFAULT_MODEL, dtype="float32"):
+        """Creates an empty store directory (fails if one already exists)."""
+        if np.dtype(dtype) not in (np.float32, np.float16):
+            raise ValueError(f"Unsupported store dtype: {dtype}")
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            raise FileExistsError(f"An embedding store already exists at {path}")
+        os.makedirs(path, exist_ok=True)
+        open(os.path.join(path, VECTORS_FILE), "wb").close()
+        open(os.path.join(path, PROTOCOLS_FILE), "wb").close()
+        index = {
+            "version": FORMAT_VERSION,
+            "model": model_name,
+            "dim": int(dim),
+            "dtype": np.dtype(dtype).name,
+            "entries": [],
+        }
+        store = cls(path, index, np.zeros(1, dtype=np.int64), writable=True)
+        store.flush()
+        return store
+
+    @classmethod
+    @tracing.traced("store.open")
+    def open(cls, path, writable=False):
+        """
+        Opens a store for reading: bytes past the last flush (an append in
+        progress, or a crashed one) are ignored, never touched. Only the single
+        writer opens it with writable=True, which also discards such bytes so
+        new appends start where the flushed data ends.
+        """
+        with open(os.path.join(path, INDEX_FILE), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding store version: {index.get('version')}")
+        offsets = np.load(os.path.join(path, OFFSETS_FILE))
+        if len(offsets) != len(index["entries"]) + 1:
+            raise ValueError(f"Corrupt embedding store at {path}: offsets do not match index")
+        store = cls(path, index, offsets, writable)
+        if writable:
+            store._discard_unflushed(index.get("protocols_size", 0))
+        return store
+
+    def _discard_unflushed(self, protocols_size):
+        """Drops rows written after the last flushed index (e.g. a crash mid-append)."""
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        expected = self.n_rows * self.dim * self.dtype.itemsize
+        if os.path.getsize(vectors_path) > expected:
+            os.truncate(vectors_path, expected)
+        protocols_path = os.path.join(self.path, PROTOCOLS_FILE)
+        if os.path.getsize(protocols_path) > protocols_size:
+            os.truncate(protocols_path, protocols_size)
+
+    @classmethod
+    def exists(cls, path) -> bool:
+        return os.path.exists(os.path.join(path, INDEX_FILE))
+
+    # --- Reading ---
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def offsets(self):
+        """int64 row offsets: protocol i owns rows offsets[i]:offsets[i + 1]."""
+        if self._pending_offsets:
+            self._offsets = np.concatenate([self._offsets, np.asarray(self._pending_offsets, dtype=np.int64)])
+            self._pending_offsets = []
+        return self._offsets
+
+    @property
+    def n_rows(self) -> int:
+        if self._pending_offsets:
+            return int(self._pending_offsets[-1])
+        return int(self._offsets[-1])
+
+    @property
+    def matrix(self):
+        """(n_rows, dim) memory-mapped matrix of all step vectors."""
+        if self._matrix is None:
+            if self.n_rows == 0:
+                self._matrix = np.empty((0, self.dim), dtype=self.dtype)
+            else:
+                self._matrix = np.memmap(os.path.join(self.path, VECTORS_FILE), dtype=self.dtype,
+                                         mode="r", shape=(self.n_rows, self.dim))
+        return self._matrix
+
+    def vectors(self, i):
+        """Step vectors of protocol i as a float32 array."""
+        return np.asarray(self.matrix[self.offsets[i]:self.offsets[i + 1]], dtype=np.float32)
+
+    def doi(self, i) -> str:
+        return self.entries[i]["doi"]
+
+    def protocol(self, i):
+        """Reads the protocol record (list of step dicts) of entry i from disk."""
+        with open(os.path.join(self.path, PROTOCOLS_FILE), "rb") as f:
+            f.seek(self.entries[i]["pos"])
+            return json.loads(f.readline())["protocol"]
+
+    def iter_protocols(self, start=0, stop=None):
+        """Reads the protocol records of entries start..stop-1 in one sequential pass."""
+        stop = len(self.entries) if stop is None else stop
+        if start >= stop:
+            return
+        with open(os.path.join(self.path, PROTOCOLS_FILE), "rb") as f:
+            f.seek(self.entries[start]["pos"])
+            for _ in range(start, stop):
+                yield json.loads(f.readline())["protocol"]
+
+    def find(self, doi):
+        """Returns the indices of all entries with the given DOI."""
+        if self._doi_lookup is None:
+            self._doi_lookup = {}
+            for i, entry in enumerate(self.entries):
+                self._doi_lookup.setdefault(entry["doi"], []).append(i)
+        return self._doi_lookup.get(doi, [])
+
+    def has_hash(self, sha) -> bool:
+        if self._hashes is None:
+            self._hashes = {entry["sha"] for entry in self.entries}
+        return sha in self._hashes
+
+    # --- Writing ---
+    def append(self, doi, vectors, protocol=None, sha=None):
+        """
+        Appends one protocol's step vectors. The data is written immediately
+        but only becomes visible to other readers after flush().
+        """
+        if not self.writable:
+            raise ValueError(f"Embedding store at {self.path} was opened read-only")
+        vectors = np.asarray(vectors)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of shape (n, {self.dim}), got {vectors.shape}")
+        vectors = normalize_rows(vectors)
+        if sha is None:
+            sha = content_hash(protocol if protocol is not None else vectors.tobytes())
+
+        with open(os.path.join(self.path, VECTORS_FILE), "ab") as f:
+            f.write(vectors.astype(self.dtype).tobytes())
+        record = json.dumps({"doi": doi, "protocol": protocol}, ensure_ascii=False) + "\n"
+        protocols_path = os.path.join(self.path, PROTOCOLS_FILE)
+        with open(protocols_path, "ab") as f:
+            pos = f.tell()
+            f.write(record.encode("utf-8"))
+
+        self.entries.append({"doi": doi, "sha": sha, "pos": pos})
+        self._pending_offsets.append(self.n_rows + len(vectors))
+        self._matrix = None
+        if self._doi_lookup is not None:
+            self._doi_lookup.setdefault(doi, []).append(len(self.entries) - 1)
+        if self._hashes is not None:
+            self._hashes.add(sha)
+        return len(self.entries) - 1
+
+    def flush(self):
+        """Atomically publishes the offsets and index for everything appended so far."""
+        if not self.writable:
+            raise ValueError(f"Embedding store at {self.path} was opened read-only")
+        protocols_path = os.path.join(self.path, PROTOCOLS_FILE)
+        index = {
+            "version": FORMAT_VERSION,
+            "model": self.model_name,
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "protocols_size": os.path.getsize(protocols_path),
+            "entries": self.entries,
+        }
+        tmp_offsets = os.path.join(self.path, OFFSETS_FILE + ".tmp")
+        with open(tmp_offsets, "wb") as f:
+            np.save(f, self.offsets)
+        os.replace(tmp_offsets, os.path.join(self.path, OFFSETS_FILE))
+        _atomic_write(os.path.join(self.path, INDEX_FILE), json.dumps(index).encode("utf-8"))
+
+
+@tracing.traced("store.convert_json")
+def convert_json(json_paths, out_path, model_name=DEFAULT_MODEL, dtype="float32"):
+    """
+    One-shot conversion of JSON databases with an 'embedded_protocol' field
+    (e.g. frontend/database.json, papers/embedded_data.json) into a store.
+    Exact duplicates (same DOI and content) are only stored once, and
+    protocols missing from an embedded file are looked up by DOI in the others.
+    """
+    if isinstance(json_paths, str):
+        json_paths = [json_paths]
+    records = []
+    protocols_by_doi = {}
+    for json_path in json_paths:
+        with open(json_path, "r", encoding="utf-8") as f:
+            records.extend(json.load(f))
+    for record in records:
+        if record.get("protocol") is not None:
+            protocols_by_doi.setdefault(record["doi"], record["protocol"])
+
+    store = None
+    for record in records:
+        if not record.get("embedded_protocol"):
+            continue
+        vectors = np.asarray(record["embedded_protocol"], dtype=np.float32)
+        protocol = record.get("protocol", protocols_by_doi.get(record["doi"]))
+        sha = content_hash({"doi": record["doi"], "protocol": protocol,
+                            "vectors": content_hash(vectors.tobytes())})
+        if store is None:
+            store = EmbeddingStore.create(out_path, vectors.shape[1], model_name, dtype)
+        if store.has_hash(sha):
+            continue
+        store.append(record["doi"], vectors, protocol, sha=sha)
+    if store is None:
+        raise ValueError("No embedded protocols found in " + ", ".join(json_paths))
+    store.flush()
+    return store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert JSON protocol databases into a binary embedding store.")
+    parser.add_argument("inputs", nargs="+", help="JSON files containing 'embedded_protocol' entries")
+    parser.add_argument("-o", "--output", required=True, help="Output store directory")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Name of the model that produced the vectors")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    args = parser.parse_args(argv)
+
+    store = convert_json(args.inputs, args.output, args.model, args.dtype)
+    print(f"Wrote {len(store)} protocols ({store.n_rows} steps, dim {store.dim}, {store.dtype.name}) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
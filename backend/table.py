@@ -0,0 +1,298 @@
+import argparse
+import glob
+import os
+import re
+import numpy as np
+from backend import tracing
+from backend.parameters import QUANTITIES, normalize_parameters, parse_materials
+
+# Columnar table of every protocol step (one row per step), kept next to the
+# embedding store as Parquet:
+#   <store>/steps/part-<first protocol>-<end protocol>.parquet
+# Columns: row_id (the step's row in the store's vector matrix, null for
+# steps without a vector), protocol (store entry index), doi, step_number,
+# step_type, action, input, output and parameter (map of strings), plus the
+# parameters parsed into canonical units (temperature_c, duration_s, ...; see
+# backend/parameters.py) and the input materials.
+# Repeated strings (doi, step_type, action) are dictionary-encoded. Filters,
+# counts and UI tables run as Arrow column operations instead of loops over
+# step dicts. pyarrow is an optional dependency, imported on first use.
+#   python -m backend.table frontend/store --compact
+
+STEPS_DIR = "steps"
+PART_NAME = re.compile(r"part-(\d+)-(\d+)\.parquet$")
+# ingest adds one part per batch; beyond this many they are merged into one
+MAX_PARTS = 32
+COMPRESSION = "zstd"
+# Column names of the per-protocol tables shown in the app
+FRAME_COLUMNS = {
+    "step_number": "Step Number",
+    "step_type": "Type",
+    "input": "Input",
+    "output": "Output",
+    "action": "Action",
+    "parameter": "Parameters",
+}
+
+
+def step_schema():
+    import pyarrow as pa
+
+    dictionary_string = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("row_id", pa.int64()),
+        ("protocol", pa.int32()),
+        ("doi", dictionary_string),
+        ("step_number", pa.int32()),
+        ("step_type", dictionary_string),
+        ("action", dictionary_string),
+        ("input", pa.string()),
+        ("output", pa.string()),
+        ("parameter", pa.map_(pa.string(), pa.string())),
+        *((column, pa.float64()) for column, _ in QUANTITIES.values()),
+        ("materials", pa.list_(pa.string())),
+    ])
+
+
+def _text(value):
+    # LLM output is not always well-typed; the table only holds strings
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return ", ".join(map(str, value))
+    return str(value)
+
+
+def _row_ids(protocol, first_row, n_vectors):
+    """
+    Store rows of a protocol's steps. Vectors exist for the steps with a
+    non-empty formatted string (see extract_and_format_steps); if the counts
+    do not line up (e.g. vectors imported from elsewhere) the rows are unknown.
+    """
+    if n_vectors == len(protocol):
+        return list(range(first_row, first_row + n_vectors))
+    from backend.vectorized import format_step
+
+    kept = [bool(format_step(step)) for step in protocol]
+    if sum(kept) != n_vectors:
+        return [None] * len(protocol)
+    rows = iter(range(first_row, first_row + n_vectors))
+    return [next(rows) if keep else None for keep in kept]
+
+
+def protocols_to_table(protocols, dois=None, first_protocol=0, offsets=None):
+    """
+    Step table of a list of protocols (lists of step dicts), numbered from
+    first_protocol. offsets are the store row offsets of these protocols
+    (len(protocols) + 1 values) and fill the row_id column.
+    """
+    import pyarrow as pa
+
+    columns = {name: [] for name in step_schema().names}
+    for i, protocol in enumerate(protocols):
+        protocol = protocol or []
+        if offsets is not None:
+            columns["row_id"].extend(_row_ids(protocol, int(offsets[i]), int(offsets[i + 1] - offsets[i])))
+        else:
+            columns["row_id"].extend([None] * len(protocol))
+        doi = dois[i] if dois is not None else None
+        for number, step in enumerate(protocol, 1):
+            if not isinstance(step, dict):
+                step = {"action": step}
+            parameter = step.get("parameter")
+            columns["protocol"].append(first_protocol + i)
+            columns["doi"].append(doi)
+            step_number = step.get("step_number")
+            columns["step_number"].append(step_number if isinstance(step_number, int) else number)
+            for name in ("step_type", "action", "input", "output"):
+                columns[name].append(_text(step.get(name)))
+            columns["parameter"].append([(str(key), _text(value)) for key, value in parameter.items()]
+                                        if isinstance(parameter, dict) else [])
+            quantities = normalize_parameters(parameter) if isinstance(parameter, dict) else {}
+            for kind, (column, _) in QUANTITIES.items():
+                columns[column].append(quantities.get(kind))
+            columns["materials"].append(parse_materials(step.get("input")))
+    schema = step_schema()
+    arrays = []
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(columns[field.name], pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(columns[field.name], field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def records_to_table(records):
+    """Step table of {"doi", "protocol"} records, e.g. papers/*_examples.json."""
+    return protocols_to_table([record.get("protocol") for record in records],
+                              [record.get("doi") for record in records])
+
+
+def write_table(table, path):
+    """Writes a step table as Parquet (atomically)."""
+    import pyarrow.parquet as pq
+
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path, compression=COMPRESSION, use_dictionary=True)
+    os.replace(tmp_path, path)
+
+
+def read_table(path, columns=None, filters=None):
+    """
+    Reads a Parquet file or a directory of parts, memory-mapped. filters
+    (e.g. [("step_type", "=", "centrifugation")]) are pushed down to the
+    reader, so only matching row groups are decoded.
+    """
+    import pyarrow.parquet as pq
+
+    return pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+
+
+# --- Step table of an embedding store ---
+def _parts(directory):
+    parts = []
+    for path in glob.glob(os.path.join(directory, "part-*.parquet")):
+        match = PART_NAME.search(os.path.basename(path))
+        if match:
+            parts.append((int(match.group(1)), int(match.group(2)), path))
+    return sorted(parts)
+
+
+def _part_path(directory, start, end):
+    return os.path.join(directory, f"part-{start:09d}-{end:09d}.parquet")
+
+
+@tracing.traced("table.update")
+def update_step_table(store, max_parts=MAX_PARTS):
+    """
+    Brings <store>/steps up to date with the store: drops parts past the
+    store's end (rolled back after a crash) or written with an older schema,
+    and writes one part for the entries added since. Returns the number of
+    new step rows.
+    """
+    import pyarrow.parquet as pq
+
+    directory = os.path.join(store.path, STEPS_DIR)
+    os.makedirs(directory, exist_ok=True)
+    covered = 0
+    schema = step_schema()
+    for start, end, path in _parts(directory):
+        if end > len(store) or start != covered or not pq.read_schema(path).equals(schema, check_metadata=False):
+            os.remove(path)
+        else:
+            covered = end
+    if covered >= len(store):
+        return 0
+    offsets = store.offsets[covered:]
+    table = protocols_to_table(list(store.iter_protocols(covered)),
+                               [store.doi(i) for i in range(covered, len(store))], covered, offsets)
+    write_table(table, _part_path(directory, covered, len(store)))
+    if len(_parts(directory)) > max_parts:
+        compact_step_table(store)
+    return table.num_rows
+
+
+def compact_step_table(store):
+    """Merges the parts of <store>/steps into a single file."""
+    import pyarrow as pa
+
+    directory = os.path.join(store.path, STEPS_DIR)
+    parts = _parts(directory)
+    if len(parts) <= 1:
+        return
+    table = pa.concat_tables([read_table(path) for _, _, path in parts]).unify_dictionaries()
+    merged = _part_path(directory, parts[0][0], parts[-1][1])
+    write_table(table, merged)
+    for _, _, path in parts:
+        if path != merged:
+            os.remove(path)
+
+
+def covered_protocols(store_path):
+    """Number of store entries (from the first) that the step table of the store at store_path covers."""
+    covered = 0
+    for start, end, _ in _parts(os.path.join(store_path, STEPS_DIR)):
+        if start != covered:
+            break
+        covered = end
+    return covered
+
+
+@tracing.traced("table.load")
+def load_step_table(store_path, columns=None, filters=None):
+    """The step table of the store at store_path (see read_table)."""
+    return read_table(os.path.join(store_path, STEPS_DIR), columns, filters)
+
+
+# --- Column operations ---
+def filter_steps(table, **conditions):
+    """
+    Rows whose columns equal the given values (a list or tuple matches any of
+    its values), e.g. filter_steps(table, step_type="centrifugation").
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    mask = None
+    for name, value in conditions.items():
+        column = table[name]
+        if isinstance(value, (list, tuple, set)):
+            condition = pc.is_in(column, value_set=pa.array(list(value), column.type.value_type
+                                                            if pa.types.is_dictionary(column.type) else column.type))
+        else:
+            condition = pc.equal(column, value)
+        mask = condition if mask is None else pc.and_(mask, condition)
+    return table if mask is None else table.filter(mask)
+
+
+def value_counts(table, column):
+    """(value, count) pairs of a column, most frequent first."""
+    import pyarrow.compute as pc
+
+    counts = pc.value_counts(table[column].combine_chunks())
+    values, numbers = counts.field("values").to_pylist(), counts.field("counts").to_numpy()
+    order = np.argsort(-numbers, kind="stable")
+    return [(values[i], int(numbers[i])) for i in order]
+
+
+def parameter_values(table, key):
+    """The value of one parameter (e.g. "temperature") for every step; null where it is not set."""
+    import pyarrow.compute as pc
+
+    return pc.map_lookup(table["parameter"], key, "first")
+
+
+def protocol_frames(table, protocols=None):
+    """
+    One pandas DataFrame per protocol id in protocols (default: every id in
+    the table, ascending), with the columns shown in the app and parameters
+    as dicts. A protocol without steps gets an empty frame.
+    """
+    ids = table["protocol"].to_numpy()
+    frame = table.select(list(FRAME_COLUMNS)).to_pandas(maps_as_pydicts="strict").rename(columns=FRAME_COLUMNS)
+    protocols = np.unique(ids) if protocols is None else np.asarray(protocols)
+    # Rows of one protocol are contiguous and ids ascend, so each protocol is one slice
+    starts = np.searchsorted(ids, protocols, "left")
+    ends = np.searchsorted(ids, protocols, "right")
+    return [frame.iloc[start:end].reset_index(drop=True) for start, end in zip(starts, ends)]
+
+
+def main(argv=None):
+    from backend.store import EmbeddingStore
+
+    parser = argparse.ArgumentParser(description="Build or update the Parquet step table of an embedding store.")
+    parser.add_argument("store", help="Embedding store directory")
+    parser.add_argument("--compact", action="store_true", help="Merge all parts into one file")
+    args = parser.parse_args(argv)
+    store = EmbeddingStore.open(args.store)
+    added = update_step_table(store)
+    if args.compact:
+        compact_step_table(store)
+    table = load_step_table(args.store, columns=["step_type"])
+    print(f"Added {added} steps; {table.num_rows} steps from {len(store)} protocols in {args.store}/{STEPS_DIR}")
+    for step_type, count in value_counts(table, "step_type")[:10]:
+        print(f"{count:>9}  {step_type}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+import atexit
+import contextvars
+import functools
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+# Lightweight tracing of the pipeline stages (PDF parsing, LLM calls,
+# encoding, comparison, frontend steps):
+#   with tracing.span("prefilter", chars=len(text)): ...
+#   @tracing.traced("compare", attributes=("mode",))
+# Spans nest through a context variable, so a stage's sub-stages (and LLM
+# calls made on the background event loop) end up in the same trace.
+# Tracing is off unless an exporter is configured or the code runs inside a
+# recording (e.g. one Streamlit run, and only that run); otherwise span() and
+# traced functions cost one flag check and one context variable lookup.
+# Exporters, configured with configure() or the environment:
+#   PROTOCOMPARE_TRACE_FILE=traces.jsonl          one JSON line per finished span
+#   PROTOCOMPARE_TRACE_OTLP=http://127.0.0.1:4318 OTLP/HTTP (JSON) to an OpenTelemetry collector
+
+SERVICE_NAME = "protocompare"
+MAX_RECORDINGS = 64
+OTLP_BATCH_SIZE = 512
+OTLP_FLUSH_INTERVAL = 2.0
+# Code object flags of coroutine and async generator functions (see inspect)
+CO_COROUTINE = 0x80
+CO_ASYNC_GENERATOR = 0x200
+
+_exporting = False
+_exporters = []
+_recordings = OrderedDict()
+_state_lock = threading.Lock()
+_current = contextvars.ContextVar("protocompare_span", default=None)
+
+
+class Span:
+    """A timed stage. set() adds attributes; end() records it (done by span() and traced())."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "_start", "duration_ms",
+                 "attributes", "error", "thread")
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.error = None
+        self.duration_ms = None
+        self.thread = threading.current_thread().name
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error=None):
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        _finish(self)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": self.duration_ms,
+            "thread": self.thread,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    trace_id = span_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def end(self, error=None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Scope:
+    """Makes a span the current one while the block runs and ends it afterwards."""
+
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span):
+        self.span = span
+
+    def __enter__(self):
+        self._token = _current.set(self.span) if self.span is not NOOP_SPAN else None
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            _current.reset(self._token)
+        self.span.end(exc)
+        return False
+
+
+_NOOP_SCOPE = _Scope(NOOP_SPAN)
+
+
+def enabled():
+    """True if spans started here are recorded: an exporter is configured or a recording is current."""
+    return _exporting or _current.get() is not None
+
+
+def current_span():
+    """The innermost active span (NOOP_SPAN if there is none)."""
+    return _current.get() or NOOP_SPAN
+
+
+def start_span(name, parent=None, **attributes):
+    """
+    Starts a span without making it current; the caller must end() it.
+    Meant for async generators, whose body must not change the consumer's
+    context between yields. parent defaults to the current span.
+    """
+    if not _exporting and _current.get() is None:
+        return NOOP_SPAN
+    parent = parent if parent is not None else _current.get()
+    return Span(name, parent if parent is not NOOP_SPAN else None, attributes)
+
+
+def span(name, **attributes):
+    """Context manager timing a block as a child of the current span."""
+    if not _exporting and _current.get() is None:
+        return _NOOP_SCOPE
+    return _Scope(Span(name, _current.get(), attributes))
+
+
+def use_span(parent):
+    """Context manager making parent (e.g. captured in another thread) the current span without ending it."""
+    return _Attach(parent)
+
+
+class _Attach:
+    __slots__ = ("parent", "_token")
+
+    def __init__(self, parent):
+        self.parent = parent
+
+    def __enter__(self):
+        self._token = _current.set(self.parent if self.parent is not NOOP_SPAN else None)
+        return self.parent
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+        return False
+
+
+def traced(name=None, attributes=()):
+    """
+    Decorator wrapping every call of a function, coroutine function or async
+    generator function in a span. attributes names arguments whose values
+    are recorded on the span.
+    """
+    def decorate(function):
+        span_name = name or function.__qualname__
+        signature = []
+
+        def start(args, kwargs):
+            values = {}
+            if attributes:
+                if not signature:
+                    # inspect is only imported once tracing is actually used
+                    import inspect
+                    signature.append(inspect.signature(function))
+                bound = signature[0].bind_partial(*args, **kwargs)
+                bound.apply_defaults()
+                values = {key: _attribute(bound.arguments[key]) for key in attributes if key in bound.arguments}
+            return _Scope(Span(span_name, _current.get(), values))
+
+        flags = getattr(getattr(function, "__code__", None), "co_flags", 0)
+        if flags & CO_ASYNC_GENERATOR:
+            @functools.wraps(function)
+            def async_generator_wrapper(*args, **kwargs):
+                if not _exporting and _current.get() is None:
+                    return function(*args, **kwargs)
+                return _traced_iteration(start(args, kwargs).span, function(*args, **kwargs))
+            return async_generator_wrapper
+
+        if flags & CO_COROUTINE:
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not _exporting and _current.get() is None:
+                    return await function(*args, **kwargs)
+                with start(args, kwargs):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _exporting and _current.get() is None:
+                return function(*args, **kwargs)
+            with start(args, kwargs):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+async def _traced_iteration(trace, iterable):
+    """
+    Iterates an async generator inside a span that ends when it is exhausted
+    or closed; the number of items is recorded as "items". The span is only
+    current while the generator runs, never in the consumer between items.
+    """
+    iterator = iterable.__aiter__()
+    items, error = 0, None
+    try:
+        while True:
+            with _Attach(trace):
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+            items += 1
+            yield item
+    except BaseException as e:
+        if not isinstance(e, GeneratorExit):
+            error = e
+        raise
+    finally:
+        await iterator.aclose()
+        trace.set(items=items)
+        trace.end(error)
+
+
+def _attribute(value):
+    return value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+
+
+# --- Recording (e.g. one Streamlit run) ---
+class Recording:
+    """
+    Collects every span of one trace: starts a root span, makes it current
+    and, once stopped, holds the finished spans (as dicts) in .spans.
+    Tracing is enabled in the recording's context only (and wherever its
+    spans are carried, e.g. with use_span), not in concurrent sessions.
+    """
+
+    def __init__(self, name, **attributes):
+        self.spans = []
+        self.root = Span(name, None, attributes)
+        with _state_lock:
+            _recordings[self.root.trace_id] = self.spans
+            while len(_recordings) > MAX_RECORDINGS:
+                # Recordings that were never stopped (e.g. an interrupted script run)
+                _recordings.popitem(last=False)
+        self._token = _current.set(self.root)
+
+    def stop(self):
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                # Stopped from another context; nothing to restore
+                pass
+            self._token = None
+            self.root.end()
+            with _state_lock:
+                _recordings.pop(self.root.trace_id, None)
+        return self.spans
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.root.error = f"{exc_type.__name__}: {exc}" if exc_type is not None else None
+        self.stop()
+        return False
+
+
+def record(name="run", **attributes):
+    return Recording(name, **attributes)
+
+
+def _update_state():
+    global _exporting
+    with _state_lock:
+        _exporting = bool(_exporters)
+
+
+def _finish(span):
+    record = None
+    spans = _recordings.get(span.trace_id)
+    if spans is not None:
+        record = span.to_dict()
+        spans.append(record)
+    for exporter in _exporters:
+        exporter.export(record or span.to_dict())
+
+
+def stage_totals(spans):
+    """Per span name: calls, total and mean milliseconds and LLM token counts, slowest first."""
+    totals = defaultdict(lambda: {"calls": 0, "total_ms": 0.0, "prompt_tokens": 0, "completion_tokens": 0})
+    for record in spans:
+        row = totals[record["name"]]
+        row["calls"] += 1
+        row["total_ms"] += record["duration_ms"]
+        row["prompt_tokens"] += record["attributes"].get("prompt_tokens", 0)
+        row["completion_tokens"] += record["attributes"].get("completion_tokens", 0)
+    rows = [dict(stage=name, mean_ms=row["total_ms"] / row["calls"], **row) for name, row in totals.items()]
+    return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+
+def span_tree(spans):
+    """Spans in start order as (depth, span dict) pairs, children under their parents."""
+    children = defaultdict(list)
+    ids = {record["span_id"] for record in spans}
+    for record in sorted(spans, key=lambda record: record["start_ns"]):
+        children[record["parent_id"] if record["parent_id"] in ids else None].append(record)
+    rows = []
+
+    def walk(parent_id, depth):
+        for record in children[parent_id]:
+            rows.append((depth, record))
+            walk(record["span_id"], depth + 1)
+    walk(None, 0)
+    return rows
+
+
+# --- Exporters ---
+class JsonlExporter:
+    """Appends one JSON line per finished span to a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class OtlpExporter:
+    """
+    Sends spans to an OpenTelemetry collector over OTLP/HTTP with JSON
+    encoding, in batches from a background thread.
+    """
+
+    def __init__(self, endpoint, service_name=SERVICE_NAME, batch_size=OTLP_BATCH_SIZE,
+                 flush_interval=OTLP_FLUSH_INTERVAL):
+        self.url = endpoint.rstrip("/")
+        if not self.url.endswith("/v1/traces"):
+            self.url += "/v1/traces"
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._failed = False
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, record):
+        self._queue.put(record)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        batch, stopping = [], False
+        while not stopping:
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            if batch:
+                self._send(batch)
+                batch = []
+
+    def _send(self, batch):
+        body = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "backend.tracing"}, "spans": [_otlp_span(r) for r in batch]}],
+        }]}).encode("utf-8")
+        import urllib.request
+        request = urllib.request.Request(self.url, body, {"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(request, timeout=10).close()
+        except Exception as e:
+            if not self._failed:
+                print(f"Error exporting traces to {self.url}: {e}")
+                self._failed = True
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_span(record):
+    span = {
+        "traceId": record["trace_id"],
+        "spanId": record["span_id"],
+        "name": record["name"],
+        "kind": 1,
+        "startTimeUnixNano": str(record["start_ns"]),
+        "endTimeUnixNano": str(record["start_ns"] + int(record["duration_ms"] * 1e6)),
+        "attributes": [_otlp_attribute(key, value) for key, value in record["attributes"].items()]
+                      + [_otlp_attribute("thread.name", record["thread"])],
+        "status": {"code": 2, "message": record["error"]} if record["error"] else {"code": 1},
+    }
+    if record["parent_id"]:
+        span["parentSpanId"] = record["parent_id"]
+    return span
+
+
+def configure(jsonl_path=None, otlp_endpoint=None, service_name=SERVICE_NAME):
+    """Replaces the exporters; with neither argument, spans are only kept by active recordings."""
+    exporters = []
+    if jsonl_path:
+        exporters.append(JsonlExporter(jsonl_path))
+    if otlp_endpoint:
+        exporters.append(OtlpExporter(otlp_endpoint, service_name))
+    with _state_lock:
+        previous = list(_exporters)
+        _exporters[:] = exporters
+    for exporter in previous:
+        exporter.close()
+    _update_state()
+
+
+def _close_exporters():
+    for exporter in list(_exporters):
+        exporter.close()
+
+
+atexit.register(_close_exporters)
+configure(os.environ.get("PROTOCOMPARE_TRACE_FILE"), os.environ.get("PROTOCOMPARE_TRACE_OTLP"))
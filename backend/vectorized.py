@@ -1,7 +1,13 @@
 # === Step 1: Load and Parse JSON Protocols ===
 # import json
 # import os
-from sentence_transformers import SentenceTransformer
+import os
+import threading
+import numpy as np
+from backend import tracing
+from backend.cache import EmbeddingCache, cache_dir
+from backend.encoders import configured_encoder, encoder_id, load_encoder
+from backend.scheduler import get_scheduler
 # import torch
 # from sklearn.metrics.pairwise import cosine_similarity
 # from scipy.optimize import linear_sum_assignment
@@ -13,8 +19,37 @@ from sentence_transformers import SentenceTransformer
 # import matplotlib.pyplot as plt
 # import seaborn as sns
 
-# Initialize model globally
-model = SentenceTransformer("all-mpnet-base-v2", device='cpu')
+# The encoder is loaded on first use, so importing this module stays cheap.
+# Which backend is used (PyTorch, ONNX int8, distilled model) is configured
+# with PROTOCOMPARE_ENCODER, see backend.encoders.
+MODEL_NAME = "all-mpnet-base-v2"
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+def get_encoder(name=None):
+    """Returns the shared encoder (configured one by default), loading it once, thread-safely."""
+    name = name or configured_encoder()
+    encoder = _encoders.get(name)
+    if encoder is None:
+        with _encoders_lock:
+            encoder = _encoders.get(name)
+            if encoder is None:
+                encoder = _encoders[name] = load_encoder(name)
+    return encoder
+
+def get_model():
+    """Returns the underlying SentenceTransformer of the configured encoder."""
+    return get_encoder().model
+
+def encoder_name(name=None) -> str:
+    """Identity of the configured encoder's vectors (without loading it)."""
+    return encoder_id(name or configured_encoder())
+
+def __getattr__(name):
+    # Keeps `from backend.vectorized import model` working without an import-time load
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # def load_protocol(path):
 #     """Load and validate protocol JSON file."""
@@ -87,11 +122,82 @@ def extract_and_format_steps(protocol_steps):
     return steps
 
 def embed_formatted_steps(formatted_steps):
-    """Return tensor of embeddings for each step string."""
-    return model.encode(formatted_steps, convert_to_tensor=True)
+    """
+    Return float32 array of embeddings for each step string. Goes through the
+    shared EmbeddingScheduler, so concurrent callers share encoder batches.
+    """
+    return get_scheduler().embed(formatted_steps)
 
+@tracing.traced("embed.protocol")
 def make_protocol_vector(input_json):
     """Take in protocol as a json (list of dicts) and return array with embedding"""
     steps = extract_and_format_steps(input_json)
     embed_vector = embed_formatted_steps(steps)
     return embed_vector
+
+def _token_lengths(encoder, texts):
+    # Fast tokenizers handle a whole list at once; fall back to characters otherwise
+    try:
+        return [len(ids) for ids in encoder.tokenizer(texts, add_special_tokens=False)["input_ids"]]
+    except Exception:
+        return [len(text) for text in texts]
+
+_embedding_caches = {}
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache(name=None):
+    """Persistent step-vector cache for an encoder (None if disabled with PROTOCOMPARE_EMBEDDING_CACHE=0)."""
+    if os.environ.get("PROTOCOMPARE_EMBEDDING_CACHE", "1") == "0":
+        return None
+    vectors_id = encoder_name(name)
+    with _embedding_cache_lock:
+        if vectors_id not in _embedding_caches:
+            _embedding_caches[vectors_id] = EmbeddingCache(os.path.join(cache_dir(), "embeddings.sqlite"), vectors_id)
+        return _embedding_caches[vectors_id]
+
+@tracing.traced("embed.encode")
+def encode_steps(texts, batch_size=128, use_cache=True, encoder=None):
+    """
+    Encodes formatted step strings into a float32 (n, dim) array. Cached
+    vectors are reused; only unseen strings go through the model, deduplicated
+    and sorted by token length so each batch carries little padding.
+    encoder names an entry of backend.encoders.ENCODERS (default: configured one).
+    """
+    model = get_encoder(encoder)
+    vectors = np.empty((len(texts), model.dimension), dtype=np.float32)
+    cache = get_embedding_cache(encoder) if use_cache else None
+    cached = cache.get_many(texts) if cache is not None else [None] * len(texts)
+
+    missing = {}
+    for i, (text, vector) in enumerate(zip(texts, cached)):
+        if vector is None:
+            missing.setdefault(text, []).append(i)
+        else:
+            vectors[i] = vector
+    tracing.current_span().set(texts=len(texts), encoded=len(missing))
+    if missing:
+        unique = list(missing)
+        lengths = _token_lengths(model, unique)
+        order = sorted(range(len(unique)), key=lambda i: lengths[i])
+        unique = [unique[i] for i in order]
+        encoded = model.encode(unique, batch_size=batch_size)
+        for text, vector in zip(unique, encoded):
+            vectors[missing[text]] = vector
+        if cache is not None:
+            cache.put_many(unique, encoded)
+    return vectors
+
+@tracing.traced("embed.protocols")
+def embed_protocols(protocols, batch_size=128, use_cache=True, encoder=None):
+    """
+    Embeds the steps of many protocols in as few encoder calls as possible.
+    Identical formatted steps are encoded once (or taken from the cache) and
+    scattered back into one float32 (n_steps, dim) array per protocol.
+    """
+    formatted = [extract_and_format_steps(protocol) for protocol in protocols]
+    unique = {}
+    for steps in formatted:
+        for step in steps:
+            unique.setdefault(step, len(unique))
+    vectors = encode_steps(list(unique), batch_size, use_cache, encoder)
+    return [vectors[[unique[step] for step in steps]] for steps in formatted]
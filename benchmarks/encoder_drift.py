@@ -0,0 +1,123 @@
+"""
+Accuracy check for alternative encoder backends: embeds the protocols in
+papers/ with a baseline and a candidate encoder and reports how much
+backend.compare.compare scores and search rankings move, plus encoding speed.
+
+    python benchmarks/encoder_drift.py --candidate mpnet-onnx-int8
+    python benchmarks/encoder_drift.py --baseline mpnet --candidate minilm --json drift.json
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from backend.compare import compare, normalize_rows, search  # noqa: E402
+from backend.encoders import ENCODERS  # noqa: E402
+from backend.vectorized import embed_protocols, extract_and_format_steps, get_encoder  # noqa: E402
+
+
+def load_protocols(pattern):
+    protocols = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        if isinstance(records, list):
+            protocols.extend(record["protocol"] for record in records if record.get("protocol"))
+    return protocols
+
+
+def score_matrix(embedded):
+    n = len(embedded)
+    scores = np.zeros((n, n))
+    for i in range(n):
+        for j in range(n):
+            scores[i, j] = compare(embedded[i], embedded[j])[0]
+    return scores
+
+
+def rankings(embedded):
+    """Ranking of every other protocol for each protocol used as the query."""
+    matrix = normalize_rows(np.concatenate(embedded))
+    offsets = np.concatenate(([0], np.cumsum([len(e) for e in embedded])))
+    return [[j for j, _ in search(query, matrix, offsets, top_k=None) if j != i]
+            for i, query in enumerate(embedded)]
+
+
+def spearman(a, b):
+    ranks_a = np.argsort(np.argsort(a))
+    ranks_b = np.argsort(np.argsort(b))
+    return float(np.corrcoef(ranks_a, ranks_b)[0, 1])
+
+
+def timed_embedding(protocols, name, repeat):
+    get_encoder(name)  # load outside the timed region
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        embedded = embed_protocols(protocols, use_cache=False, encoder=name)
+        best = min(best, time.perf_counter() - start)
+    return embedded, best
+
+
+def drift_report(protocols, baseline, candidate, repeat=3, k=3):
+    n_steps = sum(len(extract_and_format_steps(protocol)) for protocol in protocols)
+    base_embedded, base_time = timed_embedding(protocols, baseline, repeat)
+    cand_embedded, cand_time = timed_embedding(protocols, candidate, repeat)
+
+    base_scores, cand_scores = score_matrix(base_embedded), score_matrix(cand_embedded)
+    off_diagonal = ~np.eye(len(protocols), dtype=bool)
+    score_diff = np.abs(base_scores - cand_scores)[off_diagonal]
+
+    base_ranks, cand_ranks = rankings(base_embedded), rankings(cand_embedded)
+    top1 = np.mean([b[0] == c[0] for b, c in zip(base_ranks, cand_ranks)])
+    topk = np.mean([len(set(b[:k]) & set(c[:k])) / k for b, c in zip(base_ranks, cand_ranks)])
+    # Per-query rank correlation of the candidate ordering against the baseline ordering
+    rank_corr = np.mean([spearman([b.index(j) for j in b], [c.index(j) for j in b])
+                         for b, c in zip(base_ranks, cand_ranks)])
+
+    report = {
+        "baseline": baseline,
+        "candidate": candidate,
+        "protocols": len(protocols),
+        "steps": n_steps,
+        "baseline_steps_per_s": n_steps / base_time,
+        "candidate_steps_per_s": n_steps / cand_time,
+        "speedup": base_time / cand_time,
+        "score_mean_abs_diff": float(score_diff.mean()),
+        "score_max_abs_diff": float(score_diff.max()),
+        "score_spearman": spearman(base_scores[off_diagonal], cand_scores[off_diagonal]),
+        "search_top1_agreement": float(top1),
+        f"search_top{k}_overlap": float(topk),
+        "search_rank_spearman": float(rank_corr),
+    }
+    if base_embedded[0].shape[1] == cand_embedded[0].shape[1]:
+        a, b = normalize_rows(np.concatenate(base_embedded)), normalize_rows(np.concatenate(cand_embedded))
+        report["step_vector_cosine_mean"] = float(np.mean(np.sum(a * b, axis=1)))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default="mpnet", choices=sorted(ENCODERS))
+    parser.add_argument("--candidate", default="mpnet-onnx-int8", choices=sorted(ENCODERS))
+    parser.add_argument("--papers", default=os.path.join(REPO_ROOT, "papers", "*_examples.json"))
+    parser.add_argument("--repeat", type=int, default=3, help="Timed embedding runs per encoder (best is kept)")
+    parser.add_argument("--json", help="Write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = drift_report(load_protocols(args.papers), args.baseline, args.candidate, args.repeat)
+    for key, value in report.items():
+        print(f"{key:<28} {value:.4f}" if isinstance(value, float) else f"{key:<28} {value}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Offline load test of the extraction pipeline: starts the mock LLM server
+(backend.mock_llm) in-process, points the shared client at it and pushes
+documents from papers/ through iter_extract_protocols.
+
+    python benchmarks/extraction_load.py --documents 200 --concurrency 16 --latency 0.5
+    python benchmarks/extraction_load.py --error-rate 0.1 --rate-limit-rate 0.1 --json load.json
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from backend import data_extraction  # noqa: E402
+from backend.mock_llm import MockLLMServer, load_recordings  # noqa: E402
+
+
+def load_texts(pattern, n_documents):
+    """Recordings from the example papers, and n_documents of their texts (cycled)."""
+    texts = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        if isinstance(records, list):
+            texts.extend(record["text"] for record in records if isinstance(record, dict) and record.get("text"))
+    return load_recordings([pattern]), [texts[i % len(texts)] for i in range(n_documents)]
+
+
+def run_load(texts, recordings, concurrency, latency, jitter, error_rate, rate_limit_rate, max_connections, seed=0):
+    with MockLLMServer(recordings, port=0, latency=latency, jitter=jitter, error_rate=error_rate,
+                       rate_limit_rate=rate_limit_rate, seed=seed) as server:
+        data_extraction.configure_client(server.url, "mock", max_connections=max_connections,
+                                         max_keepalive_connections=max_connections)
+        try:
+            start = time.perf_counter()
+            completed, failed = [], 0
+            for _, _, error in data_extraction.iter_extract_protocols(dict(enumerate(texts)), concurrency,
+                                                                     use_cache=False):
+                completed.append(time.perf_counter() - start)
+                failed += error is not None
+            wall = time.perf_counter() - start
+        finally:
+            data_extraction.configure_client()
+        stats = server.stats()
+    return {
+        "documents": len(texts),
+        "concurrency": concurrency,
+        "wall_s": wall,
+        "docs_per_s": len(texts) / wall,
+        "failed": failed,
+        "requests": stats["requests"],
+        "retries": stats["requests"] - len(texts),
+        "injected_errors": stats["errors"] + stats["rate_limited"],
+        "completion_p50_s": statistics.median(completed),
+        "completion_p95_s": completed[int(0.95 * (len(completed) - 1))],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", default=os.path.join(REPO_ROOT, "papers", "*_examples.json"))
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock server delay per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--max-connections", type=int, default=data_extraction.MAX_CONNECTIONS)
+    parser.add_argument("--retry-base-delay", type=float, default=0.05,
+                        help="Backoff base delay for this run (the pipeline default is far longer)")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    data_extraction.RETRY_BASE_DELAY = args.retry_base_delay
+    recordings, texts = load_texts(args.papers, args.documents)
+    results = []
+    print(f"{'concurrency':>11} {'docs/s':>8} {'wall s':>8} {'p50 s':>7} {'p95 s':>7} {'requests':>9} {'failed':>7}")
+    for concurrency in args.concurrency:
+        row = run_load(texts, recordings, concurrency, args.latency, args.jitter, args.error_rate,
+                       args.rate_limit_rate, args.max_connections)
+        results.append(row)
+        print(f"{concurrency:>11} {row['docs_per_s']:>8.2f} {row['wall_s']:>8.2f} {row['completion_p50_s']:>7.2f} "
+              f"{row['completion_p95_s']:>7.2f} {row['requests']:>9} {row['failed']:>7}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
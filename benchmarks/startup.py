@@ -0,0 +1,100 @@
+"""
+Cold-start benchmark: import time (via `python -X importtime`) and peak RSS
+of fresh interpreters importing each module.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py backend.vectorized --load-model --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = [
+    "backend.compare",
+    "backend.store",
+    "backend.ann",
+    "backend.data_extraction",
+    "backend.vectorized",
+    "backend.ingest",
+]
+
+# Runs in the child: imports the module (optionally loads the encoder) and reports peak RSS in KiB
+CHILD_CODE = """
+import resource, sys
+import {module}
+if {load_model}:
+    import backend.vectorized
+    backend.vectorized.get_encoder()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(rss // 1024 if sys.platform == "darwin" else rss)
+"""
+
+
+def parse_importtime(stderr):
+    """Returns [(cumulative_us, self_us, module, depth)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), name.strip(), depth))
+    return rows
+
+
+def measure(module, load_model=False):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD_CODE.format(module=module, load_model=load_model)],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+    rows = parse_importtime(result.stderr)
+    return {
+        "wall_s": wall,
+        "import_s": sum(cumulative for cumulative, _, _, depth in rows if depth == 1) / 1e6,
+        "peak_rss_mb": int(result.stdout.strip().splitlines()[-1]) / 1024,
+        "slowest": sorted(((cumulative, name) for cumulative, _, name, depth in rows if depth == 1), reverse=True)[:5],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module (median is reported)")
+    parser.add_argument("--load-model", action="store_true", help="Also load the sentence-transformers encoder")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'module':<28} {'import s':>9} {'wall s':>8} {'peak RSS MB':>12}  slowest top-level imports")
+    for module in args.modules:
+        try:
+            runs = [measure(module, args.load_model) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:<28} {'failed':>9}  {e}")
+            continue
+        results[module] = {
+            "import_s": statistics.median(run["import_s"] for run in runs),
+            "wall_s": statistics.median(run["wall_s"] for run in runs),
+            "peak_rss_mb": statistics.median(run["peak_rss_mb"] for run in runs),
+            "slowest": [[name, us / 1e6] for us, name in runs[-1]["slowest"]],
+        }
+        row = results[module]
+        slowest = ", ".join(f"{name} {s:.2f}s" for name, s in row["slowest"][:3])
+        print(f"{module:<28} {row['import_s']:>9.3f} {row['wall_s']:>8.3f} {row['peak_rss_mb']:>12.1f}  {slowest}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version, "load_model": args.load_model, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Benchmark suite for the protocol pipeline on synthetic data (see
+benchmarks/synthetic.py). Every stage is timed at a range of sizes and
+reports latency percentiles, throughput and peak memory; results are saved
+as JSON so runs from different commits can be compared.
+
+    python benchmarks/suite.py --json base.json
+    python benchmarks/suite.py --stages compare_ordered search --corpus-steps 1000 100000 1000000
+    python benchmarks/suite.py --json new.json --baseline base.json --tolerance 1.2
+
+Stages: format_step (backend.vectorized.format_step over a corpus),
+extract_json (data_extraction.extract_json_from_response on one answer),
+unpack (step records to the columnar step table and per-protocol frames
+as in the app, needs pyarrow and pandas), filter_steps (step-type filter
+and parameter lookup over the step table),
+compare_<mode> (one protocol against another of the same length),
+search (exact search of one protocol against an embedded corpus),
+filtered_search (ParameterIndex pre-filter for a hot, long step, then
+search over the matching protocols only; needs pyarrow), hybrid_search
+(BM25 candidates from backend.lexical fused with dense scores, re-scored
+with compare) and
+embed (make_protocol_vector, needs the encoder; only with --stages embed).
+Sizes are steps: per corpus for format_step/unpack/filter_steps and the search stages, per protocol
+otherwise. Sizes above a stage's limit are skipped.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from backend.compare import compare, search  # noqa: E402
+from backend.data_extraction import extract_json_from_response  # noqa: E402
+from backend.vectorized import format_step  # noqa: E402
+from benchmarks.synthetic import ProtocolGenerator, llm_response, synthetic_corpus, synthetic_vectors  # noqa: E402
+
+DEFAULT_STAGES = ["format_step", "extract_json", "unpack", "filter_steps", "compare_greedy", "compare_assignment",
+                  "compare_ordered", "search", "filtered_search", "hybrid_search"]
+DEFAULT_PROTOCOL_STEPS = [10, 100, 1000]
+DEFAULT_CORPUS_STEPS = [1000, 10000, 100000]
+# Largest size (steps) each stage is run at; the quadratic/cubic ones would take hours beyond
+STAGE_LIMITS = {
+    "compare_assignment": 2000,
+    "compare_ordered": 5000,
+    "compare_local": 5000,
+    "compare_greedy": 20000,
+    "embed": 10000,
+}
+QUERY_STEPS = 10
+FILTER = {"temperature": ">=150 °C", "duration": ">=2 h"}
+CORPUS_STAGES = ("format_step", "unpack", "filter_steps", "search", "filtered_search", "hybrid_search")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(run, min_runs=3, max_runs=50, min_time=0.5):
+    """
+    Calls run() once to warm up (lazy imports, caches), times it until it
+    has been called min_runs times and for min_time seconds (at most
+    max_runs times), then calls it once more under tracemalloc.
+    Returns (latencies in seconds, peak traced memory in bytes).
+    """
+    run()
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_runs and (len(latencies) < min_runs or time.perf_counter() - start < min_time):
+        t = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - t)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return latencies, peak
+
+
+def summarize(stage, size, latencies, peak, items):
+    latencies_ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        "stage": stage,
+        "steps": size,
+        "runs": len(latencies),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "mean_ms": float(latencies_ms.mean()),
+        "steps_per_s": float(items / (p50 / 1000)) if p50 > 0 else None,
+        "peak_mb": peak / 2**20,
+    }
+
+
+def stage_runner(stage, size, generator, seed, workdir):
+    """Builds the inputs of one stage at one size; returns (run, steps processed per run)."""
+    if stage == "format_step":
+        steps = [step for protocol in generator.corpus(size) for step in protocol]
+        return lambda: [format_step(step) for step in steps], size
+    if stage == "extract_json":
+        response = llm_response(generator.protocol(size))
+        return lambda: extract_json_from_response(response), size
+    if stage == "unpack":
+        from backend.table import protocol_frames, records_to_table
+        records = [{"doi": f"synthetic/{i}", "protocol": protocol} for i, protocol in enumerate(generator.corpus(size))]
+        return lambda: protocol_frames(records_to_table(records), range(len(records))), size
+    if stage == "filter_steps":
+        from backend.table import filter_steps, parameter_values, read_table, records_to_table, write_table
+        records = [{"doi": f"synthetic/{i}", "protocol": protocol} for i, protocol in enumerate(generator.corpus(size))]
+        path = os.path.join(workdir, f"steps_{size}.parquet")
+        write_table(records_to_table(records), path)
+        table = read_table(path)
+        step_type = table["step_type"][0].as_py()
+        return lambda: parameter_values(filter_steps(table, step_type=step_type), "temperature"), size
+    if stage.startswith("compare_"):
+        mode = stage[len("compare_"):]
+        emb_a = synthetic_vectors(size, seed)
+        emb_b = synthetic_vectors(size, seed + 1)
+        return lambda: compare(emb_a, emb_b, mode), size
+    if stage == "search":
+        matrix, offsets = synthetic_corpus(size, seed, os.path.join(workdir, f"corpus_{size}.npy"), generator)
+        query = synthetic_vectors(QUERY_STEPS, seed + 1)
+        return lambda: search(query, matrix, offsets, top_k=10), size
+    if stage == "filtered_search":
+        from backend.parameters import ParameterIndex
+        from backend.table import protocols_to_table
+        protocols = generator.corpus(size)
+        offsets = np.concatenate([[0], np.cumsum([len(protocol) for protocol in protocols])]).astype(np.int64)
+        matrix = np.lib.format.open_memmap(os.path.join(workdir, f"filtered_{size}.npy"), mode="w+",
+                                           dtype=np.float32, shape=(size, synthetic_vectors(1).shape[1]))
+        synthetic_vectors(size, seed, out=matrix)
+        index = ParameterIndex.from_table(protocols_to_table(protocols, offsets=offsets))
+        query = synthetic_vectors(QUERY_STEPS, seed + 1)
+        return lambda: search(query, matrix, offsets, top_k=10, candidates=index.protocols(**FILTER)), size
+    if stage == "hybrid_search":
+        from backend.lexical import LexicalIndex, hybrid_search
+        protocols = generator.corpus(size)
+        offsets = np.concatenate([[0], np.cumsum([len(protocol) for protocol in protocols])]).astype(np.int64)
+        matrix = synthetic_vectors(size, seed)
+        index = LexicalIndex.build(protocols)
+        query_protocol = generator.protocol(QUERY_STEPS)
+        query_texts = [format_step(step) for step in query_protocol]
+        query = synthetic_vectors(QUERY_STEPS, seed + 1)
+        get_vectors = lambda i: matrix[offsets[i]:offsets[i + 1]]
+        return lambda: hybrid_search(query, query_texts, index, matrix, offsets, get_vectors, top_k=10), size
+    if stage == "embed":
+        from backend.vectorized import get_encoder, make_protocol_vector
+        get_encoder()
+        protocol = generator.protocol(size)
+        return lambda: make_protocol_vector(protocol), size
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def run_suite(stages, protocol_steps, corpus_steps, seed=0, min_runs=3, max_runs=50, min_time=0.5, log=print):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for stage in stages:
+            sizes = corpus_steps if stage in CORPUS_STAGES else protocol_steps
+            for size in sizes:
+                if size > STAGE_LIMITS.get(stage, float("inf")):
+                    log(f"{stage:>20} {size:>9} skipped (limit {STAGE_LIMITS[stage]})")
+                    continue
+                # A fresh generator per stage and size keeps every input independent of the stage order
+                generator = ProtocolGenerator(seed=seed)
+                try:
+                    run, items = stage_runner(stage, size, generator, seed, workdir)
+                except ImportError as e:
+                    log(f"{stage:>20} {size:>9} skipped ({e})")
+                    break
+                row = summarize(stage, size, *measure(run, min_runs, max_runs, min_time), items)
+                results.append(row)
+                log(f"{stage:>20} {size:>9} {row['p50_ms']:>10.2f} {row['p95_ms']:>10.2f} {row['p99_ms']:>10.2f} "
+                    f"{row['steps_per_s'] or 0:>12.0f} {row['peak_mb']:>9.1f}")
+    return results
+
+
+def compare_results(results, baseline, tolerance):
+    """Rows whose p50 grew by more than tolerance times the baseline's: (stage, steps, ratio)."""
+    previous = {(row["stage"], row["steps"]): row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        before = previous.get((row["stage"], row["steps"]))
+        if before and before["p50_ms"] > 0:
+            ratio = row["p50_ms"] / before["p50_ms"]
+            if ratio > tolerance:
+                regressions.append((row["stage"], row["steps"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", default=DEFAULT_STAGES,
+                        help="Also: compare_local, embed (loads the encoder)")
+    parser.add_argument("--protocol-steps", type=int, nargs="+", default=DEFAULT_PROTOCOL_STEPS)
+    parser.add_argument("--corpus-steps", type=int, nargs="+", default=DEFAULT_CORPUS_STEPS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-runs", type=int, default=3)
+    parser.add_argument("--max-runs", type=int, default=50)
+    parser.add_argument("--min-time", type=float, default=0.5, help="Minimum timing per stage and size (s)")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="Flag stages whose p50 latency grew by more than this factor")
+    args = parser.parse_args(argv)
+
+    print(f"{'stage':>20} {'steps':>9} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'steps/s':>12} {'peak MB':>9}")
+    results = run_suite(args.stages, args.protocol_steps, args.corpus_steps, args.seed, args.min_runs,
+                        args.max_runs, args.min_time)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "peak_rss_mb": (rss / 2**20) if sys.platform == "darwin" else rss / 1024,
+        "settings": vars(args),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        print(f"Compared with {args.baseline} (commit {baseline.get('commit')}): {len(regressions)} regression(s)")
+        for stage, steps, ratio in regressions:
+            print(f"  {stage} at {steps} steps: p50 {ratio:.2f}x slower")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
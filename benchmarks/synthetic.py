@@ -0,0 +1,144 @@
+"""
+Synthetic protocols and step embeddings for benchmarks, scaled up from the
+examples in papers/.
+
+Protocols: step types follow the step-type transitions of the example
+protocols, each step copies the fields of a real step of that type with its
+numbers perturbed, and protocol lengths follow the example lengths.
+Embeddings: noisy copies of the real step vectors in papers/embedded_data.json,
+L2-normalized, so similarity scores have a realistic spread.
+Everything is deterministic for a given seed.
+"""
+import copy
+import glob
+import json
+import os
+import re
+from collections import defaultdict
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLES = [os.path.join(REPO_ROOT, "papers", "carbon_dots_examples.json"),
+            os.path.join(REPO_ROOT, "papers", "dna_examples.json")]
+EMBEDDINGS = os.path.join(REPO_ROOT, "papers", "embedded_data.json")
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+# Standard deviation of the noise added to a real step vector (before re-normalizing)
+EMBEDDING_NOISE = 0.5
+
+
+def load_examples(paths=EXAMPLES):
+    """Non-empty example protocols (lists of step dicts)."""
+    protocols = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "r", encoding="utf-8") as f:
+                protocols.extend(record["protocol"] for record in json.load(f) if record.get("protocol"))
+    return protocols
+
+
+class ProtocolGenerator:
+    """Generates protocols that follow the distributions of a set of example protocols."""
+
+    def __init__(self, examples=None, seed=0):
+        examples = examples if examples is not None else load_examples()
+        self.rng = np.random.default_rng(seed)
+        self.lengths = np.array([len(protocol) for protocol in examples])
+        self.steps_by_type = defaultdict(list)
+        transitions = defaultdict(lambda: defaultdict(int))
+        for protocol in examples:
+            previous = None
+            for step in protocol:
+                self.steps_by_type[step["step_type"]].append(step)
+                transitions[previous][step["step_type"]] += 1
+                previous = step["step_type"]
+        self.types = list(self.steps_by_type)
+        self.transitions = {previous: (list(counts), np.array(list(counts.values())) / sum(counts.values()))
+                            for previous, counts in transitions.items()}
+
+    def _perturb(self, value):
+        if isinstance(value, dict):
+            return {key: self._perturb(item) for key, item in value.items()}
+        if isinstance(value, str):
+            factor = self.rng.lognormal(0, 0.5)
+            return NUMBER.sub(lambda m: f"{float(m.group()) * factor:.3g}", value)
+        return value
+
+    def step(self, step_type, step_number):
+        candidates = self.steps_by_type[step_type]
+        step = copy.deepcopy(candidates[self.rng.integers(len(candidates))])
+        step = {key: self._perturb(value) if key != "step_type" else value for key, value in step.items()}
+        step["step_number"] = step_number
+        return step
+
+    def protocol(self, n_steps):
+        """One protocol with exactly n_steps steps."""
+        steps, previous = [], None
+        for number in range(1, n_steps + 1):
+            types, probabilities = self.transitions.get(previous) or (self.types, None)
+            step_type = types[self.rng.choice(len(types), p=probabilities)]
+            steps.append(self.step(step_type, number))
+            previous = step_type
+        return steps
+
+    def corpus_lengths(self, total_steps):
+        """Protocol lengths drawn from the examples, summing to total_steps."""
+        lengths = []
+        remaining = total_steps
+        while remaining > 0:
+            n = min(int(self.lengths[self.rng.integers(len(self.lengths))]), remaining)
+            lengths.append(n)
+            remaining -= n
+        return lengths
+
+    def corpus(self, total_steps):
+        """List of protocols with total_steps steps in all."""
+        return [self.protocol(n) for n in self.corpus_lengths(total_steps)]
+
+
+def load_step_vectors(path=EMBEDDINGS):
+    """(n, dim) float32 array of the real step vectors in papers/embedded_data.json."""
+    with open(path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    return np.array([vector for record in records for vector in record["embedded_protocol"]], dtype=np.float32)
+
+
+def synthetic_vectors(n_rows, seed=0, base=None, noise=EMBEDDING_NOISE, out=None, chunk_rows=65536):
+    """
+    n_rows L2-normalized float32 step vectors, each a real step vector plus
+    Gaussian noise. out may be a preallocated (e.g. memory-mapped) array,
+    which is filled in chunks so huge corpora never exist twice in memory.
+    """
+    rng = np.random.default_rng(seed)
+    base = load_step_vectors() if base is None else base
+    dim = base.shape[1]
+    out = np.empty((n_rows, dim), dtype=np.float32) if out is None else out
+    for start in range(0, n_rows, chunk_rows):
+        n = min(chunk_rows, n_rows - start)
+        block = base[rng.integers(len(base), size=n)] + rng.standard_normal((n, dim), dtype=np.float32) * (
+            noise / np.sqrt(dim))
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        out[start:start + n] = block
+    return out
+
+
+def synthetic_corpus(total_steps, seed=0, path=None, generator=None):
+    """
+    Embedded corpus for search benchmarks: (matrix, offsets) with protocol
+    lengths drawn from the examples. With path, the matrix is a memory-mapped
+    file there (like EmbeddingStore.matrix) instead of an in-memory array.
+    """
+    generator = generator or ProtocolGenerator(seed=seed)
+    offsets = np.concatenate([[0], np.cumsum(generator.corpus_lengths(total_steps))]).astype(np.int64)
+    base = load_step_vectors()
+    out = None
+    if path is not None:
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(total_steps, base.shape[1]))
+    matrix = synthetic_vectors(total_steps, seed, base, out=out)
+    if path is not None:
+        matrix.flush()
+    return matrix, offsets
+
+
+def llm_response(protocol):
+    """An extraction answer for a protocol, fenced the way the model returns it."""
+    return "Here are the extracted steps:\n```json\n" + json.dumps(protocol, indent=2) + "\n```"
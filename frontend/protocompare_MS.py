@@ -1,62 +1,29 @@
 import streamlit as st 
-from docx import Document
-from pypdf import PdfReader
 from io import BytesIO, StringIO
 import pandas as pd
 import os
-from PIL import Image
 import base64
 import requests
 import json
-import plotly.graph_objects as go # Import Plotly for the radar chart
-import plotly.express as px
-from backend.data_extraction import extract_protocol, make_pretty_procedure
+from backend import tracing
+from backend.cache import LRUCache, content_hash
+from backend.data_extraction import (make_pretty_procedure, get_client, iter_stream_protocols,
+                                     iter_make_pretty_procedures)
 from backend.vectorized import make_protocol_vector
-from backend.compare import compare
-from utils import get_database_dir_path
-import numpy as np
+from backend.compare import compare, search
+from backend.store import EmbeddingStore, convert_json
+from backend.table import protocol_frames, records_to_table
+from backend.client import ProtocompareClient
+from backend.documents import SUPPORTED_EXTENSIONS, extract_text
+from utils import get_database_dir_path, get_store_dir_path
 
 def unpack_json_protocol_list(json_file_content):
-    protocol_titles = []
-    protocol_step_list = []
-    
-    try:
-        if isinstance(json_file_content, list):
-            for protocol in json_file_content:
-                protocol_df = pd.DataFrame(columns=["Step Number", "Type",
-                                        "Input", "Output",
-                                        "Action", "Parameters"])
-                protocol_titles.append(protocol['doi'])
-                protocol_steps = protocol['protocol']
-                print("Processing a list of protocol steps:")
-                for i, protocol_step_data in enumerate(protocol_steps):
-                    print(f"\n--- Step {i+1} ---")
-                    protocol_df.loc[len(protocol_df)] = [protocol_step_data["step_number"],
-                                    protocol_step_data["step_type"],
-                                    protocol_step_data["input"],
-                                    protocol_step_data["output"],
-                                    protocol_step_data["action"],
-                                    protocol_step_data["parameter"]]
-                protocol_step_list.append(protocol_df)
-
-        else:
-            print("Processing a single protocol step:")
-            protocol_step_data = json_file_content
-            print("Step Number:", protocol_step_data["step_number"])
-            print("Step Type:", protocol_step_data["step_type"])
-            print("Input:", protocol_step_data["input"])
-            print("Output:", protocol_step_data["output"])
-            print("Action:", protocol_step_data["action"])
-            print("Parameters:", protocol_step_data["parameter"])
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from '{json_file_content}'. Check if the file is valid JSON.")
-    except KeyError as e:
-        print(f"Error: Missing required key in JSON data: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-    finally:
-        print(protocol_df.head())
-        return protocol_step_list, protocol_titles
+    """One DataFrame of steps per protocol in a list of {"doi", "protocol"} records, and their DOIs."""
+    if not isinstance(json_file_content, list):
+        return [], []
+    protocol_titles = [protocol.get('doi') for protocol in json_file_content]
+    protocol_step_list = protocol_frames(records_to_table(json_file_content), range(len(json_file_content)))
+    return protocol_step_list, protocol_titles
 
 # --- Main Streamlit Application ---
 # st.set_page_config() MUST be the first Streamlit command called
@@ -136,26 +103,91 @@ def mermaid_chart(chart_code: str, height: int = 300):
     st.components.v1.html(html_code, height=height + 50) # Add some buffer height
 
 
-# --- Text Extraction Functions ---
-def extract_text_from_pdf(file_bytes: BytesIO) -> str:
-    """Extracts text from a PDF file."""
-    reader = PdfReader(file_bytes)
-    text = ""
-    for page_num in range(len(reader.pages)):
-        text += reader.pages[page_num].extract_text() or ""
-    return text
-
-def extract_text_from_docx(file_bytes: BytesIO) -> str:
-    """Extracts text from a DOCX file."""
-    document = Document(file_bytes)
-    full_text = []
-    for paragraph in document.paragraphs:
-        full_text.append(paragraph.text)
-    return '\n'.join(full_text)
-
-def extract_text_from_txt(file_bytes: BytesIO) -> str:
-    """Extracts text from a TXT file."""
-    return file_bytes.read().decode("utf-8")
+# --- Database Store ---
+@st.cache_resource
+def open_database_store() -> EmbeddingStore:
+    """Opens the binary embedding store, converting database.json on first use."""
+    store_path = get_store_dir_path()
+    if not EmbeddingStore.exists(store_path):
+        convert_json(os.path.join(get_database_dir_path(), 'database.json'), store_path)
+    return EmbeddingStore.open(store_path)
+
+# --- Cached pipeline stages ---
+# Streamlit reruns this script on every interaction. Every heavy stage below
+# is keyed by a content hash, so a rerun that changes no inputs does no work;
+# arguments starting with "_" are not hashed by Streamlit.
+# The LLM client is shared by all sessions (the encoder already is, see
+# backend.vectorized.get_encoder).
+get_client_resource = st.cache_resource(get_client)
+
+# With PROTOCOMPARE_API_URL set (see backend/service.py), embedding and
+# database search go to the API service, so this app loads neither the
+# encoder nor the embedding store.
+API_URL = os.environ.get("PROTOCOMPARE_API_URL")
+
+@st.cache_resource
+def api_client() -> ProtocompareClient:
+    return ProtocompareClient(API_URL)
+
+@st.cache_data
+def load_logo_base64(logo_path):
+    with open(logo_path, "rb") as f:
+        return base64.b64encode(f.read()).decode()
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def extract_file_text(file_hash, file_name, _file_bytes):
+    return extract_text(BytesIO(_file_bytes), file_name)
+
+EXTRACTED_PROTOCOLS_MAX = 256
+
+@st.cache_resource
+def extracted_protocols_by_hash() -> LRUCache:
+    """Protocols already extracted from a text (by text hash), shared by all sessions."""
+    return LRUCache(EXTRACTED_PROTOCOLS_MAX)
+
+def known_protocol(text_hash):
+    return extracted_protocols_by_hash().get(text_hash)
+
+def remember_protocol(text_hash, protocol):
+    extracted_protocols_by_hash().put(text_hash, protocol)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def format_procedures(protocol_hashes, _protocols):
+    pretty_procedures = {}
+    for file_name, pretty_procedure, error in iter_make_pretty_procedures(_protocols):
+        if error is not None:
+            print(f"Error formatting procedure: {error}")
+        pretty_procedures[file_name] = pretty_procedure
+    return pretty_procedures
+
+@st.cache_data(show_spinner=False, max_entries=1024)
+def protocol_embedding(protocol_hash, _protocol):
+    if API_URL:
+        return api_client().embed([_protocol])[0]
+    return make_protocol_vector(_protocol)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def best_database_match(protocol_hash, _protocol):
+    if API_URL:
+        best = api_client().search(_protocol, top_k=1, include_protocols=True)[0]
+        return best["protocol"], best["score"]
+    store = open_database_store()
+    embedding = protocol_embedding(protocol_hash, _protocol)
+    best_index, best_score = search(embedding, store.matrix, store.offsets, top_k=1)[0]
+    return store.protocol(best_index), best_score
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def pretty_procedure(protocol_hash, _protocol):
+    return make_pretty_procedure(_protocol)
+
+def show_timings(spans):
+    """Collapsible breakdown of where the time of this run went."""
+    with st.expander("⏱️ Timings"):
+        st.dataframe(pd.DataFrame(tracing.stage_totals(spans)).round(1), hide_index=True)
+        st.dataframe(pd.DataFrame([{"stage": "\u2003" * depth + record["name"],
+                                    "ms": round(record["duration_ms"], 1),
+                                    "details": ", ".join(f"{k}={v}" for k, v in record["attributes"].items())}
+                                   for depth, record in tracing.span_tree(spans)]), hide_index=True)
 
 def convert_mermaid_to_image(mermaid_code: str, format: str = "png") -> bytes:
     """
@@ -194,6 +226,8 @@ def create_spider_chart(protocol_scores: dict, chart_title: str = "Protocol Char
         st.warning("No data provided for the spider chart.")
         return
 
+    import plotly.graph_objects as go # Imported here so plotly only loads when a chart is drawn
+
     categories = list(protocol_scores.keys())
     values = list(protocol_scores.values())
 
@@ -220,17 +254,21 @@ def create_spider_chart(protocol_scores: dict, chart_title: str = "Protocol Char
     st.plotly_chart(fig, use_container_width=True)
 
 # --- Main Streamlit Application ---
+# Every stage of a run is traced and shown in the "Timings" panel at the bottom.
+# A run interrupted by a rerun never reached the end; close its recording here.
+interrupted_run = st.session_state.pop("run_trace", None)
+if interrupted_run is not None:
+    interrupted_run.stop()
+st.session_state["run_trace"] = tracing.record("streamlit.run")
+
 st.title("🔬 Protocompare")
 st.markdown("""
 Welcome to the *in silico* Protocol Comparator! Upload your research protocols to compare their content, steps, and key parameters.
 This tool is designed to help you streamline protocol analysis and identify differences or commonalities efficiently.
 """)
 
-# Load and convert image to base64
-logo_path = "logo.png"
-with open(logo_path, "rb") as f:
-    logo_data = f.read()
-encoded_logo = base64.b64encode(logo_data).decode()
+# Load and convert image to base64 (once per process)
+encoded_logo = load_logo_base64("logo.png")
 
 # Display centered, responsive, half-size image using HTML
 st.sidebar.markdown(
@@ -290,38 +328,66 @@ with col2:
 protocols_data = {}
 
 if uploaded_files:
+    get_client_resource()
+    extracted_texts = {}
     for i, uploaded_file in enumerate(uploaded_files):
         file_extension = os.path.splitext(uploaded_file.name)[1].lower()
-        extracted_text = ""
-
-        with st.spinner(f"Extracting text from {uploaded_file.name}..."):
+        if file_extension not in SUPPORTED_EXTENSIONS:
+            st.warning(f"Unsupported file type for {uploaded_file.name}: {file_extension}. Skipping.")
+            continue
+        file_bytes = uploaded_file.getvalue()
+        with st.spinner(f"Extracting text from {uploaded_file.name}..."), \
+                tracing.span("frontend.extract_text", file_name=uploaded_file.name):
             try:
-                if file_extension == ".pdf":
-                    extracted_text = extract_text_from_pdf(uploaded_file)
-                elif file_extension == ".docx":
-                    extracted_text = extract_text_from_docx(uploaded_file)
-                elif file_extension == ".txt":
-                    extracted_text = extract_text_from_txt(uploaded_file)
-                else:
-                    st.warning(f"Unsupported file type for {uploaded_file.name}: {file_extension}. Skipping.")
-                    continue
-
-                extracted_protocol = extract_protocol(extracted_text)
-                protocols_data[uploaded_file.name] = extracted_protocol
-                st.sidebar.success(f"Successfully extracted text from {uploaded_file.name}")
+                # PDF pages are parsed in parallel; results are cached by file hash across reruns
+                extracted_texts[uploaded_file.name] = extract_file_text(content_hash(file_bytes), uploaded_file.name,
+                                                                        file_bytes)
             except Exception as e:
                 st.sidebar.error(f"Error processing {uploaded_file.name}: {e}")
 
+    # Protocol extraction runs concurrently and streams; each step is shown as soon as it arrives.
+    # Texts that were extracted before (in any session) are not sent again.
+    text_hashes = {file_name: content_hash(text) for file_name, text in extracted_texts.items()}
+    extracted_protocols = {file_name: known_protocol(text_hash) for file_name, text_hash in text_hashes.items()}
+    extracted_protocols = {file_name: protocol for file_name, protocol in extracted_protocols.items()
+                           if protocol is not None}
+    to_extract = {file_name: text for file_name, text in extracted_texts.items() if file_name not in extracted_protocols}
+    if to_extract:
+        streamed_steps = {file_name: [] for file_name in to_extract}
+        step_status = {file_name: st.empty() for file_name in to_extract}
+        with st.spinner(f"Extracting protocols from {len(to_extract)} file(s)..."), \
+                tracing.span("frontend.extract_protocols", files=len(to_extract)):
+            for file_name, step, error in iter_stream_protocols(to_extract):
+                if step is not None:
+                    streamed_steps[file_name].append(step)
+                    step_status[file_name].caption(
+                        f"{file_name}: step {step['step_number']} - {step.get('action', '')}")
+                elif error is None:
+                    extracted_protocols[file_name] = streamed_steps[file_name]
+                    remember_protocol(text_hashes[file_name], streamed_steps[file_name])
+                    step_status[file_name].empty()
+                    st.sidebar.success(f"Successfully extracted text from {file_name}")
+                else:
+                    step_status[file_name].empty()
+                    st.sidebar.error(f"Error processing {file_name}: {error}")
+    # Keep upload order so "first two protocols" stays well defined
+    for file_name in extracted_texts:
+        if file_name in extracted_protocols:
+            protocols_data[file_name] = extracted_protocols[file_name]
+    protocol_hashes = {file_name: content_hash(protocol) for file_name, protocol in protocols_data.items()}
+
     if (compare_button and protocols_data and txt_count >= 2) or (search_button and protocols_data and txt_count == 1):
         st.header("Uploaded Protocols & Extracted Text")
         cols = st.columns(len(protocols_data))
         file_names = list(protocols_data.keys())
 
+        with st.spinner("Formatting procedures..."), tracing.span("frontend.format_procedures"):
+            pretty_procedures = format_procedures(tuple(protocol_hashes.items()), protocols_data)
+
         for idx, file_name in enumerate(file_names):
             with cols[idx]:
                 st.subheader(f"Protocol {idx + 1}")
-                pretty_procedure = make_pretty_procedure(protocols_data[file_name])
-                st.text_area(f"Text from Protocol {idx + 1}", pretty_procedure, height=300)
+                st.text_area(f"Text from Protocol {idx + 1}", pretty_procedures[file_name], height=300)
                 # st.metric("Word Count", len(protocols_data[file_name].split()))
 
         st.markdown("---")
@@ -348,30 +414,22 @@ if uploaded_files:
             # intersection = len(words1.intersection(words2))
             # union = len(words1.union(words2))
             # jaccard_similarity = intersection / union if union else 
-            embedding1 = make_protocol_vector(text1).cpu().numpy()
-            embedding2 = make_protocol_vector(text2).cpu().numpy()
-            jaccard_similarity,_,_ = compare(embedding1, embedding2)
+            with tracing.span("frontend.compare"):
+                embedding1 = protocol_embedding(protocol_hashes[file_names[0]], text1)
+                embedding2 = protocol_embedding(protocol_hashes[file_names[1]], text2)
+                jaccard_similarity,_,_ = compare(embedding1, embedding2)
             
             st.write(f"**Cosine Word Similarity between '{file_names[0]}' and '{file_names[1]}'is :** {jaccard_similarity:.2f}")
             st.progress(jaccard_similarity, text=f"Similarity: {jaccard_similarity:.0%}")
         elif search_button and len(protocols_data) == 1:
             # For search database, compare with a reference protocol or show similarity to database
             text1 = protocols_data[file_names[0]]
-            embedding1 = make_protocol_vector(text1).cpu().numpy()
 
-            with open(os.path.join(get_database_dir_path(), 'database.json'), 'r', encoding='utf-8') as f:
-                database_content = json.load(f)
-
-            similarity_scores = []
-            for entry in database_content:
-                emb2 = np.array(entry['embedded_protocol'])
-                jaccard_similarity,_,_ = compare(embedding1, emb2)
-                similarity_scores.append((entry['protocol'], jaccard_similarity))
-            
-            highest_similarity = max(similarity_scores, key=lambda x: x[1])
-            # best_match_index = find_database_index_by_doi(database_content, highest_similarity[0])
-            # if best_match_index is not None:
-            best_text = make_pretty_procedure(highest_similarity[0])
+            with tracing.span("frontend.search"):
+                highest_similarity = best_database_match(protocol_hashes[file_names[0]], text1)
+                # best_match_index = find_database_index_by_doi(database_content, highest_similarity[0])
+                # if best_match_index is not None:
+                best_text = pretty_procedure(content_hash(highest_similarity[0]), highest_similarity[0])
             st.write(f"**Highest Similarity with Database Reference:** ({highest_similarity[1]:.2f}), with the following protocol: {best_text}")
         st.markdown("---")
 
@@ -412,6 +470,8 @@ if uploaded_files:
                 "Safety": 7
             }
             
+            import plotly.graph_objects as go
+
             fig = go.Figure()
             fig.add_trace(go.Scatterpolar(
                 r=list(mock_protocol_1_scores.values()),
@@ -449,6 +509,8 @@ if uploaded_files:
 else:
     st.info("Upload protocol documents in the sidebar to begin comparison.")
 
+show_timings(st.session_state.pop("run_trace").stop())
+
 def find_database_index_by_doi(database_content, doi):
     for i, entry in enumerate(database_content):
         if entry['doi'] == doi:
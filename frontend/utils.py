@@ -3,3 +3,6 @@ import os
 def get_database_dir_path():
     script_directory = os.path.dirname(os.path.abspath(__file__))
     return script_directory
+
+def get_store_dir_path():
+    return os.path.join(get_database_dir_path(), 'store')
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from backend.alignment import align
+
+
+def reference_score(sim, gap, local=False):
+    """Plain O(n_a * n_b) Needleman-Wunsch / Smith-Waterman."""
+    n_a, n_b = sim.shape
+    score = np.zeros((n_a + 1, n_b + 1))
+    if not local:
+        score[:, 0] = -gap * np.arange(n_a + 1)
+        score[0, :] = -gap * np.arange(n_b + 1)
+    for i in range(1, n_a + 1):
+        for j in range(1, n_b + 1):
+            best = max(score[i - 1, j - 1] + sim[i - 1, j - 1], score[i - 1, j] - gap, score[i, j - 1] - gap)
+            score[i, j] = max(best, 0.0) if local else best
+    return score.max() if local else score[n_a, n_b]
+
+
+def pairs_score(sim, pairs, gap):
+    return sum(sim[i, j] if i is not None and j is not None else -gap for i, j in pairs)
+
+
+@pytest.mark.parametrize("shape", [(1, 1), (3, 7), (8, 5), (10, 10)])
+@pytest.mark.parametrize("gap", [0.0, 0.3])
+def test_global_matches_reference(shape, gap):
+    sim = np.random.default_rng(sum(shape)).uniform(-1, 1, size=shape)
+    score, pairs = align(sim, gap)
+    assert score == pytest.approx(reference_score(sim, gap))
+    # Every step appears exactly once, in order, and the path adds up to the score
+    assert [i for i, _ in pairs if i is not None] == list(range(shape[0]))
+    assert [j for _, j in pairs if j is not None] == list(range(shape[1]))
+    assert pairs_score(sim, pairs, gap) == pytest.approx(score)
+
+
+@pytest.mark.parametrize("shape", [(4, 9), (7, 7)])
+def test_local_matches_reference(shape):
+    sim = np.random.default_rng(1).uniform(-1, 1, size=shape)
+    score, pairs = align(sim, 0.5, local=True)
+    assert score == pytest.approx(reference_score(sim, 0.5, local=True))
+    assert pairs_score(sim, pairs, 0.5) == pytest.approx(score)
+
+
+def test_wide_band_equals_full():
+    sim = np.random.default_rng(2).uniform(-1, 1, size=(9, 6))
+    assert align(sim, 0.2, band=20) == align(sim, 0.2)
+    assert align(sim, 0.2, band=1)[0] <= align(sim, 0.2)[0] + 1e-12
+
+
+def test_identity_aligns_diagonal():
+    score, pairs = align(np.eye(4), gap=0.5)
+    assert score == pytest.approx(4.0)
+    assert pairs == [(0, 0), (1, 1), (2, 2), (3, 3)]
+
+
+def test_empty_and_invalid():
+    assert align(np.zeros((0, 3)), gap=1.0) == (-3.0, [(None, 0), (None, 1), (None, 2)])
+    assert align(np.zeros((2, 0)), local=True) == (0.0, [])
+    with pytest.raises(ValueError):
+        align(np.ones((2, 2)), band=0)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from backend.ann import (ann_search, build_index, check_index, load_index, recall_report, save_index,
+                         update_index)
+from backend.compare import search
+from backend.store import EmbeddingStore
+
+
+def clustered_store(path, n=30, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(6, dim))
+    store = EmbeddingStore.create(path, dim)
+    for i in range(n):
+        steps = centers[rng.integers(0, len(centers), int(rng.integers(2, 7)))]
+        store.append(f"doi/{i}", steps + 0.3 * rng.normal(size=steps.shape))
+    store.flush()
+    return store
+
+
+def test_recall_against_exact_search(tmp_path):
+    store = clustered_store(str(tmp_path / "store"))
+    index = build_index(store, n_lists=8)
+    # Probing every list with enough hits per query step finds exactly what the brute-force search finds
+    report = recall_report(index, store, k=5, n_queries=10, nprobes=(1, 8), steps_per_query=store.n_rows)
+    assert report[-1]["recall_at_k"] == 1.0
+    assert 0 < report[0]["recall_at_k"] <= 1.0
+    query = store.vectors(3)
+    exact = search(query, store.matrix, store.offsets, top_k=5)
+    found = ann_search(index, query, store.vectors, 5, steps_per_query=store.n_rows, nprobe=8)
+    assert [i for i, _ in found] == [i for i, _ in exact]
+    for (_, score), (_, expected) in zip(found, exact):
+        assert score == pytest.approx(expected, abs=1e-5)
+
+
+def test_insert_covers_new_protocols(tmp_path):
+    path = str(tmp_path / "store")
+    store = clustered_store(path, n=20)
+    index = build_index(store, n_lists=4)
+    assert index.n_protocols == 20
+
+    writer = EmbeddingStore.open(path, writable=True)
+    rng = np.random.default_rng(1)
+    for i in range(3):
+        writer.append(f"new/{i}", rng.normal(size=(3, store.dim)))
+    writer.flush()
+    store = EmbeddingStore.open(path)
+    with pytest.raises(ValueError, match="Stale"):
+        check_index(index, len(store))
+    with pytest.raises(ValueError, match="Stale"):
+        ann_search(index, store.vectors(0), store.vectors, n_protocols=len(store))
+
+    assert update_index(index, store) == 3
+    assert index.n_protocols == 23 and len(index) == store.n_rows
+    assert update_index(index, store) == 0
+    check_index(index, len(store))
+    # A new protocol is its own best match
+    assert ann_search(index, store.vectors(22), store.vectors, 1, nprobe=4)[0][0] == 22
+
+    save_index(index, str(tmp_path / "ann"))
+    reloaded = load_index(str(tmp_path / "ann"))
+    assert reloaded.n_protocols == 23 and len(reloaded) == len(index) == store.n_rows
+    assert ann_search(reloaded, store.vectors(21), store.vectors, 1)[0][0] == 21
+    # Saving again swaps the directory while the old files are memory-mapped
+    save_index(reloaded, str(tmp_path / "ann"))
+    assert load_index(str(tmp_path / "ann")).n_protocols == 23
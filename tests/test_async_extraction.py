@@ -0,0 +1,87 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from backend import data_extraction
+
+
+class FakeClient:
+    """Chat completions answering every document with one step, failing the first `failures` calls."""
+
+    def __init__(self, failures=0, error=asyncio.TimeoutError):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+        self.active = self.peak = 0
+        self.answer = None
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, temperature, stream=False, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error()
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        step = {"step_number": 1, "step_type": "mixing", "input": "", "output": "",
+                "action": messages[-1]["content"], "parameter": {}}
+        content = json.dumps([step]) if self.answer is None else self.answer
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+        return self.stream(content)
+
+    async def stream(self, content):
+        for start in range(0, len(content), 8):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[start:start + 8]))])
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(data_extraction, "get_async_client", lambda: fake)
+    monkeypatch.setattr(data_extraction, "RETRY_BASE_DELAY", 0.0)
+    return fake
+
+
+def test_extracts_concurrently_with_bounded_concurrency(client):
+    texts = {f"doc{i}": f"text {i}" for i in range(8)}
+    results = list(data_extraction.iter_extract_protocols(texts, concurrency=3, use_cache=False))
+    assert sorted(key for key, _, _ in results) == sorted(texts)
+    for key, protocol, error in results:
+        assert error is None and [step["action"] for step in protocol] == [texts[key]]
+    assert client.peak <= 3
+
+
+def test_retries_transient_errors(client):
+    client.failures = 2
+    protocol = asyncio.run(data_extraction.extract_protocol_async("text", use_cache=False, max_retries=2))
+    assert [step["action"] for step in protocol] == ["text"] and client.calls == 3
+
+
+def test_reports_permanent_errors_per_document(client):
+    client.failures, client.error = 1, ValueError
+    results = dict((key, (protocol, error)) for key, protocol, error in
+                   data_extraction.iter_extract_protocols({"bad": "x"}, use_cache=False))
+    assert isinstance(results["bad"][1], ValueError) and client.calls == 1
+
+
+@pytest.mark.parametrize("answer, cached", [
+    (json.dumps([{"step_number": 1, "step_type": "heating", "input": "a", "output": "b", "action": "heat",
+                  "parameter": {}}]), True),
+    # Cut off inside the second step: the first is kept, but the answer is asked for again next time
+    ('[{"step_number": 1, "step_type": "heating", "input": "a", "output": "b", "action": "heat", '
+     '"parameter": {}}, {"step_number": 2, "step_type": "cool', False),
+    ("[]", False),
+])
+def test_caches_only_complete_answers(client, tmp_path, monkeypatch, answer, cached):
+    monkeypatch.setenv("PROTOCOMPARE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(data_extraction, "_caches", {})
+    client.answer = answer
+    first = asyncio.run(data_extraction.extract_protocol_async("document"))
+    calls = client.calls
+    assert asyncio.run(data_extraction.extract_protocol_async("document")) == first
+    assert client.calls == (calls if cached else 2 * calls)
+    assert (data_extraction._get_cache("extractions", data_extraction.SYSTEM_PROMPT)
+            .get_json(data_extraction.extraction_cache_key("document")) is not None) == cached
+    assert [step["action"] for step in first[:1]] == ([] if answer == "[]" else ["heat"])
@@ -0,0 +1,94 @@
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from backend import cache as cache_module
+from backend.cache import DiskCache, EmbeddingCache, LRUCache
+
+
+def test_version_change_drops_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = DiskCache(path, version="prompt-1")
+    cache.set_json("doc", [{"action": "heat"}])
+    cache.set("raw", b"bytes")
+    cache.close()
+
+    same = DiskCache(path, version="prompt-1")
+    assert same.get_json("doc") == [{"action": "heat"}]
+    assert same.get("raw") == b"bytes" and len(same) == 2
+    same.close()
+
+    changed = DiskCache(path, version="prompt-2")
+    assert changed.get_json("doc") is None and len(changed) == 0
+    changed.set_json("doc", [{"action": "cool"}])
+    changed.close()
+    # Going back to the old version does not resurrect old entries either
+    assert DiskCache(path, version="prompt-1").get("doc") is None
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Strictly increasing access times, so LRU order does not depend on timer resolution
+    ticks = itertools.count()
+    monkeypatch.setattr(cache_module.time, "time", lambda: float(next(ticks)))
+
+
+def test_evicts_least_recently_used_entries(tmp_path, clock):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), max_entries=3)
+    for key in "abc":
+        cache.set(key, b"x")
+    assert cache.get("a") == b"x"
+    cache.set("d", b"x")
+    assert len(cache) == 3
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == [b"x"] * 3
+
+
+def test_evicts_by_total_size(tmp_path, clock):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), max_entries=None, max_bytes=250)
+    for key in "abcd":
+        cache.set(key, b"x" * 100)
+    assert len(cache) == 2
+    assert cache.get("a") is None and cache.get("d") == b"x" * 100
+
+
+def test_limits_apply_across_writers(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    first, second = DiskCache(path, max_entries=4), DiskCache(path, max_entries=4)
+    first.set_many([(f"a{i}", b"x") for i in range(3)])
+    second.set_many([(f"b{i}", b"x") for i in range(3)])
+    assert len(first) == len(second) == 4
+    assert first.get("a0") is None and second.get("b2") == b"x"
+
+
+def test_embedding_cache_hot_tier(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path, "model", hot_entries=2)
+    vectors = np.eye(3, dtype=np.float32)
+    cache.put_many(["Heat  the sample", "cool", "stir"], vectors)
+    assert len(cache._hot) == 2
+    found = cache.get_many(["heat the sample", "stir", "unknown"])
+    np.testing.assert_array_equal(found[0], vectors[0])
+    np.testing.assert_array_equal(found[1], vectors[2])
+    assert found[2] is None
+    assert cache.stats == {"hot_hits": 1, "disk_hits": 1, "misses": 1}
+    # Vectors of another model are never returned
+    assert EmbeddingCache(path, "other-model").get_many(["stir"]) == [None]
+
+
+def test_lru_cache_is_bounded():
+    cache = LRUCache(3)
+    for key in "abc":
+        cache.put(key, key.upper())
+    assert cache.get("a") == "A"
+    cache.put("d", "D")
+    assert len(cache) == 3 and cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["A", "C", "D"]
+    assert cache.get("missing", "default") == "default"
+
+
+def test_lru_cache_shared_between_threads():
+    cache = LRUCache(50)
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: (cache.put(i % 80, i), cache.get((i * 7) % 80)), range(2000)))
+    assert len(cache) == 50
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from backend.compare import compare, rerank, search
+
+
+def random_corpus(seed=0, n=12, dim=16):
+    rng = np.random.default_rng(seed)
+    protocols = [rng.normal(size=(int(rng.integers(1, 9)), dim)) for _ in range(n)]
+    offsets = np.concatenate([[0], np.cumsum([len(p) for p in protocols])])
+    matrix = np.concatenate([p / np.linalg.norm(p, axis=1, keepdims=True) for p in protocols]).astype(np.float32)
+    return rng.normal(size=(5, dim)), protocols, matrix, offsets
+
+
+def test_search_matches_compare():
+    query, protocols, matrix, offsets = random_corpus()
+    expected = {i: compare(query, p)[0] for i, p in enumerate(protocols)}
+    results = search(query, matrix, offsets, top_k=None, chunk_rows=7)
+    assert len(results) == len(protocols)
+    for i, score in results:
+        assert score == pytest.approx(expected[i], abs=1e-5)
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_search_top_k_and_candidates():
+    query, protocols, matrix, offsets = random_corpus(1)
+    full = search(query, matrix, offsets, top_k=None)
+    assert search(query, matrix, offsets, top_k=3) == full[:3]
+    candidates = [7, 2, 9]
+    filtered = search(query, matrix, offsets, top_k=None, candidates=candidates)
+    assert sorted(i for i, _ in filtered) == sorted(candidates)
+    for i, score in filtered:
+        assert score == pytest.approx(dict(full)[i], abs=1e-6)
+
+
+def test_rerank_orders_by_mode_score():
+    query, protocols, _, _ = random_corpus(2)
+    results = rerank(query, range(len(protocols)), lambda i: protocols[i], top_k=4, mode="ordered")
+    assert len(results) == 4
+    for i, score in results:
+        assert score == pytest.approx(compare(query, protocols[i], "ordered")[0])
+    assert [s for _, s in results] == sorted((s for _, s in results), reverse=True)
+
+
+def test_compare_identical_protocols():
+    steps = np.random.default_rng(3).normal(size=(4, 8))
+    for mode in ("greedy", "assignment", "ordered", "local"):
+        assert compare(steps, steps, mode)[0] == pytest.approx(1.0)
+    with pytest.raises(ValueError):
+        compare(steps, steps, "unknown")
+
+
+def test_ordered_mode_penalizes_reordering():
+    steps = np.eye(4)
+    reversed_steps = steps[::-1]
+    assert compare(steps, reversed_steps, "assignment")[0] == pytest.approx(1.0)
+    score, alignment, sim_matrix = compare(steps, reversed_steps, "ordered", return_alignment=True)
+    assert score == pytest.approx(0.25) and sim_matrix is None
+    matched = [(i, j) for i, j in alignment if i is not None and j is not None]
+    assert matched == sorted(matched) and [j for _, j in matched] == sorted(j for _, j in matched)
+    # Greedy scoring solves no assignment unless the alignment is requested
+    assert compare(steps, reversed_steps)[1] is None
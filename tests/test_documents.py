@@ -0,0 +1,58 @@
+from io import BytesIO
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+from backend import documents
+
+
+class FakePage:
+    def __init__(self, text, calls):
+        self.text = text
+        self.calls = calls
+
+    def extract_text(self):
+        self.calls.append(self.text)
+        return self.text
+
+
+PAGES = ["Title page\n", "Experimental Section\nHeat the sample.\n", "Stir for 2 h.\n",
+         "References\n1. A paper\n", "NMR spectra\n"]
+
+
+@pytest.fixture
+def pdf(tmp_path, monkeypatch):
+    calls = []
+
+    class FakeReader:
+        def __init__(self, stream):
+            self.pages = [FakePage(text, calls) for text in PAGES]
+
+    monkeypatch.setattr(pypdf, "PdfReader", FakeReader)
+    monkeypatch.setenv("PROTOCOMPARE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(documents, "_page_cache", None)
+    return calls
+
+
+def test_pages_are_cached_by_file_hash(pdf):
+    text = documents.extract_text_from_pdf(BytesIO(b"%PDF-1 a"), workers=1)
+    assert text == "".join(PAGES) and len(pdf) == len(PAGES)
+    assert documents.extract_text_from_pdf(BytesIO(b"%PDF-1 a"), workers=1) == text
+    assert len(pdf) == len(PAGES)
+    # Different bytes are a different file
+    documents.extract_text_from_pdf(BytesIO(b"%PDF-1 b"), workers=1)
+    assert len(pdf) == 2 * len(PAGES)
+
+
+def test_stop_after_methods(pdf):
+    pages = list(documents.iter_pdf_pages(BytesIO(b"%PDF-1 c"), workers=1, stop_after_methods=True))
+    # Reading stops on the page where the next section starts; the spectra are never parsed
+    assert pages == PAGES[:4]
+    assert "NMR spectra\n" not in pdf
+    assert documents.extract_text(BytesIO(b"%PDF-1 c"), "paper.pdf") == "".join(PAGES)
+
+
+def test_methods_section_end():
+    text = "Intro\n2. Experimental Section\nHeat.\n3. Conclusions\nDone."
+    assert text[documents.methods_section_end(text):].startswith("3. Conclusions")
+    assert documents.methods_section_end("Experimental Section\nHeat, no next heading.") is None
+    assert documents.methods_section_end("No methods here.\nReferences\n") is None
@@ -0,0 +1,22 @@
+import pytest
+from backend.encoders import configured_encoder, encoder_id
+
+
+def test_encoder_ids_separate_incompatible_vectors(monkeypatch):
+    assert encoder_id("mpnet") == "all-mpnet-base-v2"
+    assert encoder_id("minilm") == "all-MiniLM-L6-v2"
+    monkeypatch.setenv("PROTOCOMPARE_ONNX_QUANTIZATION", "avx2")
+    avx2 = encoder_id("mpnet-onnx-int8")
+    monkeypatch.setenv("PROTOCOMPARE_ONNX_QUANTIZATION", "arm64")
+    arm64 = encoder_id("mpnet-onnx-int8")
+    assert avx2 == "all-mpnet-base-v2:onnx-int8-avx2" and arm64 == "all-mpnet-base-v2:onnx-int8-arm64"
+
+
+def test_configured_encoder(monkeypatch):
+    monkeypatch.delenv("PROTOCOMPARE_ENCODER", raising=False)
+    assert configured_encoder() == "mpnet"
+    monkeypatch.setenv("PROTOCOMPARE_ENCODER", "minilm-onnx-int8")
+    assert configured_encoder() == "minilm-onnx-int8"
+    monkeypatch.setenv("PROTOCOMPARE_ENCODER", "unknown")
+    with pytest.raises(ValueError):
+        configured_encoder()
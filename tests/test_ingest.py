@@ -0,0 +1,60 @@
+import json
+import numpy as np
+import pytest
+from backend import ingest as ingest_module
+from backend.store import EmbeddingStore
+
+
+def fake_embed_protocols(protocols, *args, **kwargs):
+    vectors = []
+    for protocol in protocols:
+        rng = np.random.default_rng(len(json.dumps(protocol)))
+        vectors.append(rng.normal(size=(len(protocol), 8)).astype(np.float32))
+    return vectors
+
+
+def write_records(path, names):
+    records = [{"doi": name, "protocol": [{"action": f"{name} step {j}"} for j in range(3)]} for name in names]
+    path.write_text(json.dumps(records))
+    return str(path)
+
+
+def test_rerun_resumes_after_a_crash(tmp_path, monkeypatch):
+    inputs = write_records(tmp_path / "papers.json", ["a", "b", "c", "d", "e"])
+    store_path = str(tmp_path / "store")
+    calls = []
+
+    def crash_on_second_batch(protocols, *args, **kwargs):
+        calls.append(protocols)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return fake_embed_protocols(protocols)
+
+    monkeypatch.setattr(ingest_module, "embed_protocols", crash_on_second_batch)
+    with pytest.raises(KeyboardInterrupt):
+        ingest_module.ingest([inputs], store_path, batch_size=2, log=lambda message: None)
+    # Only the first full batch was flushed
+    assert [EmbeddingStore.open(store_path).doi(i) for i in range(2)] == ["a", "b"]
+    assert len(EmbeddingStore.open(store_path)) == 2
+
+    monkeypatch.setattr(ingest_module, "embed_protocols", fake_embed_protocols)
+    stats = ingest_module.ingest([inputs], store_path, batch_size=2, log=lambda message: None)
+    assert stats["skipped"] == 2 and stats["ingested"] == 3
+    store = EmbeddingStore.open(store_path)
+    assert [store.doi(i) for i in range(len(store))] == ["a", "b", "c", "d", "e"]
+    assert store.protocol(4) == [{"action": f"e step {j}"} for j in range(3)]
+
+    stats = ingest_module.ingest([inputs], store_path, batch_size=2, log=lambda message: None)
+    assert stats["skipped"] == 5 and stats["ingested"] == 0
+
+
+def test_ingest_updates_the_ann_index(tmp_path, monkeypatch):
+    from backend.ann import ANN_DIR, build_index, load_index, save_index
+    monkeypatch.setattr(ingest_module, "embed_protocols", fake_embed_protocols)
+    store_path = str(tmp_path / "store")
+    ingest_module.ingest([write_records(tmp_path / "first.json", ["a", "b", "c"])], store_path, log=lambda m: None)
+    save_index(build_index(EmbeddingStore.open(store_path), n_lists=2), f"{store_path}/{ANN_DIR}")
+
+    ingest_module.ingest([write_records(tmp_path / "second.json", ["d", "e"])], store_path, log=lambda m: None)
+    index = load_index(f"{store_path}/{ANN_DIR}")
+    assert index.n_protocols == 5 and len(index) == EmbeddingStore.open(store_path).n_rows
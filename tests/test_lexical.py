@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from backend.compare import rerank, search
+from backend.lexical import LexicalIndex, fuse, hybrid_search, load_lexical_index, tokenize, update_lexical_index
+from backend.store import EmbeddingStore
+
+PROTOCOLS = [
+    ["heat citric acid in a teflon-lined autoclave", "cool to room temperature"],
+    ["stir urea in water", "heat the solution"],
+    ["centrifuge at 12000 rpm", "wash with water", "dry the pellet"],
+    ["dialyse against water for two days"],
+]
+
+
+def bm25(protocols, query, k1=1.2, b=0.75):
+    """Reference BM25 scores, term by term."""
+    docs = [[token for text in protocol for token in tokenize(text)] for protocol in protocols]
+    avg_length = np.mean([len(doc) for doc in docs])
+    scores = np.zeros(len(docs))
+    for term in set(query):
+        n = sum(term in doc for doc in docs)
+        idf = np.log1p((len(docs) - n + 0.5) / (n + 0.5))
+        for i, doc in enumerate(docs):
+            tf = doc.count(term)
+            scores[i] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_length))
+    return scores
+
+
+def test_tokenize_keeps_compounds():
+    assert tokenize("Teflon-lined, O.basilicum 4 h") == ["teflon-lined", "teflon", "lined", "o.basilicum", "o",
+                                                         "basilicum", "4", "h"]
+
+
+def test_bm25_scores_and_ranking():
+    index = LexicalIndex.build(PROTOCOLS)
+    query = tokenize("heat water autoclave")
+    expected = bm25(PROTOCOLS, query)
+    np.testing.assert_allclose(index.scores(query), expected, rtol=1e-5)
+    ranked = index.search(query)
+    assert [i for i, _ in ranked] == list(np.argsort(-expected, kind="stable")[:len(ranked)])
+    # The protocol with the rare "autoclave" ranks first
+    assert ranked[0][0] == 0
+    assert index.search(tokenize("sonicate")) == []
+    # Candidate ids past the index (protocols stored since it was built) are ignored
+    assert [i for i, _ in index.search(query, candidates=[1, 3, 7])] == [1, 3]
+
+
+def test_store_index_is_updated_in_segments(tmp_path):
+    path = str(tmp_path)
+    rng = np.random.default_rng(0)
+    store = EmbeddingStore.create(path, 4)
+    for i, protocol in enumerate(PROTOCOLS):
+        store.append(f"doi/{i}", rng.normal(size=(len(protocol), 4)), protocol)
+        store.flush()
+        assert update_lexical_index(store) == 1
+    assert update_lexical_index(store, max_segments=2) == 0
+    query = tokenize("wash the pellet with water")
+    index = load_lexical_index(path)
+    assert len(index) == len(PROTOCOLS)
+    np.testing.assert_allclose(index.scores(query), LexicalIndex.build(PROTOCOLS).scores(query), rtol=1e-5)
+
+
+def test_fusion_weights():
+    lexical = [(2, 9.0), (0, 3.0), (1, 1.0)]
+    dense = [(1, 0.9), (0, 0.8), (2, 0.1), (3, 0.05)]
+    # alpha=1 keeps the dense ordering, alpha=0 the lexical one
+    assert [i for i, _ in fuse(lexical, dense, "weighted", alpha=1.0)] == [1, 0, 2, 3]
+    assert [i for i, _ in fuse(lexical, dense, "weighted", alpha=0.0)][:3] == [2, 0, 1]
+    # Greedy dense scores grow past 1 with protocol length; both lists are scaled to peak at 1
+    assert fuse([(0, 1.0)], [(1, 4.0), (0, 0.4)], "weighted", alpha=0.5)[0] == (0, pytest.approx(0.55))
+    rrf = dict(fuse(lexical, dense, "rrf"))
+    assert rrf[0] == pytest.approx(2 / 62) and rrf[3] == pytest.approx(1 / 64)
+    with pytest.raises(ValueError):
+        fuse(lexical, dense, "max")
+
+
+def test_hybrid_search_falls_back_to_dense_ranking():
+    rng = np.random.default_rng(1)
+    protocols = [rng.normal(size=(len(protocol), 8)) for protocol in PROTOCOLS]
+    matrix = np.concatenate(protocols)
+    offsets = np.concatenate([[0], np.cumsum([len(p) for p in protocols])])
+    index = LexicalIndex.build(PROTOCOLS)
+    query = protocols[2] + 0.01 * rng.normal(size=protocols[2].shape)
+    # No query term is indexed, so every protocol is ranked densely
+    found = hybrid_search(query, ["sonicate"], index, matrix, offsets, protocols.__getitem__, top_k=2,
+                          mode="ordered")
+    dense = search(query, matrix, offsets, top_k=None)
+    assert found == rerank(query, [i for i, _ in dense], protocols.__getitem__, 2, "ordered")
+    assert found[0][0] == 2
+    # With BM25 hits only the lexical candidates are scored
+    found = hybrid_search(query, ["pellet dried"], index, matrix, offsets, protocols.__getitem__, top_k=5)
+    assert [i for i, _ in found] == [2]
@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+
+openai = pytest.importorskip("openai")
+from backend import data_extraction
+from backend.mock_llm import FALLBACK_RESPONSE, MockLLMServer
+
+
+@pytest.fixture
+def mock_llm(monkeypatch):
+    servers = []
+
+    def start(**options):
+        server = MockLLMServer(port=0, **options).start()
+        servers.append(server)
+        data_extraction.configure_client(base_url=server.url, api_key="test", timeout=10)
+        return server
+
+    monkeypatch.setattr(data_extraction, "RETRY_BASE_DELAY", 0.01)
+    yield start
+    data_extraction.configure_client()
+    for server in servers:
+        server.stop()
+
+
+def test_retries_injected_errors(mock_llm):
+    server = mock_llm(error_rate=0.3, rate_limit_rate=0.3, seed=0)
+    texts = {f"doc{i}": f"document {i}" for i in range(10)}
+    results = list(data_extraction.iter_extract_protocols(texts, concurrency=4, use_cache=False, max_retries=30))
+    assert sorted(key for key, _, _ in results) == sorted(texts)
+    assert all(error is None for _, _, error in results)
+    assert all(protocol == data_extraction.extract_json_from_response(FALLBACK_RESPONSE)
+               for _, protocol, _ in results)
+    stats = server.stats()
+    assert stats["errors"] + stats["rate_limited"] > 0
+    assert stats["requests"] == len(texts) + stats["errors"] + stats["rate_limited"]
+
+
+def test_backoff_grows_exponentially_up_to_the_cap(mock_llm, monkeypatch):
+    server = mock_llm(error_rate=1.0)
+    monkeypatch.setattr(data_extraction, "RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(data_extraction, "RETRY_MAX_DELAY", 0.004)
+    bounds = []
+    # Full jitter: each delay is drawn from [0, bound]; record the bounds and wait the longest possible
+    monkeypatch.setattr(data_extraction.random, "uniform", lambda low, high: bounds.append(high) or high)
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(data_extraction.extract_protocol_async("text", use_cache=False, max_retries=4))
+    assert bounds == [0.001, 0.002, 0.004, 0.004]
+    assert server.stats()["requests"] == 5
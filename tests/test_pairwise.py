@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from backend.compare import compare
+from backend.pairwise import pairwise_matrix
+
+
+def random_protocols(seed=0, n=9, dim=12):
+    rng = np.random.default_rng(seed)
+    return [rng.normal(size=(int(rng.integers(1, 7)), dim)) for _ in range(n)]
+
+
+def expected_matrix(protocols):
+    n = len(protocols)
+    expected = np.zeros((n, n))
+    for a in range(n):
+        for b in range(n):
+            if len(protocols[a]) and len(protocols[b]):
+                expected[a, b] = compare(protocols[a], protocols[b])[0]
+    return expected
+
+
+@pytest.mark.parametrize("block_rows", [1, 5, 2048])
+def test_matches_compare(block_rows):
+    protocols = random_protocols()
+    scores = pairwise_matrix(protocols, workers=1, block_rows=block_rows)
+    np.testing.assert_allclose(scores, expected_matrix(protocols), atol=1e-5)
+
+
+def test_empty_protocol_scores_zero():
+    protocols = random_protocols(1, n=4)
+    protocols.insert(2, np.empty((0, 12)))
+    scores = pairwise_matrix(protocols, workers=1, block_rows=3)
+    assert not scores[2].any() and not scores[:, 2].any()
+    np.testing.assert_allclose(scores, expected_matrix(protocols), atol=1e-5)
+
+
+def test_threshold_gives_sparse_matrix():
+    pytest.importorskip("scipy")
+    protocols = random_protocols(2)
+    dense = pairwise_matrix(protocols, workers=1, block_rows=4)
+    sparse = pairwise_matrix(protocols, workers=1, block_rows=4, threshold=0.3)
+    np.testing.assert_allclose(sparse.toarray(), np.where(dense >= 0.3, dense, 0), atol=1e-6)
+
+
+def test_checkpoints_resume(tmp_path):
+    protocols = random_protocols(3)
+    first = pairwise_matrix(protocols, workers=1, block_rows=4, checkpoint_dir=str(tmp_path))
+    calls = []
+    again = pairwise_matrix(protocols, workers=1, block_rows=4, checkpoint_dir=str(tmp_path),
+                            progress=lambda done, total: calls.append((done, total)))
+    np.testing.assert_array_equal(first, again)
+    # Every tile was read back from its checkpoint
+    assert calls[0][0] == calls[0][1]
+    with pytest.raises(ValueError):
+        pairwise_matrix(random_protocols(4), workers=1, block_rows=4, checkpoint_dir=str(tmp_path))
+
+
+def test_worker_processes():
+    protocols = random_protocols(5)
+    np.testing.assert_allclose(pairwise_matrix(protocols, workers=2, block_rows=6),
+                               pairwise_matrix(protocols, workers=1, block_rows=6), atol=1e-6)
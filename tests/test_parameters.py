@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from backend.parameters import (ParameterIndex, normalize_parameters, parse_condition, parse_materials,
+                                parse_quantities, parse_where)
+
+
+@pytest.mark.parametrize("text, key, expected", [
+    ("180 °C", "", [("temperature", 180.0)]),
+    ("4 h", "", [("duration", 14400.0)]),
+    ("12,000 rpm", "", [("speed", 12000.0)]),
+    ("0.45 μm", "", [("length", 4.5e-7)]),
+    ("100 mL", "", [("volume", 0.1)]),
+    ("100/150/200°C", "", [("temperature", 100.0), ("temperature", 150.0), ("temperature", 200.0)]),
+    ("-9 to -12ºC", "", [("temperature", -9.0), ("temperature", -12.0)]),
+    ("95 °C for 5 min", "", [("temperature", 95.0), ("duration", 300.0)]),
+    ("10 ± 2 min", "", [("duration", 600.0)]),
+    ("room temperature", "", [("temperature", 25.0)]),
+    ("13,250", "rcf", [("force", 13250.0)]),
+    ("10,000 g", "speed", [("force", 10000.0)]),
+    (90, "", []),
+    # Rates and concentrations are not quantities of their own
+    ("4 °C/min", "", []),
+    ("2.5 mg/mL", "", []),
+])
+def test_parse_quantities(text, key, expected):
+    quantities = parse_quantities(text, key)
+    assert [kind for kind, _ in quantities] == [kind for kind, _ in expected]
+    assert [value for _, value in quantities] == pytest.approx([value for _, value in expected])
+
+
+def test_normalize_parameters_keeps_highest():
+    parameter = {"temperature_1": "100 °C", "temperature_2": "150 °C", "time": ["2 h", "30 min"],
+                 "solvent": {"volume": "5 mL"}, "note": None}
+    assert normalize_parameters(parameter) == pytest.approx({"temperature": 150.0, "duration": 7200.0,
+                                                             "volume": 0.005})
+
+
+def test_parse_materials():
+    assert parse_materials("2.0 g of O. basilicum L. seed, 100 mL distilled water") == \
+        ["o. basilicum l. seed", "distilled water"]
+    assert parse_materials(["urea", "citric acid (99%)"]) == ["urea", "citric acid"]
+    assert parse_materials(None) == []
+
+
+def test_parse_condition():
+    assert parse_condition("temperature", ">=150 °C") == (150.0, np.inf)
+    assert parse_condition("duration", "< 30 min") == (-np.inf, 1800.0)
+    assert parse_condition("temperature", "150-200 °C") == (150.0, 200.0)
+    assert parse_condition("speed", "5000") == (5000.0, 5000.0)
+    assert parse_condition("temperature", (None, 20)) == (-np.inf, 20.0)
+    with pytest.raises(ValueError):
+        parse_condition("temperature", ">=2 h")
+    with pytest.raises(ValueError):
+        parse_condition("pressure", "1 bar")
+    assert parse_where(["step_type=heating", "temperature=>=150 °C"]) == \
+        {"step_type": "heating", "temperature": ">=150 °C"}
+
+
+def test_parameter_index():
+    pytest.importorskip("pyarrow")
+    from backend.table import records_to_table
+
+    records = [
+        {"doi": "a", "protocol": [{"step_type": "Heating", "input": "citric acid, urea",
+                                   "parameter": {"temperature": "180 °C", "time": "4 h"}}]},
+        {"doi": "b", "protocol": [{"step_type": "heating", "parameter": {"temperature": "90 °C"}},
+                                  {"step_type": "centrifugation", "parameter": {"speed": "10,000 rpm"}}]},
+        {"doi": "c", "protocol": [{"step_type": "dialysis", "input": "distilled water", "parameter": {}}]},
+    ]
+    index = ParameterIndex.from_table(records_to_table(records))
+    assert len(index) == 4
+    assert index.protocols(step_type="heating").tolist() == [0, 1]
+    assert index.protocols(step_type="heating", temperature=">=150 °C").tolist() == [0]
+    assert index.protocols(temperature="<100 °C", duration=">=1 h").tolist() == []
+    assert index.protocols(material="water").tolist() == [2]
+    assert index.steps(speed=(5000, None)).tolist() == [False, False, True, False]
+
+
+def test_index_records_table_coverage(tmp_path):
+    pytest.importorskip("pyarrow")
+    from backend.store import EmbeddingStore
+    from backend.table import covered_protocols, update_step_table
+
+    path = str(tmp_path)
+    store = EmbeddingStore.create(path, 4)
+    for i in range(3):
+        store.append(f"doi/{i}", np.ones((1, 4)), [{"step_type": "heating", "parameter": {"temperature": f"{i}0 °C"}}])
+        store.flush()
+        if i < 2:
+            update_step_table(store)
+    # The last protocol was stored after the table was updated
+    assert covered_protocols(path) == 2
+    index = ParameterIndex.load(path)
+    assert index.n_protocols == 2 and len(store) == 3
+    assert index.protocols(temperature=">=0 °C").tolist() == [0, 1]
@@ -0,0 +1,37 @@
+from backend.prefilter import chunk_text, select_procedural_text, split_paragraphs
+
+INTRO = "Metal-organic frameworks are a broad family of porous materials with many possible uses."
+PROCEDURE = "Add 2.0 g of zinc nitrate to 50 mL of DMF, stir for 30 min and heat at 120 °C for 24 h."
+OUTRO = "We thank the funding agencies and our colleagues for many helpful discussions."
+
+
+def test_short_texts_are_sent_whole():
+    text = f"{INTRO}\n\n{OUTRO}"
+    assert select_procedural_text(text) == text
+
+
+def test_keeps_procedural_paragraphs_and_their_neighbours():
+    paragraphs = [INTRO] * 40 + ["The details are given below.", PROCEDURE,
+                                 "The results are discussed next."] + [OUTRO] * 40
+    selected = select_procedural_text("\n\n".join(paragraphs), context=1)
+    assert selected.split("\n\n") == paragraphs[40:43]
+    assert split_paragraphs(selected, 10 ** 6) == paragraphs[40:43]
+    # Without any procedural paragraph the text is left alone
+    no_procedure = "\n\n".join([INTRO] * 60)
+    assert select_procedural_text(no_procedure) == no_procedure
+
+
+def test_chunks_break_on_paragraph_boundaries():
+    paragraphs = [f"Paragraph {i}. " + "word " * 30 for i in range(20)]
+    text = "\n\n".join(p.strip() for p in paragraphs)
+    chunks = chunk_text(text, max_chars=500)
+    assert len(chunks) > 1 and all(len(chunk) <= 500 for chunk in chunks)
+    assert "\n\n".join(chunks) == text
+    assert chunk_text("short", max_chars=500) == ["short"]
+
+
+def test_long_paragraphs_split_at_sentences():
+    block = " ".join(f"Sentence {i} adds 5 mL of water." for i in range(100))
+    pieces = split_paragraphs(block, max_chars=200)
+    assert all(len(piece) <= 200 for piece in pieces)
+    assert " ".join(pieces) == block
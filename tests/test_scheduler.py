@@ -0,0 +1,82 @@
+import threading
+import numpy as np
+import pytest
+from backend import vectorized
+from backend.scheduler import EmbeddingScheduler
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """Replaces the encoder call; each row's first value is the length of its text."""
+    calls = []
+
+    def fake_encode_steps(texts, *args, **kwargs):
+        calls.append(list(texts))
+        if "fail" in texts:
+            raise ValueError("encoder failed")
+        if "exit" in texts:
+            raise SystemExit
+        return np.array([[len(text), 0.0] for text in texts], dtype=np.float32).reshape(len(texts), 2)
+
+    monkeypatch.setattr(vectorized, "encode_steps", fake_encode_steps)
+    return calls
+
+
+def test_concurrent_requests_share_a_batch(batches):
+    scheduler = EmbeddingScheduler(max_steps=100, max_delay=0.5)
+    requests = [["a"], ["bb", "ccc"], ["dddd"]]
+    futures = [scheduler.submit(texts) for texts in requests]
+    scheduler.close()
+    assert batches == [["a", "bb", "ccc", "dddd"]]
+    for texts, future in zip(requests, futures):
+        assert future.result()[:, 0].tolist() == [len(text) for text in texts]
+    assert scheduler.stats()["batches"] == 1 and scheduler.stats()["mean_batch_steps"] == 4
+
+
+def test_batch_is_flushed_at_max_steps(batches):
+    scheduler = EmbeddingScheduler(max_steps=4, max_delay=5.0)
+    futures = [scheduler.submit(["x", "y"]) for _ in range(3)]
+    scheduler.close()
+    assert [len(batch) for batch in batches] == [4, 2]
+    assert all(future.result().shape == (2, 2) for future in futures)
+
+
+def test_encoder_error_fails_its_batch_only(batches):
+    scheduler = EmbeddingScheduler(max_delay=0.0)
+    with pytest.raises(ValueError, match="encoder failed"):
+        scheduler.embed(["fail"], timeout=5)
+    assert scheduler.embed(["ok"], timeout=5)[0, 0] == 2
+    scheduler.close()
+
+
+def test_closed_scheduler_rejects_requests(batches):
+    scheduler = EmbeddingScheduler(max_delay=0.0)
+    scheduler.embed(["a"], timeout=5)
+    scheduler.close()
+    with pytest.raises(RuntimeError):
+        scheduler.submit(["b"])
+
+
+def test_stopped_worker_fails_pending_requests(batches, monkeypatch):
+    gate = threading.Event()
+    fake_encode_steps = vectorized.encode_steps
+
+    def blocking_encode_steps(texts, *args, **kwargs):
+        gate.wait(5)
+        return fake_encode_steps(texts)
+
+    monkeypatch.setattr(vectorized, "encode_steps", blocking_encode_steps)
+    monkeypatch.setattr(threading, "excepthook", lambda args: None)
+    scheduler = EmbeddingScheduler(max_steps=1)
+    # SystemExit is not an Exception, so it ends the worker while "later" is still queued
+    stopping = scheduler.submit(["exit"])
+    waiting = scheduler.submit(["later"])
+    worker = scheduler._thread
+    gate.set()
+    for future in (stopping, waiting):
+        with pytest.raises(RuntimeError, match="stopped"):
+            future.result(timeout=5)
+    worker.join(5)
+    # The next request starts a new worker
+    assert scheduler.embed(["again"], timeout=5)[0, 0] == 5
+    scheduler.close()
@@ -0,0 +1,150 @@
+import zlib
+import numpy as np
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+from fastapi.testclient import TestClient
+from backend import service, vectorized
+from backend.ann import build_index, save_index
+from backend.store import EmbeddingStore
+from backend.vectorized import encoder_name, extract_and_format_steps
+
+DIM = 32
+
+
+class FakeEncoder:
+    dimension = DIM
+
+
+def fake_encode_steps(texts, *args, **kwargs):
+    # A fixed random unit vector per step string, so equal steps score 1
+    vectors = np.array([np.random.default_rng(zlib.crc32(text.encode())).normal(size=DIM) for text in texts],
+                       dtype=np.float32).reshape(len(texts), DIM)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def protocol(*actions):
+    return [{"step_type": "step", "action": action} for action in actions]
+
+
+PROTOCOLS = [
+    protocol("dissolve citric acid in water", "heat at 180 C for 4 h"),
+    protocol("mix urea with ethanol", "stir overnight", "centrifuge the solution"),
+    protocol("extract dna from cells", "wash pellet twice"),
+    protocol("anneal primers", "run pcr for thirty cycles"),
+]
+
+
+@pytest.fixture
+def store_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorized, "encode_steps", fake_encode_steps)
+    monkeypatch.setattr(service, "get_encoder", lambda: FakeEncoder())
+    path = str(tmp_path / "store")
+    store = EmbeddingStore.create(path, DIM, encoder_name())
+    for i, protocol in enumerate(PROTOCOLS):
+        store.append(f"doi/{i}", fake_encode_steps(extract_and_format_steps(protocol)), protocol)
+    store.flush()
+    return path
+
+
+def test_endpoints(store_path):
+    with TestClient(service.create_app(store_path)) as client:
+        health = client.get("/health").json()
+        assert health["store_protocols"] == len(PROTOCOLS) and not health["index"]
+
+        embeddings = client.post("/embed", json={"protocols": PROTOCOLS[:2]}).json()["embeddings"]
+        assert [len(vectors) for vectors in embeddings] == [2, 3]
+
+        result = client.post("/compare", json={"protocol_a": PROTOCOLS[0], "protocol_b": PROTOCOLS[0],
+                                               "mode": "ordered", "return_alignment": True}).json()
+        assert result["score"] == pytest.approx(1.0, abs=1e-5)
+        assert result["alignment"]
+
+        results = client.post("/search", json={"protocol": PROTOCOLS[2], "top_k": 2,
+                                               "include_protocols": True}).json()["results"]
+        assert results[0]["doi"] == "doi/2" and results[0]["protocol"] == PROTOCOLS[2]
+        assert len(results) == 2
+
+        assert client.post("/compare", json={"protocol_a": PROTOCOLS[0], "protocol_b": PROTOCOLS[1],
+                                             "mode": "nope"}).status_code == 422
+        assert client.post("/compare", json={"protocol_a": [], "protocol_b": PROTOCOLS[1]}).status_code == 422
+
+        metrics = client.get("/metrics").json()
+        assert metrics["endpoints"]["/compare"]["requests"] == 3
+        assert metrics["embedding_batches"]["steps"] > 0
+
+
+def test_search_uses_a_current_index_only(store_path):
+    store = EmbeddingStore.open(store_path)
+    save_index(build_index(store, n_lists=2), store_path + "/ann")
+    with TestClient(service.create_app(store_path)) as client:
+        assert client.get("/health").json()["index"]
+        for use_index in (True, False):
+            results = client.post("/search", json={"protocol": PROTOCOLS[3], "top_k": 1,
+                                                   "use_index": use_index}).json()["results"]
+            assert results[0]["doi"] == "doi/3"
+
+    writer = EmbeddingStore.open(store_path, writable=True)
+    new = protocol("sonicate the flask")
+    writer.append("doi/new", fake_encode_steps(extract_and_format_steps(new)), new)
+    writer.flush()
+    # The index predates the new protocol, so the service searches exactly instead
+    with TestClient(service.create_app(store_path)) as client:
+        assert not client.get("/health").json()["index"]
+        results = client.post("/search", json={"protocol": new, "top_k": 1}).json()["results"]
+        assert results[0]["doi"] == "doi/new"
+
+
+def test_without_a_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorized, "encode_steps", fake_encode_steps)
+    monkeypatch.setattr(service, "get_encoder", lambda: FakeEncoder())
+    with TestClient(service.create_app(str(tmp_path / "missing"))) as client:
+        assert client.get("/health").json()["store_protocols"] == 0
+        assert client.post("/search", json={"protocol": PROTOCOLS[0]}).status_code == 503
+
+
+def test_search_filters_by_parameters(store_path):
+    pytest.importorskip("pyarrow")
+    from backend.table import update_step_table
+
+    writer = EmbeddingStore.open(store_path, writable=True)
+    heated = [{"step_type": "heating", "action": "heat the vial", "parameter": {"temperature": "180 °C"}}]
+    writer.append("doi/heated", fake_encode_steps(extract_and_format_steps(heated)), heated)
+    writer.flush()
+    update_step_table(writer)
+    where = {"temperature": ">=150 °C"}
+    with TestClient(service.create_app(store_path)) as client:
+        results = client.post("/search", json={"protocol": PROTOCOLS[0], "where": where}).json()["results"]
+        assert [result["doi"] for result in results] == ["doi/heated"]
+        assert client.post("/search", json={"protocol": PROTOCOLS[0],
+                                            "where": {"temperature": "hot"}}).status_code == 422
+
+    # Protocols stored since the table was updated would be dropped by a filter, so filtering is refused
+    writer.append("doi/late", fake_encode_steps(extract_and_format_steps(heated)), heated)
+    writer.flush()
+    with TestClient(service.create_app(store_path)) as client:
+        assert client.post("/search", json={"protocol": PROTOCOLS[0], "where": where}).status_code == 503
+        assert client.post("/search", json={"protocol": PROTOCOLS[0]}).status_code == 200
+
+
+def test_hybrid_search(store_path):
+    from backend.lexical import update_lexical_index
+
+    update_lexical_index(EmbeddingStore.open(store_path))
+    with TestClient(service.create_app(store_path)) as client:
+        assert client.get("/health").json()["lexical_index"]
+        for fusion in ("rrf", "weighted"):
+            results = client.post("/search", json={"protocol": PROTOCOLS[1], "hybrid": True,
+                                                   "fusion": fusion}).json()["results"]
+            assert results[0]["doi"] == "doi/1"
+        assert client.post("/search", json={"protocol": PROTOCOLS[1], "hybrid": True,
+                                            "fusion": "max"}).status_code == 422
+
+    writer = EmbeddingStore.open(store_path, writable=True)
+    new = protocol("sonicate the flask")
+    writer.append("doi/new", fake_encode_steps(extract_and_format_steps(new)), new)
+    writer.flush()
+    # An index missing protocols is not used
+    with TestClient(service.create_app(store_path)) as client:
+        assert client.post("/search", json={"protocol": new, "hybrid": True}).status_code == 503
@@ -0,0 +1,61 @@
+import json
+import pytest
+from backend.step_stream import StepStreamParser, parse_steps, repair_step, steps_from_raw
+
+STEPS = [
+    {"step_number": 1, "action": "Mix", "input": "citric acid {anhydrous}", "parameter": {"mass": "2 g"}},
+    {"step_number": 2, "action": "Heat \"gently\" \\ stir", "output": "solution [clear]", "parameter": {}},
+    {"step_number": 3, "action": "Centrifuge", "parameter": {"speed": "10,000 rpm", "nested": {"a": [1, 2]}}},
+]
+ANSWER = "Here are the steps:\n```json\n" + json.dumps(STEPS, indent=2) + "\n```\nDone."
+
+
+def feed_in_chunks(parser, text, size):
+    raw = []
+    for start in range(0, len(text), size):
+        raw.extend(parser.feed(text[start:start + size]))
+    return raw
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, len(ANSWER)])
+def test_steps_arrive_whole_at_any_chunking(size):
+    parser = StepStreamParser()
+    raw = feed_in_chunks(parser, ANSWER, size)
+    assert [json.loads(step) for step in raw] == STEPS
+    assert parser.done and parser.close() is None
+
+
+def test_each_step_is_returned_when_it_closes():
+    text = json.dumps(STEPS)
+    first_end = text.index("}}") + 2
+    parser = StepStreamParser()
+    assert [json.loads(s) for s in parser.feed(text[:first_end])] == STEPS[:1]
+    assert parser.feed(text[first_end:first_end + 5]) == []
+
+
+def test_truncated_answer_leaves_a_tail():
+    text = json.dumps(STEPS)
+    cut = text.index('"Centrifuge"')
+    raw, tail = parse_steps(text[:cut])
+    assert [json.loads(s) for s in raw] == STEPS[:2]
+    assert tail.startswith("{") and "step_number" in tail
+
+
+def test_single_object_and_no_json():
+    parser = StepStreamParser()
+    assert parser.feed("prose ") == [] and not parser.started
+    assert [json.loads(s) for s in parser.feed(json.dumps(STEPS[0]))] == [STEPS[0]]
+    with pytest.raises(ValueError):
+        parse_steps("no json here")
+
+
+def test_steps_from_raw_and_repair():
+    assert steps_from_raw(json.dumps({"steps": STEPS})) == STEPS
+    assert steps_from_raw(json.dumps(STEPS[0])) == [STEPS[0]]
+    with pytest.raises(ValueError):
+        steps_from_raw("[1, 2]")
+    repaired = repair_step({"action": ["mix", "stir"], "input": None, "parameter": 5}, 4)
+    assert repaired["step_number"] == 4
+    assert repaired["action"] == "mix, stir" and repaired["input"] == ""
+    assert repaired["parameter"] == {"value": 5}
+    assert repair_step(STEPS[2], 3)["parameter"]["nested"] == json.dumps({"a": [1, 2]})
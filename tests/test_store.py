@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import pytest
+from backend.store import PROTOCOLS_FILE, VECTORS_FILE, EmbeddingStore
+
+
+def random_protocols(rng, n=5, dim=8):
+    return [rng.normal(size=(int(rng.integers(1, 6)), dim)).astype(np.float32) for _ in range(n)]
+
+
+def test_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    protocols = random_protocols(rng)
+    store = EmbeddingStore.create(str(tmp_path), 8, "test-model")
+    for i, vectors in enumerate(protocols):
+        store.append(f"doi/{i}", vectors, [{"action": f"step of {i}"}])
+    store.flush()
+
+    reopened = EmbeddingStore.open(str(tmp_path))
+    assert len(reopened) == len(protocols)
+    assert reopened.model_name == "test-model"
+    assert reopened.n_rows == sum(len(p) for p in protocols)
+    for i, vectors in enumerate(protocols):
+        expected = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.testing.assert_allclose(reopened.vectors(i), expected, rtol=1e-6)
+        assert reopened.doi(i) == f"doi/{i}"
+        assert reopened.protocol(i) == [{"action": f"step of {i}"}]
+    assert reopened.find("doi/2") == [2]
+    assert list(reopened.iter_protocols(3)) == [[{"action": "step of 3"}], [{"action": "step of 4"}]]
+
+
+def test_reader_is_read_only(tmp_path):
+    EmbeddingStore.create(str(tmp_path), 4)
+    store = EmbeddingStore.open(str(tmp_path))
+    with pytest.raises(ValueError):
+        store.append("doi", np.ones((1, 4)))
+
+
+def test_append_checks_shape(tmp_path):
+    store = EmbeddingStore.create(str(tmp_path), 4)
+    with pytest.raises(ValueError, match="shape"):
+        store.append("doi", np.ones(4))
+    with pytest.raises(ValueError, match="shape"):
+        store.append("doi", np.ones((2, 3)))
+
+
+def test_crash_recovery(tmp_path):
+    path = str(tmp_path)
+    rng = np.random.default_rng(1)
+    writer = EmbeddingStore.create(path, 8)
+    writer.append("flushed", rng.normal(size=(3, 8)), [{"action": "kept"}])
+    writer.flush()
+    # Appended but never flushed, as if the writer crashed here
+    writer.append("lost", rng.normal(size=(4, 8)), [{"action": "lost"}])
+    vectors_size = os.path.getsize(os.path.join(path, VECTORS_FILE))
+
+    reader = EmbeddingStore.open(path)
+    assert len(reader) == 1 and reader.matrix.shape == (3, 8)
+    # Readers never touch the writer's files
+    assert os.path.getsize(os.path.join(path, VECTORS_FILE)) == vectors_size
+
+    writer = EmbeddingStore.open(path, writable=True)
+    assert os.path.getsize(os.path.join(path, VECTORS_FILE)) == 3 * 8 * 4
+    writer.append("next", rng.normal(size=(2, 8)), [{"action": "next"}])
+    writer.flush()
+
+    store = EmbeddingStore.open(path)
+    assert [store.doi(i) for i in range(len(store))] == ["flushed", "next"]
+    assert store.n_rows == 5
+    assert store.protocol(1) == [{"action": "next"}]
+    with open(os.path.join(path, PROTOCOLS_FILE), "rb") as f:
+        assert b"lost" not in f.read()
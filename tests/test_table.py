@@ -0,0 +1,67 @@
+import os
+import shutil
+import numpy as np
+import pytest
+
+pytest.importorskip("pyarrow")
+from backend.store import EmbeddingStore
+from backend.table import (STEPS_DIR, filter_steps, load_step_table, parameter_values, protocol_frames,
+                           update_step_table, value_counts)
+
+
+def step(step_type, action, **parameter):
+    return {"step_number": 1, "step_type": step_type, "action": action, "input": "a", "output": "b",
+            "parameter": parameter}
+
+
+PROTOCOLS = [
+    [step("mixing", "stir", temperature="25 C"), step("heating", "heat", temperature="180 C")],
+    [step("heating", "reflux", time="2 h")],
+    [step("centrifugation", "spin"), step("heating", "dry"), step("mixing", "shake")],
+]
+
+
+def append(store, protocols, start):
+    rng = np.random.default_rng(start)
+    for i, protocol in enumerate(protocols, start):
+        store.append(f"doi/{i}", rng.normal(size=(len(protocol), 4)), protocol)
+    store.flush()
+
+
+def test_step_table_follows_the_store(tmp_path):
+    path = str(tmp_path)
+    store = EmbeddingStore.create(path, 4)
+    append(store, PROTOCOLS[:2], 0)
+    assert update_step_table(store) == 3
+    assert update_step_table(store) == 0
+    append(store, PROTOCOLS[2:], 2)
+    assert update_step_table(store) == 3
+
+    table = load_step_table(path)
+    assert table.num_rows == 6
+    # row_id joins each step to its vector in the store
+    assert table["row_id"].to_pylist() == list(range(store.n_rows))
+    assert table["doi"].to_pylist() == ["doi/0", "doi/0", "doi/1", "doi/2", "doi/2", "doi/2"]
+
+    heating = filter_steps(table, step_type="heating")
+    assert heating["action"].to_pylist() == ["heat", "reflux", "dry"]
+    assert filter_steps(table, step_type=["mixing", "centrifugation"], protocol=2).num_rows == 2
+    assert value_counts(table, "step_type")[0] == ("heating", 3)
+    assert parameter_values(table, "temperature").to_pylist()[:3] == ["25 C", "180 C", None]
+
+    frames = protocol_frames(table, [2, 0])
+    assert [len(frame) for frame in frames] == [3, 2]
+    assert frames[1]["Parameters"][0] == {"temperature": "25 C"}
+
+
+def test_step_table_drops_parts_past_the_store(tmp_path):
+    store = EmbeddingStore.create(str(tmp_path / "full"), 4)
+    append(store, PROTOCOLS, 0)
+    update_step_table(store)
+    # A store holding only the first protocol (as after a rollback) with the longer store's table
+    path = str(tmp_path / "short")
+    store = EmbeddingStore.create(path, 4)
+    append(store, PROTOCOLS[:1], 0)
+    shutil.copytree(str(tmp_path / "full" / STEPS_DIR), os.path.join(path, STEPS_DIR))
+    assert update_step_table(store) == 2
+    assert load_step_table(path)["protocol"].to_pylist() == [0, 0]
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import threading
+from backend import tracing
+
+
+@tracing.traced("double", attributes=("x",))
+def double(x):
+    with tracing.span("inner", note="a"):
+        return 2 * x
+
+
+@tracing.traced("count")
+async def count(n):
+    for i in range(n):
+        yield i
+
+
+async def collect(iterable):
+    return [item async for item in iterable]
+
+
+def test_recording_collects_nested_spans():
+    with tracing.record("run", user="test") as recording:
+        assert double(3) == 6
+        assert asyncio.run(collect(count(4))) == [0, 1, 2, 3]
+    rows = [(depth, span["name"]) for depth, span in tracing.span_tree(recording.spans)]
+    assert rows == [(0, "run"), (1, "double"), (2, "inner"), (1, "count")]
+    spans = {span["name"]: span for span in recording.spans}
+    assert spans["double"]["attributes"] == {"x": 3}
+    assert spans["count"]["attributes"] == {"items": 4}
+    assert spans["double"]["parent_id"] == spans["run"]["span_id"]
+    totals = {row["stage"]: row for row in tracing.stage_totals(recording.spans)}
+    assert totals["inner"]["calls"] == 1
+
+
+def test_tracing_is_scoped_to_the_recording():
+    assert not tracing.enabled() and tracing.current_span() is tracing.NOOP_SPAN
+    other_thread = []
+    with tracing.record("run") as recording:
+        parent = tracing.current_span()
+        # A thread that is not handed the span (e.g. another session) is not traced...
+        thread = threading.Thread(target=lambda: other_thread.append((tracing.enabled(), double(1))))
+        thread.start()
+        thread.join()
+
+        # ...one that is, as the embedding scheduler does, is
+        def attached():
+            with tracing.use_span(parent):
+                double(2)
+        thread = threading.Thread(target=attached)
+        thread.start()
+        thread.join()
+    assert other_thread == [(False, 2)]
+    assert [span["attributes"].get("x") for span in recording.spans if span["name"] == "double"] == [2]
+    assert not tracing.enabled()
+
+
+def test_jsonl_exporter(tmp_path):
+    path = str(tmp_path / "traces.jsonl")
+    tracing.configure(jsonl_path=path)
+    try:
+        assert tracing.enabled()
+        double(5)
+    finally:
+        tracing.configure()
+    with open(path, encoding="utf-8") as f:
+        names = [json.loads(line)["name"] for line in f]
+    assert names == ["inner", "double"]
+    assert not tracing.enabled()